@@ -10,18 +10,33 @@ Phase 3: Multi-Level Validation
 Phase 4: Documentation & Figures
 Phase 5: Final Publication Materials
 
+Phases run as a DAG: a phase starts as soon as its prerequisites are done
+and its resource hint (cores, memory) fits, so independent phases (e.g. 3A
+and 3B) run side by side. The critical path is estimated from the last
+measured runtimes (or estimated_time) and ready phases on it start first.
+
+Flags:
+    --auto-yes / -y       Non-interactive
+    --workers N           Maximum phases running at once (default 4)
+    --max-memory-gb X     Memory budget for scheduling (default: physical RAM)
+    --resume              Skip phases completed in the previous run
+    --no-cache            Disable the stage cache
+
 Author: Automated Pipeline
 Date: 2025-11-02
 """
 
 import os
+import re
 import sys
 import subprocess
 import json
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 # =============================================================================
 # Configuration
@@ -35,6 +50,25 @@ LOG_DIR.mkdir(parents=True, exist_ok=True)
 TIMESTAMP = datetime.now().strftime("%Y%m%d_%H%M%S")
 LOG_FILE = LOG_DIR / f"master_execution_{TIMESTAMP}.log"
 
+# Content-addressed stage cache (disable with --no-cache)
+sys.path.insert(0, str(BASE_DIR / "scripts" / "data_pipeline"))
+from stage_cache import StageCache
+from phase_profiler import run_profiled, write_timeline
+
+EXPRESSION_FILE = "outputs/tcga_full_cohort_real/expression_matrix_full_real.csv"
+EXPRESSION_STORE = "outputs/tcga_full_cohort_real/expression_matrix_full_real.store"
+TIMER_FILE = "outputs/timer2_results/timer2_immune_scores.csv"
+GENE_INDEX_FILE = "outputs/reference/gene_index.npz"
+
+# DAG scheduling: completed phases + last runtimes (used by --resume and critical path)
+STATE_FILE = LOG_DIR / "pipeline_state.json"
+DEFAULT_RESOURCES = {"cores": 1, "memory_gb": 2}
+DEFAULT_MAX_WORKERS = 4
+
+# Per-phase resource profiles of this run (phase ID -> profile), for the timeline report
+PHASE_PROFILES = {}
+_PROFILE_LOCK = threading.Lock()
+
 # =============================================================================
 # Phase Definitions (Optimized Sequence)
 # =============================================================================
@@ -48,7 +82,8 @@ PHASES = [
         "description": "Query GDC and setup download manifest",
         "critical": True,
         "estimated_time": "5 min",
-        "prerequisites": []
+        "prerequisites": [],
+        "resources": {"cores": 1, "memory_gb": 2}
     },
     {
         "phase": "1B",
@@ -72,7 +107,10 @@ PHASES = [
         "description": "Normalize, QC, combine all projects",
         "critical": True,
         "estimated_time": "30-60 min",
-        "prerequisites": ["1A"]  # Changed from 1B to 1A (data already downloaded)
+        "prerequisites": ["1A"],  # Changed from 1B to 1A (data already downloaded)
+        "resources": {"cores": 8, "memory_gb": 16},
+        "inputs": ["data/tcga_raw", GENE_INDEX_FILE],
+        "outputs": [EXPRESSION_FILE, EXPRESSION_STORE]
     },
     {
         "phase": "1D",
@@ -81,7 +119,10 @@ PHASES = [
         "description": "Extract OS, stage, demographics",
         "critical": True,
         "estimated_time": "10 min",
-        "prerequisites": ["1A"]  # Changed from 1B to 1A (data already downloaded)
+        "prerequisites": ["1A"],  # Changed from 1B to 1A (data already downloaded)
+        "resources": {"cores": 1, "memory_gb": 4},
+        "inputs": ["data/tcga_raw"],
+        "outputs": ["outputs/tcga_full_cohort_real/clinical_data_full_real.csv"]
     },
 
     # Phase 2: Core Analysis (Fixed Methods)
@@ -92,7 +133,8 @@ PHASES = [
         "description": "Stratified Cox + Fixed Partial Correlation + CPTAC",
         "critical": True,
         "estimated_time": "5 min",
-        "prerequisites": ["1C", "1D"]
+        "prerequisites": ["1C", "1D"],
+        "resources": {"cores": 4, "memory_gb": 8}
     },
     {
         "phase": "2B",
@@ -101,7 +143,10 @@ PHASES = [
         "description": "Calculate 6 immune cell type fractions",
         "critical": True,
         "estimated_time": "15 min",
-        "prerequisites": ["1C"]
+        "prerequisites": ["1C"],
+        "resources": {"cores": 1, "memory_gb": 16},
+        "inputs": [EXPRESSION_FILE],
+        "outputs": ["outputs/timer2_results"]
     },
     {
         "phase": "2C",
@@ -110,7 +155,11 @@ PHASES = [
         "description": "Use real immune scores instead of fallback",
         "critical": True,
         "estimated_time": "3 min",
-        "prerequisites": ["2A", "2B"]
+        "prerequisites": ["2A", "2B"],
+        "resources": {"cores": 1, "memory_gb": 8},
+        "inputs": [EXPRESSION_FILE, TIMER_FILE,
+                   "outputs/partial_correlation_v2_fixed/partial_correlation_results.csv"],
+        "outputs": ["outputs/partial_correlation_v3_timer2"]
     },
 
     # Phase 3: Multi-Level Validation
@@ -121,7 +170,8 @@ PHASES = [
         "description": "Validate correlations in tumor vs immune cells",
         "critical": False,
         "estimated_time": "20 min",
-        "prerequisites": ["2A"]
+        "prerequisites": ["2A"],
+        "resources": {"cores": 2, "memory_gb": 8}
     },
     {
         "phase": "3B",
@@ -130,7 +180,8 @@ PHASES = [
         "description": "Validate in 3+ independent cohorts",
         "critical": False,
         "estimated_time": "30 min",
-        "prerequisites": ["2A"]
+        "prerequisites": ["2A"],
+        "resources": {"cores": 1, "memory_gb": 4}
     },
     {
         "phase": "3C",
@@ -139,7 +190,10 @@ PHASES = [
         "description": "Per-cancer, outlier exclusion, bootstrap",
         "critical": False,
         "estimated_time": "10 min",
-        "prerequisites": ["2C"]
+        "prerequisites": ["2C"],
+        "resources": {"cores": 2, "memory_gb": 4},
+        "inputs": [EXPRESSION_FILE, EXPRESSION_STORE],
+        "outputs": ["outputs/sensitivity_analysis"]
     },
 
     # Phase 4: Visualization & Documentation
@@ -150,7 +204,8 @@ PHASES = [
         "description": "All main + supplementary figures",
         "critical": True,
         "estimated_time": "15 min",
-        "prerequisites": ["2C", "3A", "3B", "3C"]
+        "prerequisites": ["2C", "3A", "3B", "3C"],
+        "resources": {"cores": 1, "memory_gb": 4}
     },
     {
         "phase": "4B",
@@ -196,20 +251,79 @@ PHASES = [
 # Logging
 # =============================================================================
 
+_LOG_LOCK = threading.Lock()
+
 def log(message: str, level: str = "INFO"):
     """Write log message"""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_msg = f"[{timestamp}] [{level}] {message}"
 
-    print(log_msg)
+    with _LOG_LOCK:
+        print(log_msg)
+
+        with open(LOG_FILE, 'a', encoding='utf-8') as f:
+            f.write(log_msg + "\n")
+
+# =============================================================================
+# Stage Cache
+# =============================================================================
+
+_STAGE_CACHE = None
+
+def get_stage_cache():
+    """Shared StageCache instance (None when disabled with --no-cache)"""
+    global _STAGE_CACHE
+    if '--no-cache' in sys.argv:
+        return None
+    if _STAGE_CACHE is None:
+        _STAGE_CACHE = StageCache()
+    return _STAGE_CACHE
+
+def phase_cache_key(phase: Dict, cmd: List[str], env: Dict) -> str:
+    """
+    Cache key for a phase: script + declared inputs + command-line parameters
+
+    Args:
+        phase: Phase definition (must declare "outputs")
+        cmd: Command that would run the phase
+        env: Environment passed to the phase
 
-    with open(LOG_FILE, 'a', encoding='utf-8') as f:
-        f.write(log_msg + "\n")
+    Returns:
+        Stage cache key
+    """
+    params = {
+        'interpreter': Path(cmd[0]).name,
+        'args': cmd[2:],
+        'auto_download': env.get('AUTO_DOWNLOAD', '0')
+    }
+    return get_stage_cache().stage_key(phase["phase"], phase["script"],
+                                       inputs=phase.get("inputs", []), params=params)
 
 # =============================================================================
 # Phase Execution
 # =============================================================================
 
+def record_profile(phase: Dict, status: str, start: float, profile: Optional[Dict] = None):
+    """Store a phase profile for the timeline report"""
+    profile = dict(profile or {})
+    profile.setdefault('start', start)
+    profile.setdefault('end', time.time())
+    profile.setdefault('wall_s', profile['end'] - profile['start'])
+    profile.update({'phase': phase["phase"], 'name': phase["name"], 'status': status})
+    with _PROFILE_LOCK:
+        PHASE_PROFILES[phase["phase"]] = profile
+
+def log_profile(phase_id: str, profile: Dict):
+    """One-line resource summary of a phase"""
+    if profile.get('cpu_s') is None:
+        return
+    peak = profile.get('peak_rss_mb') or 0.0
+    log(f"Phase {phase_id} resources: CPU {profile['cpu_s']:.1f}s "
+        f"({profile.get('cpu_utilization', 0):.2f} cores busy, {profile.get('bound', '-')}), "
+        f"peak RSS {peak:.0f} MB, read {profile.get('io_read_mb', 0):.0f} MB, "
+        f"written {profile.get('io_write_mb', 0):.0f} MB, "
+        f"max children {profile.get('max_children', 0)}", "PROFILE")
+
 def check_prerequisites(phase: Dict, completed: List[str]) -> bool:
     """
     Check if all prerequisites are met
@@ -309,11 +423,19 @@ def execute_phase(phase: Dict) -> Tuple[bool, float]:
             env['AUTO_DOWNLOAD'] = '1'
         env['PYTHONIOENCODING'] = 'utf-8'
 
-        # Run
-        result = subprocess.run(
+        # Skip unchanged phases: restore outputs from the stage cache
+        cache_key = None
+        if phase.get("outputs") and get_stage_cache() is not None:
+            cache_key = phase_cache_key(phase, cmd, env)
+            if get_stage_cache().restore(cache_key):
+                runtime = time.time() - start_time
+                log(f"Phase {phase_id} unchanged - restored from cache ({runtime:.2f}s)", "CACHE")
+                record_profile(phase, 'cached', start_time)
+                return True, runtime
+
+        # Run (sampled for CPU, memory, I/O and child processes)
+        returncode, stdout, stderr, profile = run_profiled(
             cmd,
-            capture_output=True,
-            text=True,
             cwd=BASE_DIR,
             env=env,
             timeout=7200  # 2 hour timeout
@@ -322,34 +444,275 @@ def execute_phase(phase: Dict) -> Tuple[bool, float]:
         runtime = time.time() - start_time
 
         # Log output
-        if result.stdout:
+        if stdout:
             log("STDOUT:", "DEBUG")
-            for line in result.stdout.split('\n')[:50]:  # First 50 lines
+            for line in stdout.split('\n')[:50]:  # First 50 lines
                 log(f"  {line}", "DEBUG")
 
-        if result.stderr:
+        if stderr:
             log("STDERR:", "DEBUG")
-            for line in result.stderr.split('\n')[:50]:
+            for line in stderr.split('\n')[:50]:
                 log(f"  {line}", "DEBUG")
 
+        log_profile(phase_id, profile)
+
         # Check success
-        if result.returncode == 0:
+        if returncode == 0:
             log(f"Phase {phase_id} completed successfully ({runtime:.1f}s)", "OK")
+            record_profile(phase, 'ok', start_time, profile)
+            if cache_key is not None:
+                get_stage_cache().store(cache_key, phase_id, phase["outputs"])
             return True, runtime
         else:
-            log(f"Phase {phase_id} FAILED (exit code {result.returncode})", "FAIL")
+            log(f"Phase {phase_id} FAILED (exit code {returncode})", "FAIL")
+            record_profile(phase, 'failed', start_time, profile)
             return False, runtime
 
     except subprocess.TimeoutExpired:
         runtime = time.time() - start_time
         log(f"Phase {phase_id} TIMEOUT after {runtime:.1f}s", "FAIL")
+        record_profile(phase, 'timeout', start_time)
         return False, runtime
 
     except Exception as e:
         runtime = time.time() - start_time
         log(f"Phase {phase_id} ERROR: {e}", "FAIL")
+        record_profile(phase, 'error', start_time)
         return False, runtime
 
+# =============================================================================
+# DAG Scheduling
+# =============================================================================
+
+def get_arg_value(flag: str, default: Optional[str] = None) -> Optional[str]:
+    """Value following a command-line flag (e.g. --workers 4)"""
+    if flag in sys.argv:
+        idx = sys.argv.index(flag)
+        if idx + 1 < len(sys.argv):
+            return sys.argv[idx + 1]
+    return default
+
+def estimated_minutes(phase: Dict) -> float:
+    """
+    Midpoint of a phase's estimated_time ("5 min", "30-60 min", "2-8 hours")
+
+    Args:
+        phase: Phase definition
+
+    Returns:
+        Estimated minutes (0 if unparseable)
+    """
+    text = phase.get("estimated_time", "")
+    numbers = [float(x) for x in re.findall(r"\d+(?:\.\d+)?", text)]
+    if not numbers:
+        return 0.0
+    minutes = sum(numbers[:2]) / len(numbers[:2])
+    return minutes * 60 if "hour" in text else minutes
+
+def phase_durations(phases: List[Dict], state: Dict) -> Dict[str, float]:
+    """Expected minutes per phase: last measured runtime, else the estimate (manual = 0)"""
+    runtimes = state.get("runtimes", {})
+    durations = {}
+    for p in phases:
+        if p.get("manual", False):
+            durations[p["phase"]] = 0.0
+        elif p["phase"] in runtimes:
+            durations[p["phase"]] = runtimes[p["phase"]] / 60
+        else:
+            durations[p["phase"]] = estimated_minutes(p)
+    return durations
+
+def downstream_lengths(phases: List[Dict], durations: Dict[str, float]) -> Dict[str, float]:
+    """
+    Longest path (minutes) from each phase to the end of the pipeline
+
+    Args:
+        phases: Phase definitions
+        durations: Expected minutes per phase
+
+    Returns:
+        Dictionary phase ID -> own duration + longest dependent chain
+    """
+    dependents = {p["phase"]: [] for p in phases}
+    for p in phases:
+        for prereq in p.get("prerequisites", []):
+            if prereq in dependents:
+                dependents[prereq].append(p["phase"])
+
+    lengths = {}
+    def length(phase_id):
+        if phase_id not in lengths:
+            lengths[phase_id] = durations[phase_id] + max(
+                (length(d) for d in dependents[phase_id]), default=0.0)
+        return lengths[phase_id]
+
+    for p in phases:
+        length(p["phase"])
+    return lengths
+
+def critical_path(phases: List[Dict], durations: Dict[str, float]) -> Tuple[float, List[str]]:
+    """
+    Critical path of the phase DAG
+
+    Args:
+        phases: Phase definitions
+        durations: Expected minutes per phase
+
+    Returns:
+        (total minutes, phase IDs along the path)
+    """
+    by_id = {p["phase"]: p for p in phases}
+    finish, parent = {}, {}
+
+    def finish_time(phase_id):
+        if phase_id not in finish:
+            prereqs = [q for q in by_id[phase_id].get("prerequisites", []) if q in by_id]
+            start = 0.0
+            parent[phase_id] = None
+            for prereq in prereqs:
+                if finish_time(prereq) > start:
+                    start, parent[phase_id] = finish_time(prereq), prereq
+            finish[phase_id] = start + durations[phase_id]
+        return finish[phase_id]
+
+    if not phases:
+        return 0.0, []
+    end = max(by_id, key=finish_time)
+    path = []
+    while end is not None:
+        path.append(end)
+        end = parent[end]
+    return finish[path[0]], path[::-1]
+
+def phase_resources(phase: Dict, total_cores: int, total_memory_gb: float) -> Tuple[int, float]:
+    """Resource hint of a phase, clamped so that every phase can run alone"""
+    resources = {**DEFAULT_RESOURCES, **phase.get("resources", {})}
+    return min(resources["cores"], total_cores), min(resources["memory_gb"], total_memory_gb)
+
+def system_memory_gb() -> float:
+    """Physical memory in GB (16 if it cannot be determined)"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024**3
+    except (AttributeError, ValueError, OSError):
+        return 16.0
+
+def load_state() -> Dict:
+    """Pipeline state from the last run (completed phases, runtimes)"""
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"completed": [], "runtimes": {}}
+
+def save_state(state: Dict):
+    """Persist pipeline state atomically"""
+    tmp = STATE_FILE.with_suffix(".tmp")
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, STATE_FILE)
+
+def run_phase_dag(phases: List[Dict], state: Dict, max_workers: int,
+                  total_cores: int, total_memory_gb: float) -> Dict[str, List[str]]:
+    """
+    Execute phases as a DAG on a worker pool
+
+    A phase starts as soon as all its prerequisites completed and its
+    resource hint fits into the free cores/memory. Ready phases on the
+    longest remaining path start first. Phases whose prerequisites failed
+    are skipped; a failed critical phase stops new launches (running phases
+    finish). Manual phases run in the main thread when nothing else runs.
+
+    Args:
+        phases: Phase definitions
+        state: Pipeline state (state["completed"] = already done, e.g. on resume)
+        max_workers: Maximum phases running at once
+        total_cores: Core budget
+        total_memory_gb: Memory budget
+
+    Returns:
+        Dictionary with completed, failed and skipped phase IDs
+    """
+    priority = downstream_lengths(phases, phase_durations(phases, state))
+    pending = {p["phase"]: p for p in phases if p["phase"] not in state["completed"]}
+    completed = [p["phase"] for p in phases if p["phase"] in state["completed"]]
+    failed, skipped = [], []
+    running = {}
+    free_cores, free_memory = total_cores, total_memory_gb
+    stop = False
+
+    def record(phase, success, runtime):
+        nonlocal stop
+        phase_id = phase["phase"]
+        if success:
+            completed.append(phase_id)
+            state["completed"].append(phase_id)
+            # Only real executions feed the critical-path estimate (not cache hits)
+            if PHASE_PROFILES.get(phase_id, {}).get('status') == 'ok':
+                state["runtimes"][phase_id] = runtime
+            save_state(state)
+        else:
+            failed.append(phase_id)
+            if phase["critical"]:
+                log(f"\nCritical phase {phase_id} FAILED - STOPPING PIPELINE", "CRITICAL")
+                stop = True
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            # Skip phases that can no longer run
+            blocked = [pid for pid, p in pending.items()
+                       if any(q in failed or q in skipped for q in p.get("prerequisites", []))]
+            for pid in blocked:
+                log(f"\nPhase {pid}: Prerequisites not met, SKIPPING", "SKIP")
+                skipped.append(pid)
+                del pending[pid]
+
+            ready = [] if stop else sorted(
+                (p for p in pending.values() if check_prerequisites(p, completed)),
+                key=lambda p: -priority[p["phase"]])
+
+            for phase in ready:
+                phase_id = phase["phase"]
+                if phase.get("manual", False):
+                    if running:
+                        continue
+                    del pending[phase_id]
+                    record(phase, *execute_phase(phase))
+                    break
+
+                cores, memory = phase_resources(phase, total_cores, total_memory_gb)
+                if len(running) >= max_workers or cores > free_cores or memory > free_memory:
+                    continue
+
+                del pending[phase_id]
+                free_cores -= cores
+                free_memory -= memory
+                log(f"[DAG] Starting {phase_id} ({cores} cores, {memory:g} GB) - "
+                    f"{len(running) + 1} running", "DAG")
+                running[pool.submit(execute_phase, phase)] = (phase, cores, memory)
+
+            if not running:
+                if stop or not ready:
+                    break
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                phase, cores, memory = running.pop(future)
+                free_cores += cores
+                free_memory += memory
+                try:
+                    success, runtime = future.result()
+                except Exception as e:
+                    log(f"Phase {phase['phase']} ERROR: {e}", "FAIL")
+                    success, runtime = False, 0.0
+                record(phase, success, runtime)
+
+    for pid in pending:
+        log(f"\nPhase {pid}: Not started, SKIPPING", "SKIP")
+        skipped.append(pid)
+
+    return {"completed": completed, "failed": failed, "skipped": skipped}
+
 # =============================================================================
 # Main Execution
 # =============================================================================
@@ -368,6 +731,7 @@ def main():
     log("="*80)
     log(f"Start time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     log(f"Log file: {LOG_FILE}")
+    log(f"Stage cache: {'disabled (--no-cache)' if get_stage_cache() is None else get_stage_cache().cache_dir}")
 
     # Display phase overview
     log("\n" + "-"*80)
@@ -387,6 +751,25 @@ def main():
 
     log("-"*80)
 
+    resume = '--resume' in sys.argv
+    state = load_state()
+    if not resume:
+        state["completed"] = []
+    state.setdefault("runtimes", {})
+
+    durations = phase_durations(PHASES, state)
+    cp_minutes, cp_phases = critical_path(PHASES, durations)
+    log(f"Critical path: {' -> '.join(cp_phases)} (~{cp_minutes:.0f} min)")
+    log(f"Serial estimate: ~{sum(durations.values()):.0f} min")
+
+    max_workers = max(1, int(get_arg_value('--workers', str(DEFAULT_MAX_WORKERS))))
+    total_cores = os.cpu_count() or 1
+    total_memory_gb = float(get_arg_value('--max-memory-gb', f"{system_memory_gb():.1f}"))
+    log(f"Scheduler: {max_workers} workers, {total_cores} cores, {total_memory_gb:.0f} GB memory")
+
+    if resume and state["completed"]:
+        log(f"[RESUME] Already completed: {', '.join(state['completed'])}")
+
     # Ask for confirmation
     log("\nThis will execute the complete research pipeline.")
     log("Estimated total time: 4-10 hours (mostly data download)")
@@ -402,36 +785,14 @@ def main():
         log("Execution cancelled by user")
         return
 
-    # Execute phases
-    completed_phases = []
-    failed_phases = []
-    skipped_phases = []
-
-    total_runtime = 0.0
+    # Execute phases (DAG order, in parallel where prerequisites allow)
     pipeline_start = time.time()
+    save_state(state)
 
-    for phase in PHASES:
-        phase_id = phase["phase"]
-
-        # Check prerequisites
-        if not check_prerequisites(phase, completed_phases):
-            log(f"\nPhase {phase_id}: Prerequisites not met, SKIPPING", "SKIP")
-            skipped_phases.append(phase_id)
-            continue
-
-        # Execute
-        success, runtime = execute_phase(phase)
-        total_runtime += runtime
-
-        if success:
-            completed_phases.append(phase_id)
-        else:
-            failed_phases.append(phase_id)
-
-            # Stop if critical phase fails
-            if phase["critical"]:
-                log(f"\nCritical phase {phase_id} FAILED - STOPPING PIPELINE", "CRITICAL")
-                break
+    outcome = run_phase_dag(PHASES, state, max_workers, total_cores, total_memory_gb)
+    completed_phases = outcome["completed"]
+    failed_phases = outcome["failed"]
+    skipped_phases = outcome["skipped"]
 
     # Final summary
     pipeline_runtime = time.time() - pipeline_start
@@ -467,6 +828,8 @@ def main():
         "completed": completed_phases,
         "failed": failed_phases,
         "skipped": skipped_phases,
+        "critical_path": cp_phases,
+        "phase_runtimes": {pid: state["runtimes"].get(pid) for pid in completed_phases},
         "success_rate": len(completed_phases) / len(PHASES) * 100
     }
 
@@ -475,6 +838,13 @@ def main():
         json.dump(report, f, indent=2)
 
     log(f"\n[SAVED] Execution report: {report_file}")
+
+    # Resource timeline (JSON + HTML Gantt chart)
+    timeline_json = LOG_DIR / f"timeline_{TIMESTAMP}.json"
+    timeline_html = LOG_DIR / f"timeline_{TIMESTAMP}.html"
+    write_timeline(list(PHASE_PROFILES.values()), timeline_json, timeline_html,
+                   title=f"Master Pipeline Timeline {TIMESTAMP}")
+    log(f"[SAVED] Resource timeline: {timeline_html}")
     log("="*80)
 
     # Success check
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Genome-wide Co-expression Screen
+Correlates anchor genes (CD274, SQSTM1) against every gene in the expression store
+
+For each anchor and each of the ~60k genes:
+- Pearson and Spearman correlation
+- Partial correlation controlling for TIMER2.0 immune confounders
+- Benjamini-Hochberg FDR across the full genome (per anchor and statistic)
+
+The expression store is streamed in gene chunks, so memory depends on the
+chunk size and the cohort, not on the number of genes. Each chunk costs one
+residual projection and one matrix product per statistic
+(see partial_correlation_engine).
+
+Output: one ranked table per run (sorted by partial r within each anchor)
+plus a GSEA-preranked .rnk file per anchor.
+
+Usage:
+    python scripts/analysis/genome_wide_coexpression_screen.py
+    python scripts/analysis/genome_wide_coexpression_screen.py --anchors CD274 --chunk-size 5000
+
+Author: Automated Pipeline
+Date: 2025-11-02
+"""
+
+import sys
+import argparse
+import time
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "data_pipeline"))
+from expression_store import ExpressionStore, is_store, store_path_for
+from gene_index import load_gene_index
+from partial_correlation_engine import PartialCorrelationEngine, benjamini_hochberg
+
+# =============================================================================
+# Configuration
+# =============================================================================
+
+BASE_DIR = Path(__file__).parent.parent.parent
+DATA_DIR = BASE_DIR / "outputs" / "tcga_full_cohort_real"
+TIMER_DIR = BASE_DIR / "outputs" / "timer2_results"
+OUTPUT_DIR = BASE_DIR / "outputs" / "genome_wide_screen"
+
+DEFAULT_ANCHORS = ['CD274', 'SQSTM1']
+
+# Same TIMER2.0 confounders as stage3_v3
+CONFOUNDER_COLS = [
+    'B_cell', 'T_cell.CD4', 'T_cell.CD8', 'Neutrophil', 'Macrophage',
+    'Myeloid.dendritic', 'T_cell_score', 'Myeloid_score', 'Total_immune',
+    'Tumor_purity', 'GEP_score'
+]
+
+STATISTICS = ['pearson', 'spearman', 'partial']
+
+# =============================================================================
+# Step 1: Inputs
+# =============================================================================
+
+def load_timer_confounders(timer_file: Path) -> Optional[pd.DataFrame]:
+    """
+    Load and z-score TIMER2.0 confounders indexed by sample ID
+
+    Args:
+        timer_file: TIMER2.0 immune score CSV
+
+    Returns:
+        Samples x confounders DataFrame, or None if unusable
+    """
+    if not timer_file.exists():
+        print(f"  [ERROR] TIMER2.0 results not found: {timer_file}")
+        print("  Please run: Rscript scripts/analysis/timer2_deconvolution.R")
+        return None
+
+    timer_df = pd.read_csv(timer_file)
+    # TIMER2.0 uses 'ID' for the sample UUID ('sample_id' may be row numbers)
+    if 'ID' in timer_df.columns:
+        timer_df = timer_df.set_index('ID')
+    elif 'sample_id' in timer_df.columns:
+        timer_df = timer_df.set_index('sample_id')
+
+    available = [c for c in CONFOUNDER_COLS
+                 if c in timer_df.columns and not timer_df[c].isna().all()]
+    if not available:
+        print("  [ERROR] No valid TIMER2.0 confounders available!")
+        return None
+
+    confounders = timer_df[available].astype(np.float64)
+    confounders = confounders[~confounders.index.duplicated()]
+    confounders = (confounders - confounders.mean()) / confounders.std()
+
+    print(f"  TIMER2.0: {len(confounders)} samples, {len(available)}/{len(CONFOUNDER_COLS)} confounders")
+    return confounders
+
+def resolve_anchors(store: ExpressionStore, anchors: List[str]) -> Dict[str, str]:
+    """
+    Map anchor names to store column names
+
+    Args:
+        store: Expression store
+        anchors: Gene symbols or Ensembl IDs
+
+    Returns:
+        Dictionary anchor name -> store column (unresolved anchors dropped)
+    """
+    # 02_process_expression collapses store columns to gene symbols, so Ensembl
+    # anchors map to their symbol; symbols still map to Ensembl IDs for stores
+    # keyed by ID
+    gene_index = load_gene_index()
+    missing = [a for a in anchors if a not in store]
+    column_for = gene_index.ensembl_map(a for a in missing if a.startswith('ENSG'))
+    column_for.update(gene_index.symbol_map(a for a in missing if not a.startswith('ENSG')))
+    resolved = {}
+    for anchor in anchors:
+        column = anchor if anchor in store else column_for.get(anchor)
+        if column is not None and column in store:
+            resolved[anchor] = column
+        else:
+            print(f"  [WARN] Anchor {anchor} not found in expression store")
+    return resolved
+
+# =============================================================================
+# Step 2: Chunked Screen
+# =============================================================================
+
+def run_screen(store: ExpressionStore, anchors: Dict[str, str],
+               confounders: Optional[pd.DataFrame], chunk_size: int) -> pd.DataFrame:
+    """
+    Correlate every anchor against every gene, one gene chunk at a time
+
+    Only samples with complete anchor expression and confounders are used.
+    Genes with a missing value in those samples get NaN statistics.
+
+    Args:
+        store: Expression store
+        anchors: Anchor name -> store column
+        confounders: Samples x confounders (None = skip partial correlation)
+        chunk_size: Genes per chunk
+
+    Returns:
+        Long DataFrame: anchor, gene, n_samples, <stat>_r, <stat>_p
+    """
+    sample_ids = store.samples['sample_id'].astype(str)
+    sample_mask = ~sample_ids.duplicated(keep='first').to_numpy()
+    if confounders is not None:
+        complete_ids = confounders.index[confounders.notna().all(axis=1)]
+        sample_mask &= sample_ids.isin(complete_ids).to_numpy()
+
+    anchor_df = store.read(list(anchors.values()), include_meta=False)
+    sample_mask &= anchor_df.notna().all(axis=1).to_numpy()
+    sample_pos = np.flatnonzero(sample_mask)
+
+    anchor_values = anchor_df.to_numpy(dtype=np.float64)[sample_pos]
+    n_samples = len(sample_pos)
+    print(f"  Samples used: {n_samples}")
+
+    engines = {'simple': PartialCorrelationEngine(n_samples=n_samples)}
+    if confounders is not None:
+        engines['partial'] = PartialCorrelationEngine(
+            confounders.loc[sample_ids.iloc[sample_pos]].to_numpy())
+
+    columns = {f'{stat}_{kind}': [] for stat in STATISTICS for kind in ('r', 'p')}
+    gene_blocks = []
+    n_genes = len(store.genes)
+
+    for start in range(0, n_genes, chunk_size):
+        gene_pos = np.arange(start, min(start + chunk_size, n_genes))
+        values = store.read_values(gene_pos, sample_pos).astype(np.float64)
+        complete = ~np.isnan(values).any(axis=0)
+        values[:, ~complete] = 0.0
+
+        results = {
+            'pearson': engines['simple'].correlate(anchor_values, values, method='pearson'),
+            'spearman': engines['simple'].correlate(anchor_values, values, method='spearman'),
+        }
+        if 'partial' in engines:
+            results['partial'] = engines['partial'].correlate(anchor_values, values, method='pearson')
+
+        for stat in STATISTICS:
+            if stat in results:
+                r, p = results[stat]
+                r[:, ~complete] = np.nan
+                p[:, ~complete] = np.nan
+            else:
+                r = p = np.full((len(anchors), len(gene_pos)), np.nan)
+            columns[f'{stat}_r'].append(r)
+            columns[f'{stat}_p'].append(p)
+
+        gene_blocks.append(store.genes[gene_pos])
+        print(f"  Screened {gene_pos[-1] + 1:,}/{n_genes:,} genes", end='\r', flush=True)
+
+    print()
+    genes = np.concatenate(gene_blocks)
+    merged = {name: np.concatenate(blocks, axis=1) for name, blocks in columns.items()}
+
+    tables = []
+    for i, anchor in enumerate(anchors):
+        table = pd.DataFrame({'anchor': anchor, 'gene': genes, 'n_samples': n_samples})
+        for name, values in merged.items():
+            table[name] = values[i]
+        tables.append(table[table['gene'] != anchors[anchor]])
+
+    return pd.concat(tables, ignore_index=True)
+
+def add_fdr_and_rank(results_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add genome-wide BH FDR per anchor/statistic and rank genes within each anchor
+
+    Ranking uses the partial correlation when available, else Pearson.
+
+    Args:
+        results_df: Output of run_screen
+
+    Returns:
+        Ranked DataFrame with <stat>_fdr and rank columns
+    """
+    rank_stat = 'partial_r' if results_df['partial_r'].notna().any() else 'pearson_r'
+
+    ranked = []
+    for _, table in results_df.groupby('anchor', sort=False):
+        table = table.copy()
+        for stat in STATISTICS:
+            table[f'{stat}_fdr'] = benjamini_hochberg(table[f'{stat}_p'].to_numpy())
+        table = table.sort_values(rank_stat, ascending=False, na_position='last')
+        table['rank'] = np.arange(1, len(table) + 1)
+        ranked.append(table)
+
+    return pd.concat(ranked, ignore_index=True)
+
+# =============================================================================
+# Main
+# =============================================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Genome-wide anchor gene co-expression screen")
+    parser.add_argument("--input", default=str(DATA_DIR / "expression_matrix_full_real.csv"),
+                        help="Expression matrix CSV or .store directory")
+    parser.add_argument("--anchors", nargs='+', default=DEFAULT_ANCHORS,
+                        help="Anchor genes (symbols or Ensembl IDs)")
+    parser.add_argument("--timer", default=str(TIMER_DIR / "timer2_immune_scores.csv"),
+                        help="TIMER2.0 immune score CSV")
+    parser.add_argument("--no-partial", action='store_true',
+                        help="Skip the TIMER2.0 partial correlation")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Genes per chunk")
+    parser.add_argument("--fdr", type=float, default=0.05, help="FDR threshold for the summary")
+    parser.add_argument("--out", default=str(OUTPUT_DIR), help="Output directory")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    output_dir = Path(args.out)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    print("="*80)
+    print("GENOME-WIDE CO-EXPRESSION SCREEN")
+    print("="*80)
+
+    store_dir = store_path_for(args.input)
+    if not is_store(store_dir):
+        print(f"  [ERROR] Expression store not found: {store_dir}")
+        print("  Please run: python scripts/data_pipeline/02_process_expression.py")
+        sys.exit(1)
+
+    print("\n[LOAD] Opening expression store...")
+    store = ExpressionStore(store_dir)
+    print(f"  Store: {store.shape[0]} samples x {store.shape[1]} genes")
+
+    anchors = resolve_anchors(store, args.anchors)
+    if not anchors:
+        print("  [ERROR] No anchor genes available")
+        sys.exit(1)
+
+    confounders = None
+    if not args.no_partial:
+        print("\n[LOAD] Loading TIMER2.0 immune scores...")
+        confounders = load_timer_confounders(Path(args.timer))
+        if confounders is None:
+            print("  [WARN] Continuing without partial correlation")
+
+    print(f"\n[SCREEN] {len(anchors)} anchor(s) x {store.shape[1]:,} genes "
+          f"(chunks of {args.chunk_size})...")
+    start_time = time.time()
+    results_df = run_screen(store, anchors, confounders, args.chunk_size)
+    results_df = add_fdr_and_rank(results_df)
+    print(f"  Done in {time.time() - start_time:.1f}s")
+
+    print("\n[SAVE] Writing results...")
+    output_file = output_dir / "genome_wide_screen_results.csv"
+    results_df.to_csv(output_file, index=False)
+    print(f"  Saved: {output_file}")
+
+    rank_stat = 'partial_r' if results_df['partial_r'].notna().any() else 'pearson_r'
+    for anchor, table in results_df.groupby('anchor', sort=False):
+        rnk_file = output_dir / f"{anchor}_{rank_stat}.rnk"
+        table[['gene', rank_stat]].dropna().to_csv(rnk_file, sep='\t', index=False, header=False)
+        print(f"  Saved: {rnk_file}")
+
+    print("\n" + "="*80)
+    print("SUMMARY")
+    print("="*80)
+    for anchor, table in results_df.groupby('anchor', sort=False):
+        print(f"\n{anchor}:")
+        for stat in STATISTICS:
+            if table[f'{stat}_r'].notna().any():
+                n_sig = int((table[f'{stat}_fdr'] < args.fdr).sum())
+                print(f"  {stat:8s}: {n_sig:,} genes at FDR < {args.fdr}")
+        print(f"  Top genes by {rank_stat}:")
+        for _, row in table.head(5).iterrows():
+            print(f"    {row['gene']}: r = {row[rank_stat]:.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Vectorized Partial Correlation Engine
+Residualizes many genes against one covariate set in a single matrix product
+
+The per-pair approach (two LinearRegression fits + pearsonr per gene pair
+and covariate set) refits the same covariate projection over and over. Here
+the covariate matrix (plus intercept) is factorized once with a pivoted QR;
+every gene is then residualized with one projection and the partial
+correlation matrix is a single cross-product of standardized residuals.
+
+P-values use n - 2 degrees of freedom, matching pearsonr/spearmanr on the
+regression residuals as done in the stage 3 scripts.
+
+Usage:
+    engine = PartialCorrelationEngine(confounders_df)
+    r, p = engine.correlate(expr_df[['CD274']], expr_df[gene_list])
+
+Author: Automated Pipeline
+Date: 2025-11-02
+"""
+
+import pandas as pd
+import numpy as np
+from scipy import stats, linalg
+from typing import List, Optional, Sequence, Tuple, Union
+
+ArrayLike = Union[np.ndarray, pd.DataFrame]
+
+# =============================================================================
+# Linear Algebra Helpers
+# =============================================================================
+
+def covariate_basis(covariates: Optional[np.ndarray], n_samples: int) -> np.ndarray:
+    """
+    Orthonormal basis of [intercept, covariates]
+
+    A column-pivoted QR drops numerically redundant covariates, so collinear
+    confounder sets (e.g. T_cell_score = CD4 + CD8) behave like a
+    least-squares fit instead of over-projecting.
+
+    Args:
+        covariates: n x k covariate matrix (None = intercept only)
+        n_samples: Number of samples
+
+    Returns:
+        n x rank matrix with orthonormal columns
+    """
+    design = np.ones((n_samples, 1))
+    if covariates is not None and np.size(covariates):
+        design = np.column_stack([design, np.asarray(covariates, dtype=np.float64)])
+
+    q, r, _ = linalg.qr(design, mode='economic', pivoting=True)
+    diag = np.abs(np.diag(r))
+    tol = diag[0] * max(design.shape) * np.finfo(np.float64).eps
+    return q[:, :int((diag > tol).sum())]
+
+def standardize_columns(values: np.ndarray) -> np.ndarray:
+    """Center columns and scale to unit norm (zero-variance columns become NaN)"""
+    values = values - values.mean(axis=0)
+    norms = np.sqrt(np.einsum('ij,ij->j', values, values))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return values / np.where(norms > 0, norms, np.nan)
+
+def rank_columns(values: np.ndarray) -> np.ndarray:
+    """Average ranks per column (Spearman on ranks = Pearson)"""
+    return stats.rankdata(values, axis=0)
+
+def correlation_pvalues(r: np.ndarray, dof: int) -> np.ndarray:
+    """
+    Two-sided p-values for correlation coefficients
+
+    Args:
+        r: Correlation coefficients (any shape)
+        dof: Degrees of freedom (n - 2 for a plain correlation)
+
+    Returns:
+        Array of p-values, same shape as r
+    """
+    r = np.asarray(r, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = r * np.sqrt(dof / np.clip(1.0 - r * r, 0.0, None))
+    return 2.0 * stats.t.sf(np.abs(t), dof)
+
+def benjamini_hochberg(pvalues: np.ndarray) -> np.ndarray:
+    """
+    Benjamini-Hochberg FDR (q-values) for a vector of p-values
+
+    NaN p-values are ignored and stay NaN in the output.
+
+    Args:
+        pvalues: 1-D array of p-values
+
+    Returns:
+        Array of BH-adjusted p-values, same shape as pvalues
+    """
+    pvalues = np.asarray(pvalues, dtype=np.float64)
+    qvalues = np.full(pvalues.shape, np.nan)
+    valid = np.flatnonzero(~np.isnan(pvalues))
+    if len(valid) == 0:
+        return qvalues
+
+    order = valid[np.argsort(pvalues[valid])]
+    ranked = pvalues[order] * len(valid) / np.arange(1, len(valid) + 1)
+    qvalues[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1.0)
+    return qvalues
+
+# =============================================================================
+# Engine
+# =============================================================================
+
+class PartialCorrelationEngine:
+    """
+    Partial correlations of arbitrary gene lists given one covariate set
+
+    The covariate projection is computed once in __init__; residualize() and
+    correlate() can then be called for any number of gene blocks.
+    """
+
+    def __init__(self, covariates: Optional[ArrayLike] = None,
+                 n_samples: Optional[int] = None):
+        """
+        Args:
+            covariates: Samples x covariates (None = simple correlation)
+            n_samples: Required when covariates is None
+        """
+        if covariates is not None:
+            self.covariate_names = list(getattr(covariates, 'columns', []))
+            covariates = np.asarray(covariates, dtype=np.float64)
+            n_samples = covariates.shape[0]
+        else:
+            self.covariate_names = []
+            if n_samples is None:
+                raise ValueError("n_samples is required without covariates")
+
+        self.n_samples = n_samples
+        self.basis = covariate_basis(covariates, n_samples)
+        self.dof = n_samples - 2
+
+    def residualize(self, values: ArrayLike) -> np.ndarray:
+        """
+        Remove the intercept and covariates from every column at once
+
+        Args:
+            values: Samples x genes
+
+        Returns:
+            Samples x genes residual matrix
+        """
+        values = np.asarray(values, dtype=np.float64)
+        return values - self.basis @ (self.basis.T @ values)
+
+    def _prepare(self, values: ArrayLike, method: str) -> np.ndarray:
+        resid = self.residualize(values)
+        if method == 'spearman':
+            resid = rank_columns(resid)
+        elif method != 'pearson':
+            raise ValueError(f"Unknown method: {method}")
+        return standardize_columns(resid)
+
+    def correlate(self, x: ArrayLike, y: Optional[ArrayLike] = None,
+                  method: str = 'pearson') -> Tuple[ArrayLike, ArrayLike]:
+        """
+        Partial correlation of every column of x with every column of y
+
+        Args:
+            x: Samples x genes (rows of the result)
+            y: Samples x genes (columns of the result; None = x vs x)
+            method: 'pearson' or 'spearman' (Spearman on the residuals)
+
+        Returns:
+            (r, p) as DataFrames when inputs are DataFrames, else arrays
+        """
+        zx = self._prepare(x, method)
+        zy = zx if y is None else self._prepare(y, method)
+
+        r = np.clip(zx.T @ zy, -1.0, 1.0)
+        p = correlation_pvalues(r, self.dof)
+
+        if isinstance(x, pd.DataFrame):
+            cols = x.columns if y is None else getattr(y, 'columns', None)
+            r = pd.DataFrame(r, index=x.columns, columns=cols)
+            p = pd.DataFrame(p, index=x.columns, columns=cols)
+
+        return r, p
+
+# =============================================================================
+# Convenience API
+# =============================================================================
+
+def complete_cases(expr_df: pd.DataFrame, covariates_df: Optional[pd.DataFrame],
+                   genes: Sequence[str]) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """Rows with no missing value in the requested genes or covariates"""
+    mask = expr_df[list(genes)].notna().all(axis=1).to_numpy()
+    if covariates_df is not None:
+        mask = mask & covariates_df.notna().all(axis=1).to_numpy()
+    expr_df = expr_df.loc[mask, list(genes)]
+    if covariates_df is not None:
+        covariates_df = covariates_df.loc[mask]
+    return expr_df, covariates_df
+
+def partial_correlation_matrix(expr_df: pd.DataFrame,
+                               covariates_df: Optional[pd.DataFrame] = None,
+                               genes: Optional[Sequence[str]] = None,
+                               targets: Optional[Sequence[str]] = None,
+                               method: str = 'pearson'
+                               ) -> Tuple[pd.DataFrame, pd.DataFrame, int]:
+    """
+    Partial correlation matrix for gene lists under one covariate set
+
+    Rows must be aligned between expr_df and covariates_df; samples with a
+    missing value in any requested gene or covariate are dropped.
+
+    Args:
+        expr_df: Samples x genes expression
+        covariates_df: Samples x covariates (None = simple correlation)
+        genes: Row genes (default: all columns of expr_df)
+        targets: Column genes (default: same as genes)
+        method: 'pearson' or 'spearman'
+
+    Returns:
+        (r, p, n_samples) with r and p as genes x targets DataFrames
+    """
+    genes = list(expr_df.columns if genes is None else genes)
+    targets = genes if targets is None else list(targets)
+    used = list(dict.fromkeys(genes + targets))
+
+    expr_cc, cov_cc = complete_cases(expr_df, covariates_df, used)
+    engine = PartialCorrelationEngine(cov_cc, n_samples=len(expr_cc))
+
+    if targets == genes:
+        r, p = engine.correlate(expr_cc[genes], method=method)
+    else:
+        r, p = engine.correlate(expr_cc[genes], expr_cc[targets], method=method)
+
+    return r, p, len(expr_cc)
+
+def partial_correlation_pairs(expr_df: pd.DataFrame, pairs: List[Tuple[str, str]],
+                              covariates_df: Optional[pd.DataFrame] = None,
+                              method: str = 'pearson') -> pd.DataFrame:
+    """
+    Partial correlations for an explicit list of gene pairs
+
+    Args:
+        expr_df: Samples x genes expression
+        pairs: (gene1, gene2) tuples
+        covariates_df: Samples x covariates (None = simple correlation)
+        method: 'pearson' or 'spearman'
+
+    Returns:
+        DataFrame with gene1, gene2, r, p, n_samples
+    """
+    genes = list(dict.fromkeys(g for pair in pairs for g in pair))
+    r, p, n = partial_correlation_matrix(expr_df, covariates_df, genes, method=method)
+    return pd.DataFrame({
+        'gene1': [g1 for g1, _ in pairs],
+        'gene2': [g2 for _, g2 in pairs],
+        'r': [r.at[g1, g2] for g1, g2 in pairs],
+        'p': [p.at[g1, g2] for g1, g2 in pairs],
+        'n_samples': n
+    })
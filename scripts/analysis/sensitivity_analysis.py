@@ -5,19 +5,26 @@ Tests if correlations are stable across:
 1. Different cancer types (LUAD vs LUSC vs SKCM)
 2. Outlier exclusion strategies
 3. Different statistical methods
-4. Bootstrap resampling
+4. Bootstrap resampling (Fisher-z, percentile or BCa intervals)
 
 Author: Automated Pipeline
 Date: 2025-11-02
 """
 
+import sys
 import pandas as pd
 import numpy as np
 from scipy import stats
 from sklearn.preprocessing import RobustScaler
 from pathlib import Path
+from typing import Tuple
 import json
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "data_pipeline"))
+from expression_store import load_expression
+from stratified_correlation import stratified_correlation
+from correlation_stability import correlation_stability
+
 # =============================================================================
 # Configuration
 # =============================================================================
@@ -37,6 +44,9 @@ GENE_PAIRS = [
     ('HIP1R', 'STUB1')
 ]
 
+# Stability intervals: 'fisher' (analytic), 'percentile' or 'bca' (bootstrap)
+STABILITY_METHOD = 'fisher'
+
 # =============================================================================
 # Step 1: Load Data
 # =============================================================================
@@ -47,7 +57,8 @@ print("="*80)
 
 print("\n[LOAD] Loading expression data...")
 expr_file = DATA_DIR / "expression_matrix_full_real.csv"
-expr_df = pd.read_csv(expr_file)
+analysis_genes = list(dict.fromkeys(g for pair in GENE_PAIRS for g in pair))
+expr_df = load_expression(expr_file, genes=analysis_genes)
 
 # Set sample_id as index
 if 'sample_id' in expr_df.columns:
@@ -66,65 +77,47 @@ print(f"  Expression: {expr_df.shape[0]} samples x {expr_df.shape[1]} genes")
 # Step 2: Per-Cancer Type Analysis
 # =============================================================================
 
-def analyze_per_cancer_type(expr_df: pd.DataFrame, cancer_type: pd.Series) -> pd.DataFrame:
+def analyze_per_cancer_type(expr_df: pd.DataFrame, cancer_type: pd.Series
+                            ) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
     Calculate correlations separately for each cancer type
 
+    All cancer types and gene pairs are computed at once from grouped
+    sufficient statistics (see stratified_correlation).
+
     Args:
         expr_df: Expression DataFrame
         cancer_type: Cancer type labels
 
     Returns:
-        Results DataFrame
+        (results, heterogeneity) - per cancer type and pair results, and
+        per pair pooled estimates with between-cancer heterogeneity
     """
     print("\n[PER-CANCER] Analyzing by cancer type...")
 
-    results = []
-
-    for cancer in cancer_type.unique():
+    keys = ['cancer_type', 'gene1', 'gene2']
+    pearson, het = stratified_correlation(expr_df, cancer_type.to_numpy(), GENE_PAIRS,
+                                          method='pearson', group_name='cancer_type')
+    spearman, _ = stratified_correlation(expr_df, cancer_type.to_numpy(), GENE_PAIRS,
+                                         method='spearman', group_name='cancer_type')
+    results = pearson.rename(columns={'r': 'pearson_r', 'p': 'pearson_p', 'ci_low': 'pearson_ci_low',
+                                      'ci_high': 'pearson_ci_high', 'q': 'pearson_q'})
+    results = results.merge(spearman[keys + ['r', 'p']].rename(columns={'r': 'spearman_rho', 'p': 'spearman_p'}),
+                            on=keys, how='left')
+
+    counts = cancer_type.value_counts(sort=False)
+    for cancer, block in results.groupby('cancer_type', sort=False):
         print(f"\n  --- {cancer} ---")
+        print(f"    N samples: {counts[cancer]}")
+        for row in block.itertuples(index=False):
+            print(f"    {row.gene1}-{row.gene2}: r={row.pearson_r:.3f} (P={row.pearson_p:.2e})")
 
-        # Subset to cancer type
-        mask = cancer_type == cancer
-        subset_df = expr_df[mask]
-
-        print(f"    N samples: {len(subset_df)}")
-
-        for gene1, gene2 in GENE_PAIRS:
-            if gene1 not in subset_df.columns or gene2 not in subset_df.columns:
-                continue
-
-            x = subset_df[gene1].values
-            y = subset_df[gene2].values
+    print("\n  Heterogeneity across cancer types:")
+    for row in het.itertuples(index=False):
+        print(f"    {row.gene1}-{row.gene2}: pooled r={row.pooled_r:.3f}, "
+              f"random r={row.random_r:.3f}, I2={row.I2:.2f} (Q P={row.Q_p:.2e})")
 
-            # Remove NaN
-            mask_valid = ~(np.isnan(x) | np.isnan(y))
-            x_clean = x[mask_valid]
-            y_clean = y[mask_valid]
-
-            if len(x_clean) < 10:
-                continue
-
-            # Pearson
-            r, p = stats.pearsonr(x_clean, y_clean)
-
-            # Spearman
-            rho, p_spearman = stats.spearmanr(x_clean, y_clean)
-
-            print(f"    {gene1}-{gene2}: r={r:.3f} (P={p:.2e})")
-
-            results.append({
-                'cancer_type': cancer,
-                'gene1': gene1,
-                'gene2': gene2,
-                'n_samples': len(x_clean),
-                'pearson_r': r,
-                'pearson_p': p,
-                'spearman_rho': rho,
-                'spearman_p': p_spearman
-            })
-
-    return pd.DataFrame(results)
+    return results, het
 
 # =============================================================================
 # Step 3: Outlier Exclusion Strategies
@@ -215,18 +208,23 @@ def analyze_with_outlier_exclusion(expr_df: pd.DataFrame, method: str) -> pd.Dat
 # Step 4: Bootstrap Stability Analysis
 # =============================================================================
 
-def bootstrap_stability(expr_df: pd.DataFrame, n_bootstrap=1000) -> pd.DataFrame:
+def bootstrap_stability(expr_df: pd.DataFrame, n_bootstrap=1000,
+                        method: str = STABILITY_METHOD) -> pd.DataFrame:
     """
-    Test correlation stability via bootstrap
+    Test correlation stability via Fisher-z or bootstrap intervals
 
     Args:
         expr_df: Expression DataFrame
-        n_bootstrap: Number of bootstrap samples
+        n_bootstrap: Number of bootstrap samples (bootstrap methods only)
+        method: 'fisher' (analytic), 'percentile' or 'bca' (see correlation_stability)
 
     Returns:
         Bootstrap results DataFrame
     """
-    print(f"\n[BOOTSTRAP] Testing stability with {n_bootstrap} resamples...")
+    if method == 'fisher':
+        print("\n[BOOTSTRAP] Testing stability with Fisher-z intervals...")
+    else:
+        print(f"\n[BOOTSTRAP] Testing stability with {n_bootstrap} resamples ({method})...")
 
     results = []
 
@@ -236,52 +234,16 @@ def bootstrap_stability(expr_df: pd.DataFrame, n_bootstrap=1000) -> pd.DataFrame
 
         print(f"  {gene1}-{gene2}...")
 
-        x = expr_df[gene1].values
-        y = expr_df[gene2].values
-
-        mask_valid = ~(np.isnan(x) | np.isnan(y))
-        x_clean = x[mask_valid]
-        y_clean = y[mask_valid]
-
-        if len(x_clean) < 10:
+        result = correlation_stability(expr_df[gene1].values, expr_df[gene2].values,
+                                       method=method, n_bootstrap=n_bootstrap)
+        if result is None:
             continue
 
-        # Bootstrap
-        boot_r = []
-
-        for _ in range(n_bootstrap):
-            indices = np.random.choice(len(x_clean), size=len(x_clean), replace=True)
-            x_boot = x_clean[indices]
-            y_boot = y_clean[indices]
-
-            r_boot, _ = stats.pearsonr(x_boot, y_boot)
-            boot_r.append(r_boot)
-
-        # Statistics
-        boot_r = np.array(boot_r)
-        mean_r = boot_r.mean()
-        std_r = boot_r.std()
-        ci_lower = np.percentile(boot_r, 2.5)
-        ci_upper = np.percentile(boot_r, 97.5)
+        print(f"    Mean r = {result['mean_r']:.3f} +/- {result['std_r']:.3f}")
+        print(f"    95% CI = [{result['ci_lower']:.3f}, {result['ci_upper']:.3f}]")
+        print(f"    CV = {result['cv']:.3f}")
 
-        # Stability: coefficient of variation
-        cv = std_r / abs(mean_r) if mean_r != 0 else np.inf
-
-        print(f"    Mean r = {mean_r:.3f} +/- {std_r:.3f}")
-        print(f"    95% CI = [{ci_lower:.3f}, {ci_upper:.3f}]")
-        print(f"    CV = {cv:.3f}")
-
-        results.append({
-            'gene1': gene1,
-            'gene2': gene2,
-            'n_samples': len(x_clean),
-            'mean_r': mean_r,
-            'std_r': std_r,
-            'ci_lower': ci_lower,
-            'ci_upper': ci_upper,
-            'cv': cv,
-            'n_bootstrap': n_bootstrap
-        })
+        results.append({'gene1': gene1, 'gene2': gene2, **result})
 
     return pd.DataFrame(results)
 
@@ -354,7 +316,7 @@ def main():
     Main execution pipeline
     """
     # Analysis 1: Per-cancer type
-    per_cancer_results = analyze_per_cancer_type(expr_df, cancer_type)
+    per_cancer_results, per_cancer_het = analyze_per_cancer_type(expr_df, cancer_type)
 
     # Analysis 2: Outlier exclusion
     outlier_results = []
@@ -377,6 +339,10 @@ def main():
     per_cancer_results.to_csv(per_cancer_file, index=False)
     print(f"  Saved: {per_cancer_file}")
 
+    het_file = OUTPUT_DIR / "per_cancer_heterogeneity.csv"
+    per_cancer_het.to_csv(het_file, index=False)
+    print(f"  Saved: {het_file}")
+
     # Outlier exclusion
     outlier_file = OUTPUT_DIR / "outlier_exclusion_results.csv"
     outlier_results.to_csv(outlier_file, index=False)
@@ -395,6 +361,7 @@ def main():
     # Summary JSON
     summary = {
         'per_cancer_results': per_cancer_results.to_dict('records'),
+        'per_cancer_heterogeneity': per_cancer_het.to_dict('records'),
         'outlier_exclusion': outlier_results.to_dict('records'),
         'bootstrap_stability': bootstrap_results.to_dict('records'),
         'methods_comparison': methods_results.to_dict('records')
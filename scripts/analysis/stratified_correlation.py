@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Stratified Correlation Engine
+Per-group correlations for many gene pairs from grouped sufficient statistics
+
+Samples are sorted by group once; for every gene pair the per-group counts,
+sums, sums of squares and cross-products are then reduced over all groups
+in one np.add.reduceat pass (pairs processed in column blocks). Everything
+else - correlations, p-values, Fisher-z confidence intervals, fixed and
+random effects pooled estimates, Cochran's Q and I^2 across groups - is
+closed-form arithmetic on those (groups x pairs) arrays.
+
+Missing values are handled pairwise (each pair uses the samples where both
+genes are observed). Spearman correlations rank each gene within its group;
+the few (group, pair) cells where a gene has missing values are re-ranked
+over their complete rows, as spearmanr would. Moments are additive, so
+results computed on separate chunks of samples (e.g. one cohort at a time)
+can be concatenated.
+
+Usage:
+    per_group, heterogeneity = stratified_correlation(expr_df, cancer_type, pairs)
+
+Author: Automated Pipeline
+Date: 2025-11-02
+"""
+
+import pandas as pd
+import numpy as np
+from scipy import stats
+from typing import List, Optional, Sequence, Tuple
+
+from partial_correlation_engine import benjamini_hochberg, correlation_pvalues
+
+# =============================================================================
+# Configuration
+# =============================================================================
+
+MIN_SAMPLES = 10
+
+# Pair columns reduced per block (bounds the samples x block temporaries)
+PAIR_BLOCK = 512
+
+MOMENTS = ('n', 'sx', 'sy', 'sxx', 'syy', 'sxy')
+
+# =============================================================================
+# Grouped Sufficient Statistics
+# =============================================================================
+
+def group_layout(groups: Sequence) -> Tuple[np.ndarray, np.ndarray, pd.Index]:
+    """
+    Sort order and segment starts that make every group contiguous
+
+    Args:
+        groups: Group label per sample (NaN labels are dropped)
+
+    Returns:
+        (order, starts, labels) - sample order, first row of each group in
+        that order, and group labels in order of first appearance
+    """
+    codes, labels = pd.factorize(pd.Series(groups), sort=False)
+    keep = np.flatnonzero(codes >= 0)
+    order = keep[np.argsort(codes[keep], kind='stable')]
+    counts = np.bincount(codes[keep], minlength=len(labels))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    return order, starts, pd.Index(labels)
+
+def rank_within_groups(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Average ranks of each column within each group segment (NaN stays NaN)"""
+    ranks = np.empty(values.shape, dtype=np.float64)
+    bounds = np.append(starts, len(values))
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        ranks[lo:hi] = stats.rankdata(values[lo:hi], axis=0, nan_policy='omit')
+    return ranks
+
+def _rerank_incomplete(moments: dict, raw: np.ndarray, starts: np.ndarray,
+                       ix: np.ndarray, iy: np.ndarray):
+    """Exact Spearman moments for (group, pair) cells with missing values"""
+    missing = np.add.reduceat(np.isnan(raw), starts, axis=0) > 0
+    bounds = np.append(starts, len(raw))
+    for g, p in zip(*np.nonzero(missing[:, ix] | missing[:, iy])):
+        x, y = raw[bounds[g]:bounds[g + 1], ix[p]], raw[bounds[g]:bounds[g + 1], iy[p]]
+        both = ~(np.isnan(x) | np.isnan(y))
+        # Ranks 1..m have mean (m + 1) / 2
+        shift = (both.sum() + 1) / 2
+        x, y = stats.rankdata(x[both]) - shift, stats.rankdata(y[both]) - shift
+        for name, value in (('n', len(x)), ('sx', x.sum()), ('sy', y.sum()),
+                            ('sxx', x @ x), ('syy', y @ y), ('sxy', x @ y)):
+            moments[name][g, p] = value
+
+class GroupedMoments:
+    """
+    Per-group pairwise sufficient statistics for a list of gene pairs
+
+    Attributes n, sx, sy, sxx, syy, sxy are (groups x pairs) arrays over the
+    samples where both genes of a pair are observed; x and y are centered
+    by a per-gene shift before accumulation (correlations are shift
+    invariant), which keeps the sums well conditioned.
+    """
+
+    def __init__(self, groups: pd.Index, pairs: List[Tuple[str, str]], **moments):
+        self.groups = pd.Index(groups)
+        self.pairs = list(pairs)
+        for name in MOMENTS:
+            setattr(self, name, np.asarray(moments[name], dtype=np.float64))
+
+    @classmethod
+    def from_frame(cls, expr_df: pd.DataFrame, groups: Sequence,
+                   pairs: Optional[List[Tuple[str, str]]] = None,
+                   method: str = 'pearson', pair_block: int = PAIR_BLOCK) -> 'GroupedMoments':
+        """
+        Accumulate moments for every group and pair
+
+        Args:
+            expr_df: Samples x genes expression
+            groups: Group label per sample (aligned with expr_df rows)
+            pairs: (gene1, gene2) tuples (default: all pairs of columns);
+                pairs with a gene missing from expr_df are dropped
+            method: 'pearson' or 'spearman'
+            pair_block: Pairs reduced per block
+
+        Returns:
+            GroupedMoments
+        """
+        if method not in ('pearson', 'spearman'):
+            raise ValueError(f"Unknown method: {method}")
+        if pairs is None:
+            genes = list(expr_df.columns)
+            pairs = [(genes[i], genes[j]) for i in range(len(genes)) for j in range(i + 1, len(genes))]
+        pairs = [(g1, g2) for g1, g2 in pairs if g1 in expr_df.columns and g2 in expr_df.columns]
+
+        order, starts, labels = group_layout(groups)
+        genes = list(dict.fromkeys(g for pair in pairs for g in pair))
+        raw = expr_df[genes].to_numpy(dtype=np.float64)[order]
+        values = rank_within_groups(raw, starts) if method == 'spearman' else raw
+
+        # Shift each gene by its mean; sums are then of small, centered values
+        observed = ~np.isnan(values)
+        values = np.where(observed, values, 0.0)
+        values -= np.where(observed, values.sum(axis=0) / np.maximum(observed.sum(axis=0), 1), 0.0)
+
+        position = {g: i for i, g in enumerate(genes)}
+        ix = np.array([position[g1] for g1, _ in pairs], dtype=np.int64)
+        iy = np.array([position[g2] for _, g2 in pairs], dtype=np.int64)
+
+        moments = {name: np.zeros((len(labels), len(pairs))) for name in MOMENTS}
+        if len(values) and len(pairs):
+            for lo in range(0, len(pairs), pair_block):
+                cols = slice(lo, lo + pair_block)
+                both = observed[:, ix[cols]] & observed[:, iy[cols]]
+                x = np.where(both, values[:, ix[cols]], 0.0)
+                y = np.where(both, values[:, iy[cols]], 0.0)
+                for name, term in (('n', both), ('sx', x), ('sy', y),
+                                   ('sxx', x * x), ('syy', y * y), ('sxy', x * y)):
+                    # Every group has at least one sample, so no segment is empty
+                    moments[name][:, cols] = np.add.reduceat(term, starts, axis=0, dtype=np.float64)
+            if method == 'spearman':
+                _rerank_incomplete(moments, raw, starts, ix, iy)
+        return cls(labels, pairs, **moments)
+
+    @classmethod
+    def concat(cls, parts: Sequence['GroupedMoments']) -> 'GroupedMoments':
+        """Stack moments computed on disjoint groups (same pair list)"""
+        pairs = parts[0].pairs
+        if any(p.pairs != pairs for p in parts):
+            raise ValueError("All parts must use the same pair list")
+        return cls(pd.Index(np.concatenate([p.groups.to_numpy(dtype=object) for p in parts])), pairs,
+                   **{name: np.vstack([getattr(p, name) for p in parts]) for name in MOMENTS})
+
+    def pooled(self, label: str = 'ALL') -> 'GroupedMoments':
+        """Moments of all groups combined (for Spearman, within-group ranks pooled)"""
+        return GroupedMoments(pd.Index([label]), self.pairs,
+                              **{name: getattr(self, name).sum(axis=0, keepdims=True) for name in MOMENTS})
+
+    def correlation(self) -> np.ndarray:
+        """(groups x pairs) correlation coefficients (NaN if undefined)"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cxy = self.sxy - self.sx * self.sy / self.n
+            cxx = self.sxx - self.sx ** 2 / self.n
+            cyy = self.syy - self.sy ** 2 / self.n
+            r = cxy / np.sqrt(cxx * cyy)
+        r[~((cxx > 0) & (cyy > 0))] = np.nan
+        return np.clip(r, -1.0, 1.0)
+
+# =============================================================================
+# Statistics from Moments
+# =============================================================================
+
+def fisher_ci(r: np.ndarray, n: np.ndarray, alpha: float = 0.05) -> Tuple[np.ndarray, np.ndarray]:
+    """Fisher-z confidence interval of correlation coefficients"""
+    crit = stats.norm.ppf(1 - alpha / 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.arctanh(np.clip(r, -1 + 1e-12, 1 - 1e-12))
+        se = 1.0 / np.sqrt(n - 3)
+    return np.tanh(z - crit * se), np.tanh(z + crit * se)
+
+def heterogeneity(r: np.ndarray, n: np.ndarray, alpha: float = 0.05) -> pd.DataFrame:
+    """
+    Fisher-z meta-analysis across groups for every pair (column)
+
+    Groups with NaN r or n <= 3 are ignored. Fixed effects weights are
+    n - 3; the random effects estimate uses the DerSimonian-Laird tau^2.
+
+    Args:
+        r: (groups x pairs) correlations
+        n: (groups x pairs) sample counts
+        alpha: CI level
+
+    Returns:
+        DataFrame (one row per pair) with n_groups, pooled_r, pooled CI,
+        random_r, random CI, Q, Q_p, I2, tau2
+    """
+    valid = ~np.isnan(r) & (n > 3)
+    z = np.where(valid, np.arctanh(np.clip(np.nan_to_num(r), -1 + 1e-12, 1 - 1e-12)), 0.0)
+    w = np.where(valid, n - 3, 0.0)
+    k = valid.sum(axis=0)
+    crit = stats.norm.ppf(1 - alpha / 2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sw = w.sum(axis=0)
+        z_fixed = (w * z).sum(axis=0) / sw
+        q = (w * (z - z_fixed) ** 2).sum(axis=0)
+        df = k - 1
+        c = sw - (w * w).sum(axis=0) / sw
+        tau2 = np.where(df > 0, np.maximum(0.0, (q - df) / c), 0.0)
+        w_random = np.where(valid, 1.0 / (1.0 / np.where(valid, w, 1.0) + tau2), 0.0)
+        z_random = (w_random * z).sum(axis=0) / w_random.sum(axis=0)
+        se_fixed = 1.0 / np.sqrt(sw)
+        se_random = 1.0 / np.sqrt(w_random.sum(axis=0))
+        i2 = np.where(q > 0, np.maximum(0.0, (q - df) / q), 0.0)
+        q_p = np.where(df > 0, stats.chi2.sf(q, np.maximum(df, 1)), np.nan)
+
+    undefined = k == 0
+    table = pd.DataFrame({
+        'n_groups': k,
+        'pooled_r': np.tanh(z_fixed),
+        'pooled_ci_low': np.tanh(z_fixed - crit * se_fixed),
+        'pooled_ci_high': np.tanh(z_fixed + crit * se_fixed),
+        'random_r': np.tanh(z_random),
+        'random_ci_low': np.tanh(z_random - crit * se_random),
+        'random_ci_high': np.tanh(z_random + crit * se_random),
+        'Q': np.where(df > 0, q, np.nan),
+        'Q_p': q_p,
+        'I2': np.where(df > 0, i2, np.nan),
+        'tau2': np.where(df > 0, tau2, np.nan),
+    })
+    table.loc[undefined, :] = np.nan
+    table['n_groups'] = k
+    return table
+
+def correlation_tables(moments: GroupedMoments, min_samples: int = MIN_SAMPLES,
+                       alpha: float = 0.05, group_name: str = 'group'
+                       ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Per-group correlation table and per-pair heterogeneity table
+
+    Args:
+        moments: Grouped moments
+        min_samples: Groups with fewer complete samples for a pair are
+            left out of both tables
+        alpha: CI level
+        group_name: Name of the group column
+
+    Returns:
+        (per_group, heterogeneity) - per_group has one row per group and
+        pair (group order, then pair order) with n_samples, r, p, CI and
+        BH q-value across all rows; heterogeneity has one row per pair
+    """
+    r = moments.correlation()
+    n = moments.n
+    r = np.where(n >= min_samples, r, np.nan)
+    p = correlation_pvalues(r, np.maximum(n - 2, 1))
+    low, high = fisher_ci(r, n, alpha)
+
+    n_groups, n_pairs = r.shape
+    rows = np.repeat(np.arange(n_groups), n_pairs)
+    cols = np.tile(np.arange(n_pairs), n_groups)
+    keep = (n.ravel() >= min_samples) & ~np.isnan(r.ravel())
+    rows, cols = rows[keep], cols[keep]
+
+    gene1 = np.array([g1 for g1, _ in moments.pairs], dtype=object)
+    gene2 = np.array([g2 for _, g2 in moments.pairs], dtype=object)
+    per_group = pd.DataFrame({
+        group_name: moments.groups.to_numpy(dtype=object)[rows],
+        'gene1': gene1[cols],
+        'gene2': gene2[cols],
+        'n_samples': n[rows, cols].astype(np.int64),
+        'r': r[rows, cols],
+        'p': p[rows, cols],
+        'ci_low': low[rows, cols],
+        'ci_high': high[rows, cols],
+    })
+    per_group['q'] = benjamini_hochberg(per_group['p'].to_numpy())
+
+    het = heterogeneity(r, n, alpha)
+    het.insert(0, 'gene2', gene2)
+    het.insert(0, 'gene1', gene1)
+    return per_group, het
+
+def stratified_correlation(expr_df: pd.DataFrame, groups: Sequence,
+                           pairs: Optional[List[Tuple[str, str]]] = None,
+                           method: str = 'pearson', min_samples: int = MIN_SAMPLES,
+                           alpha: float = 0.05, group_name: str = 'group'
+                           ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Correlations of gene pairs within every group, plus heterogeneity
+
+    Args:
+        expr_df: Samples x genes expression
+        groups: Group label per sample (e.g. cancer type)
+        pairs: (gene1, gene2) tuples (default: all pairs of columns)
+        method: 'pearson' or 'spearman'
+        min_samples: Minimum complete samples per group and pair
+        alpha: CI level
+        group_name: Name of the group column in the output
+
+    Returns:
+        (per_group, heterogeneity) DataFrames (see correlation_tables)
+    """
+    moments = GroupedMoments.from_frame(expr_df, groups, pairs, method)
+    return correlation_tables(moments, min_samples, alpha, group_name)
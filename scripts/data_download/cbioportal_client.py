@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Pooled cBioPortal REST Client
+Concurrent, batched, streaming access to the cBioPortal web API
+
+Features:
+- One requests.Session with a sized connection pool and urllib3 retries
+  (429/5xx with backoff), shared by all worker threads
+- Large Entrez ID lists split into batches (one request per batch)
+- JSON array responses parsed incrementally and written batch by batch
+  into chunked columnar stores, so no response is held as a whole blob
+- Record mode saves raw responses under a request hash; replay mode serves
+  them from that fixture directory without touching the network
+
+Columnar store layout (one directory per table):
+    <name>.cols/part-<tag>-00000/meta.json     rows, column kinds
+    <name>.cols/part-<tag>-00000/<col>.npy     numeric column
+    <name>.cols/part-<tag>-00000/<col>.npy     string column as int32 codes
+    <name>.cols/part-<tag>-00000/<col>.json    ... plus its categories
+
+Usage:
+    client = CBioPortalClient(replay_dir="tests/fixtures/cbioportal")
+    rows = write_records(client.mutations(study, sample_list), "LUAD_mutations.cols")
+    df = read_columnar("LUAD_mutations.cols", columns=["sampleId", "entrezGeneId"])
+
+Author: Automated Pipeline
+Date: 2025-11-02
+"""
+
+import os
+import json
+import codecs
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CBIO_API = os.environ.get("CBIO_API", "https://www.cbioportal.org/api")
+
+POOL_SIZE = 16
+REQUEST_TIMEOUT = (10, 60)      # (connect, read) seconds
+MAX_RETRIES = 4
+ENTREZ_BATCH = 500              # Entrez IDs per molecular-data request
+RECORD_BATCH = 50000            # Records per columnar part
+STREAM_CHUNK = 1 << 16
+
+# =============================================================================
+# Streaming JSON
+# =============================================================================
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Dict]:
+    """
+    Yield the elements of a top-level JSON array as the bytes arrive
+
+    Args:
+        chunks: Response body chunks
+
+    Returns:
+        Iterator over array elements
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buf, started, closed = '', False, False
+    # The body is always read to the end, so recording callers see all of it
+    for chunk in chunks:
+        buf += text.decode(chunk)
+        if closed:
+            continue
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buf):
+                break
+            if not started:
+                if buf[pos] != '[':
+                    raise ValueError(f"Expected a JSON array, got: {buf[pos:pos + 200]}")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                closed = True
+                pos += 1
+                break
+            try:
+                element, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break       # Element continues in the next chunk
+            yield element
+        buf = buf[pos:]
+    if not closed:
+        raise ValueError("Truncated JSON array")
+    if buf.strip():
+        raise ValueError(f"Unexpected data after JSON array: {buf.strip()[:200]}")
+
+# =============================================================================
+# Client
+# =============================================================================
+
+class CBioPortalClient:
+    """
+    Thread-safe cBioPortal client with pooling, record and replay
+
+    Args (constructor):
+        base_url: API base URL
+        pool_size: Connections kept per host (>= number of worker threads)
+        record_dir: Save every raw response here (fixture recording)
+        replay_dir: Serve responses from here only (offline; a miss raises)
+    """
+
+    def __init__(self, base_url: str = CBIO_API, pool_size: int = POOL_SIZE,
+                 record_dir: Optional[Union[str, Path]] = None,
+                 replay_dir: Optional[Union[str, Path]] = None):
+        self.base_url = base_url.rstrip('/')
+        self.record_dir = Path(record_dir) if record_dir else None
+        self.replay_dir = Path(replay_dir) if replay_dir else None
+        if self.record_dir:
+            self.record_dir.mkdir(parents=True, exist_ok=True)
+
+        # POST */fetch endpoints are read-only queries, so they are retried too
+        retry = Retry(total=MAX_RETRIES, backoff_factor=1, allowed_methods=None,
+                      status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['accept'] = 'application/json'
+
+    @staticmethod
+    def request_key(method: str, path: str, params: Optional[Dict] = None,
+                    body: Optional[Dict] = None) -> str:
+        """Fixture name for a request (independent of the base URL)"""
+        request = {'method': method, 'path': path, 'params': params or {}, 'body': body}
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+    def _chunks(self, method: str, path: str, params: Optional[Dict] = None,
+                body: Optional[Dict] = None) -> Iterator[bytes]:
+        key = self.request_key(method, path, params, body)
+
+        if self.replay_dir is not None:
+            fixture = self.replay_dir / f"{key}.json"
+            if not fixture.exists():
+                raise FileNotFoundError(f"No recorded response for {method} {path} ({fixture.name})")
+            with open(fixture, 'rb') as f:
+                yield from iter(lambda: f.read(STREAM_CHUNK), b'')
+            return
+
+        with self.session.request(method, f"{self.base_url}{path}", params=params, json=body,
+                                  timeout=REQUEST_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            if self.record_dir is None:
+                yield from response.iter_content(chunk_size=STREAM_CHUNK)
+                return
+
+            fixture = self.record_dir / f"{key}.json"
+            tmp = fixture.with_name(f".{fixture.name}.{os.getpid()}.tmp")
+            with open(tmp, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=STREAM_CHUNK):
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp, fixture)
+            with open(self.record_dir / f"{key}.request.json", 'w') as f:
+                json.dump({'method': method, 'path': path, 'params': params, 'body': body}, f, indent=2)
+
+    def iter_records(self, method: str, path: str, params: Optional[Dict] = None,
+                     body: Optional[Dict] = None) -> Iterator[Dict]:
+        """Stream the records of a JSON array endpoint"""
+        return iter_json_array(self._chunks(method, path, params, body))
+
+    # -------------------------------------------------------------------------
+    # Endpoints
+    # -------------------------------------------------------------------------
+
+    def genes(self, gene_symbols: Sequence[str]) -> Dict[str, Optional[int]]:
+        """Hugo symbol -> Entrez ID (None for all symbols if the lookup fails)"""
+        try:
+            records = list(self.iter_records('POST', '/genes/fetch',
+                                             body={'geneSymbols': list(gene_symbols)}))
+        except (requests.HTTPError, requests.exceptions.RetryError):
+            return {s: None for s in gene_symbols}
+        found = {r['hugoGeneSymbol']: r['entrezGeneId'] for r in records}
+        return {s: found.get(s) for s in gene_symbols}
+
+    def molecular_data(self, molecular_profile_id: str, sample_list_id: str,
+                       entrez_gene_ids: Sequence[int]) -> Iterator[Dict]:
+        """Molecular data records for one Entrez batch (see entrez_batches)"""
+        payload = {
+            'entrezGeneIds': [int(x) if str(x).isdigit() else x for x in entrez_gene_ids],
+            'sampleListId': sample_list_id
+        }
+        return self.iter_records('POST', f"/molecular-profiles/{molecular_profile_id}/molecular-data/fetch",
+                                 body=payload)
+
+    def mutations(self, study_id: str, sample_list_id: str) -> Iterator[Dict]:
+        """Mutation records of a study sample list"""
+        return self.iter_records('GET', f"/studies/{study_id}/mutations",
+                                 params={'sampleListId': sample_list_id})
+
+def entrez_batches(entrez_gene_ids: Sequence[int], batch_size: int = ENTREZ_BATCH) -> List[List[int]]:
+    """Split an Entrez ID list into request-sized batches"""
+    ids = list(entrez_gene_ids)
+    return [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)] or [[]]
+
+# =============================================================================
+# Columnar Stores
+# =============================================================================
+
+def _as_text(value) -> Optional[str]:
+    """String form of a non-numeric cell (nested values as JSON, missing as None)"""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return value if isinstance(value, str) else str(value)
+
+def _write_part(part_dir: Path, records: List[Dict]):
+    df = pd.json_normalize(records)
+    part_dir.mkdir(parents=True)
+    kinds = {}
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            kinds[col] = 'numeric'
+            np.save(part_dir / f"{col}.npy", values.to_numpy())
+        else:
+            kinds[col] = 'string'
+            codes, categories = pd.factorize(values.map(_as_text))
+            np.save(part_dir / f"{col}.npy", codes.astype(np.int32))
+            with open(part_dir / f"{col}.json", 'w') as f:
+                json.dump(list(categories), f)
+    with open(part_dir / "meta.json", 'w') as f:
+        json.dump({'rows': len(df), 'columns': kinds}, f)
+
+def reset_columnar(store_dir: Union[str, Path]):
+    """Empty a store before (re)writing its parts"""
+    shutil.rmtree(store_dir, ignore_errors=True)
+    Path(store_dir).mkdir(parents=True)
+
+def write_records(records: Iterable[Dict], store_dir: Union[str, Path], tag: str = "0",
+                  batch_rows: int = RECORD_BATCH) -> int:
+    """
+    Stream records into columnar parts of a store
+
+    Parts are named by tag, so concurrent writers with distinct tags can
+    fill the same store.
+
+    Args:
+        records: Record iterator (e.g. CBioPortalClient.mutations)
+        store_dir: Store directory
+        tag: Writer tag (part name prefix)
+        batch_rows: Records per part
+
+    Returns:
+        Number of records written
+    """
+    store_dir = Path(store_dir)
+    batch, n_parts, n_rows = [], 0, 0
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_rows:
+            _write_part(store_dir / f"part-{tag}-{n_parts:05d}", batch)
+            n_parts, n_rows, batch = n_parts + 1, n_rows + len(batch), []
+    if batch:
+        _write_part(store_dir / f"part-{tag}-{n_parts:05d}", batch)
+        n_rows += len(batch)
+    return n_rows
+
+def read_columnar(store_dir: Union[str, Path], columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    Read a columnar store (all parts, in part-name order)
+
+    Args:
+        store_dir: Store directory
+        columns: Only load these columns
+
+    Returns:
+        DataFrame (empty if the store has no parts)
+    """
+    frames = []
+    for part_dir in sorted(Path(store_dir).glob('part-*')):
+        with open(part_dir / "meta.json") as f:
+            meta = json.load(f)
+        data = {}
+        for col, kind in meta['columns'].items():
+            if columns is not None and col not in columns:
+                continue
+            values = np.load(part_dir / f"{col}.npy")
+            if kind == 'string':
+                with open(part_dir / f"{col}.json") as f:
+                    categories = json.load(f)
+                values = pd.Series(np.asarray(categories + [None], dtype=object)[values])
+            data[col] = values
+        frames.append(pd.DataFrame(data, index=pd.RangeIndex(meta['rows'])))
+    if not frames:
+        return pd.DataFrame(columns=list(columns or []))
+    return pd.concat(frames, ignore_index=True)
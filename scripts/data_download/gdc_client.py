@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Cached GDC Metadata Client
+Paginated, cached queries against the GDC /files and /cases endpoints
+
+Features:
+- Automatic pagination (first page tells the total, remaining pages are
+  fetched in parallel) with a fixed sort order, so results are stable
+- On-disk response cache keyed by endpoint + canonical request
+- Each cached result carries a content hash (checked on load) and the
+  validators it was fetched under (GDC data release, hit total)
+- Within the TTL the cache is used without any network call; after it,
+  the validators are re-checked with two tiny requests (like an ETag
+  revalidation) and the pages are only re-fetched if they changed
+- Offline mode (or an unreachable API) serves cached results regardless
+  of age
+- Stable GDC manifest output (id, filename, md5, size, state)
+
+Environment:
+    GDC_API_URL          API base URL (e.g. a local mock server)
+    GDC_CACHE_TTL_HOURS  Cache freshness window (default 168)
+    GDC_OFFLINE          1/true/yes: never touch the network
+
+Usage:
+    client = GDCClient()
+    hits = client.query("files", filters, fields=["file_id", "md5sum"])
+    write_manifest(hits, "gdc_manifest.txt")
+
+Author: Automated Pipeline
+Date: 2025-11-02
+"""
+
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import requests
+
+GDC_API = os.environ.get('GDC_API_URL', "https://api.gdc.cancer.gov").rstrip('/')
+
+BASE_DIR = Path(__file__).parent.parent.parent
+CACHE_DIR = BASE_DIR / "outputs" / ".gdc_cache"
+
+CACHE_FORMAT_VERSION = 1
+DEFAULT_TTL_HOURS = float(os.environ.get('GDC_CACHE_TTL_HOURS', '168'))
+OFFLINE = os.environ.get('GDC_OFFLINE', '').lower() in ['1', 'true', 'yes']
+
+PAGE_SIZE = 1000
+PAGE_WORKERS = 4
+MAX_RETRIES = 4
+REQUEST_TIMEOUT = 60
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Sort keys that make pagination deterministic
+DEFAULT_SORT = {
+    'files': 'file_id:asc',
+    'cases': 'case_id:asc'
+}
+
+# =============================================================================
+# Helpers
+# =============================================================================
+
+def canonical_json(obj) -> str:
+    """JSON with sorted keys and no whitespace (stable for hashing)"""
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), default=str)
+
+def content_hash(hits: List[Dict]) -> str:
+    """SHA-256 of a hit list"""
+    return hashlib.sha256(canonical_json(hits).encode()).hexdigest()
+
+class GDCOfflineError(RuntimeError):
+    """A query needs the network but the client is offline"""
+
+# =============================================================================
+# Client
+# =============================================================================
+
+class GDCClient:
+    """
+    GDC API client with pagination and an on-disk response cache
+
+    Thread-safe for concurrent queries (cache files are written atomically).
+    """
+
+    def __init__(self, base_url: str = GDC_API, cache_dir: Union[str, Path] = CACHE_DIR,
+                 ttl_hours: float = DEFAULT_TTL_HOURS, offline: bool = OFFLINE,
+                 page_size: int = PAGE_SIZE, page_workers: int = PAGE_WORKERS):
+        """
+        Args:
+            base_url: API base URL
+            cache_dir: Response cache directory
+            ttl_hours: Age up to which cached results are used without revalidation
+            offline: Serve from cache only (a miss raises GDCOfflineError)
+            page_size: Hits per page
+            page_workers: Parallel page requests
+        """
+        self.base_url = base_url.rstrip('/')
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl_hours * 3600
+        self.offline = offline
+        self.page_size = page_size
+        self.page_workers = page_workers
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.network_calls = 0
+
+    # -------------------------------------------------------------------------
+    # HTTP
+    # -------------------------------------------------------------------------
+
+    def _request(self, method: str, endpoint: str, body: Optional[Dict] = None) -> Dict:
+        """JSON request with retry on 429/5xx and connection errors"""
+        if self.offline:
+            raise GDCOfflineError(f"Offline: cannot query {endpoint}")
+
+        url = f"{self.base_url}/{endpoint}"
+        for attempt in range(MAX_RETRIES):
+            self.network_calls += 1
+            try:
+                if method == 'POST':
+                    response = requests.post(url, json=body, timeout=REQUEST_TIMEOUT)
+                else:
+                    response = requests.get(url, timeout=REQUEST_TIMEOUT)
+                if response.status_code not in RETRYABLE_STATUS:
+                    response.raise_for_status()
+                    return response.json()
+                error = requests.HTTPError(f"HTTP {response.status_code} for {url}")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt == MAX_RETRIES - 1:
+                raise error
+            time.sleep(2 ** attempt)
+
+    def data_release(self) -> Optional[str]:
+        """Current GDC data release (from /status)"""
+        return self._request('GET', 'status').get('data_release')
+
+    def _page(self, endpoint: str, body: Dict, start: int, size: int) -> Dict:
+        return self._request('POST', endpoint, {**body, 'from': start, 'size': size})['data']
+
+    def _fetch_all(self, endpoint: str, body: Dict, max_results: Optional[int]) -> Dict:
+        """All pages of a query, in order"""
+        page_size = self.page_size if max_results is None else min(self.page_size, max_results)
+        first = self._page(endpoint, body, 0, page_size)
+        total = first['pagination']['total']
+        wanted = total if max_results is None else min(total, max_results)
+
+        offsets = list(range(len(first['hits']), wanted, page_size))
+        with ThreadPoolExecutor(max_workers=self.page_workers) as executor:
+            pages = list(executor.map(
+                lambda start: self._page(endpoint, body, start, min(page_size, wanted - start)),
+                offsets))
+
+        hits = first['hits'] + [hit for page in pages for hit in page['hits']]
+        return {'hits': hits[:wanted], 'total': total}
+
+    # -------------------------------------------------------------------------
+    # Cache
+    # -------------------------------------------------------------------------
+
+    def _cache_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _load(self, key: str) -> Optional[Dict]:
+        try:
+            with open(self._cache_path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('version') != CACHE_FORMAT_VERSION or content_hash(entry['hits']) != entry['content_hash']:
+            return None
+        return entry
+
+    def _save(self, key: str, entry: Dict):
+        path = self._cache_path(key)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+
+    def _validators(self, endpoint: str, body: Dict) -> Dict:
+        """Cheap fingerprint of a query result: data release + hit total"""
+        return {
+            'data_release': self.data_release(),
+            'total': self._page(endpoint, body, 0, 0)['pagination']['total']
+        }
+
+    # -------------------------------------------------------------------------
+    # Queries
+    # -------------------------------------------------------------------------
+
+    def query(self, endpoint: str, filters: Optional[Dict] = None,
+              fields: Optional[Sequence[str]] = None, expand: Optional[Sequence[str]] = None,
+              sort: Optional[str] = None, max_results: Optional[int] = None,
+              refresh: bool = False) -> List[Dict]:
+        """
+        Query a GDC endpoint (all pages), served from cache when possible
+
+        Args:
+            endpoint: 'files', 'cases', ...
+            filters: GDC filter object
+            fields: Fields to return (None: endpoint defaults)
+            expand: Field groups to expand
+            sort: Sort order (default: by ID, for stable pages)
+            max_results: Stop after this many hits
+            refresh: Ignore the cache
+
+        Returns:
+            List of hits
+        """
+        body = {'format': 'JSON', 'sort': sort or DEFAULT_SORT.get(endpoint, '')}
+        if filters:
+            body['filters'] = filters
+        if fields:
+            body['fields'] = ','.join(fields)
+        if expand:
+            body['expand'] = ','.join(expand)
+
+        request = {'endpoint': endpoint, 'body': body, 'max_results': max_results}
+        key = hashlib.sha256(f"{self.base_url}|{canonical_json(request)}".encode()).hexdigest()
+
+        cached = None if refresh else self._load(key)
+        if cached is not None:
+            if self.offline or time.time() - cached['fetched'] < self.ttl:
+                return cached['hits']
+            try:
+                if self._validators(endpoint, body) == cached['validators']:
+                    cached['fetched'] = time.time()
+                    self._save(key, cached)
+                    return cached['hits']
+            except (requests.RequestException, GDCOfflineError) as e:
+                print(f"  [WARN] GDC revalidation failed ({e}); using cached {endpoint} results")
+                return cached['hits']
+
+        validators = {'data_release': self.data_release()}
+        result = self._fetch_all(endpoint, body, max_results)
+        validators['total'] = result['total']
+
+        self._save(key, {
+            'version': CACHE_FORMAT_VERSION,
+            'request': request,
+            'fetched': time.time(),
+            'validators': validators,
+            'content_hash': content_hash(result['hits']),
+            'hits': result['hits']
+        })
+        return result['hits']
+
+# =============================================================================
+# Manifest
+# =============================================================================
+
+def write_manifest(hits: List[Dict], output_path: Union[str, Path]) -> Path:
+    """
+    Write file hits as a GDC manifest (sorted by file_id)
+
+    The format is the one gdc-client and gdc_downloader.read_gdc_manifest read.
+
+    Args:
+        hits: /files hits with file_id, file_name, md5sum, file_size (state optional)
+        output_path: Manifest path
+
+    Returns:
+        Manifest path
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w') as f:
+        f.write("id\tfilename\tmd5\tsize\tstate\n")
+        for hit in sorted(hits, key=lambda h: h['file_id']):
+            f.write(f"{hit['file_id']}\t{hit.get('file_name', '')}\t{hit.get('md5sum', '')}\t"
+                    f"{hit.get('file_size', '')}\t{hit.get('state', 'released')}\n")
+    return output_path
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Resumable GDC Bulk Downloader
+Concurrent, resumable, integrity-checked downloads from the GDC data endpoint
+
+Features:
+- asyncio scheduling with bounded concurrency (blocking HTTP runs in worker
+  threads with one requests.Session per thread)
+- Resume of partial files via HTTP Range (<file>.part is kept across runs)
+- md5 verification against the GDC manifest (md5sum / file_size)
+- Adaptive rate limiting: 429/5xx halve the allowed concurrency and pause
+  (Retry-After honoured); successes grow it back one slot at a time
+
+The data endpoint is configurable, so the downloader can be exercised
+against a local stand-in HTTP server.
+
+Usage:
+    from gdc_downloader import download_files, read_gdc_manifest
+    entries = read_gdc_manifest("gdc_manifest.txt")
+    summary = download_files(entries, Path("data/tcga_raw/TCGA-LUAD"))
+
+Author: Automated Pipeline
+Date: 2025-11-02
+"""
+
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+import requests
+
+GDC_DATA_ENDPOINT = "https://api.gdc.cancer.gov/data"
+
+CHUNK_SIZE = 1 << 20          # 1 MB reads
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RETRIES = 5
+REQUEST_TIMEOUT = (10, 120)   # (connect, read) seconds
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+PART_SUFFIX = ".part"
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# =============================================================================
+# Manifest
+# =============================================================================
+
+def read_gdc_manifest(manifest_path: Union[str, Path]) -> List[Dict]:
+    """
+    Read a GDC manifest (tab-separated: id, filename, md5, size[, state])
+
+    Args:
+        manifest_path: Manifest file path
+
+    Returns:
+        List of entries with file_id, file_name, md5sum, file_size
+    """
+    entries = []
+    with open(manifest_path) as f:
+        header = f.readline().rstrip('\n').split('\t')
+        for line in f:
+            if not line.strip():
+                continue
+            row = dict(zip(header, line.rstrip('\n').split('\t')))
+            entries.append({
+                'file_id': row['id'],
+                'file_name': row.get('filename', row['id']),
+                'md5sum': row.get('md5') or None,
+                'file_size': int(row['size']) if row.get('size') else None
+            })
+    return entries
+
+def md5_file(path: Path) -> str:
+    """md5 of a file's content"""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# =============================================================================
+# Adaptive Rate Limiter
+# =============================================================================
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that backs off on throttling and recovers on success
+
+    Additive increase / multiplicative decrease: each 429/5xx halves the
+    number of requests allowed in flight and pauses new requests; every
+    success raises the limit by one, up to max_concurrency.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.active = 0
+        self.paused_until = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            while True:
+                delay = self.paused_until - time.monotonic()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self.active < self.limit:
+                    self.active += 1
+                    return
+                await self._cond.wait()
+
+    async def release(self, throttled: bool = False, retry_after: Optional[float] = None):
+        async with self._cond:
+            self.active -= 1
+            if throttled:
+                self.limit = max(1, self.limit // 2)
+                pause = retry_after if retry_after is not None else BACKOFF_BASE
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            elif self.limit < self.max_concurrency:
+                self.limit += 1
+            self._cond.notify_all()
+
+# =============================================================================
+# Single-file Transfer (runs in a worker thread)
+# =============================================================================
+
+class TransferError(Exception):
+    """Download attempt failed; retryable unless stated otherwise"""
+
+    def __init__(self, message: str, status: Optional[int] = None,
+                 retry_after: Optional[float] = None, retryable: bool = True):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.retryable = retryable
+
+_THREAD_STATE = threading.local()
+
+def _session() -> requests.Session:
+    if not hasattr(_THREAD_STATE, 'session'):
+        _THREAD_STATE.session = requests.Session()
+    return _THREAD_STATE.session
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    value = response.headers.get('Retry-After')
+    try:
+        return min(float(value), BACKOFF_MAX) if value is not None else None
+    except ValueError:
+        return None
+
+def _fetch_to_part(url: str, part_path: Path, expected_size: Optional[int]) -> int:
+    """
+    Fetch url into part_path, resuming from its current size
+
+    Args:
+        url: File URL
+        part_path: Partial file (appended to on 206, rewritten on 200)
+        expected_size: Full size if known
+
+    Returns:
+        Bytes received in this attempt
+
+    Raises:
+        TransferError: On HTTP or connection errors
+    """
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    if expected_size is not None and offset >= expected_size:
+        if offset == expected_size:
+            return 0
+        part_path.unlink()
+        offset = 0
+
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+    try:
+        with _session().get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            if response.status_code == 416:
+                # Nothing left to send: the partial file is complete (or stale)
+                return 0
+            if response.status_code in RETRYABLE_STATUS:
+                raise TransferError(f"HTTP {response.status_code}", response.status_code,
+                                    _retry_after(response))
+            if response.status_code not in (200, 206):
+                raise TransferError(f"HTTP {response.status_code}", response.status_code,
+                                    retryable=False)
+
+            mode = 'ab' if response.status_code == 206 else 'wb'
+            received = 0
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    received += len(chunk)
+            return received
+    except requests.RequestException as e:
+        raise TransferError(f"{type(e).__name__}: {e}")
+
+# =============================================================================
+# Downloader
+# =============================================================================
+
+class GDCDownloader:
+    """
+    Concurrent resumable downloader for GDC file entries
+
+    Each entry needs file_id and file_name; md5sum and file_size enable
+    integrity checks and skip-if-complete.
+    """
+
+    def __init__(self, output_dir: Union[str, Path], base_url: str = GDC_DATA_ENDPOINT,
+                 max_concurrency: int = DEFAULT_CONCURRENCY, max_retries: int = DEFAULT_RETRIES,
+                 progress: Optional[Callable[[Dict], None]] = None):
+        """
+        Args:
+            output_dir: Destination directory
+            base_url: Data endpoint (file URL = base_url/file_id)
+            max_concurrency: Maximum simultaneous transfers
+            max_retries: Attempts per file for retryable errors
+            progress: Optional callback receiving each file result
+        """
+        self.output_dir = Path(output_dir)
+        self.base_url = base_url.rstrip('/')
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.progress = progress
+        self.stats = {'downloaded': 0, 'skipped': 0, 'failed': 0, 'bytes': 0}
+
+    def _verify(self, path: Path, entry: Dict) -> bool:
+        """Size and md5 check against the manifest (missing fields are not checked)"""
+        if entry.get('file_size') is not None and path.stat().st_size != int(entry['file_size']):
+            return False
+        if entry.get('md5sum'):
+            return md5_file(path) == entry['md5sum']
+        return True
+
+    async def _download_one(self, entry: Dict, limiter: AdaptiveLimiter) -> Dict:
+        dest = self.output_dir / entry['file_name']
+        part = dest.with_name(dest.name + PART_SUFFIX)
+        result = {'file_id': entry['file_id'], 'file': entry['file_name']}
+
+        if dest.exists() and (entry.get('md5sum') or entry.get('file_size') is not None):
+            if await asyncio.to_thread(self._verify, dest, entry):
+                return {**result, 'status': 'skipped'}
+            dest.rename(part)   # Treat a bad existing file as partial
+        elif dest.exists():
+            return {**result, 'status': 'skipped'}
+
+        url = f"{self.base_url}/{entry['file_id']}"
+        received = 0
+        for attempt in range(self.max_retries):
+            await limiter.acquire()
+            throttled, retry_after = False, None
+            try:
+                received += await asyncio.to_thread(_fetch_to_part, url, part,
+                                                    entry.get('file_size'))
+            except TransferError as e:
+                throttled = e.status in RETRYABLE_STATUS
+                retry_after = e.retry_after
+                if not e.retryable or attempt == self.max_retries - 1:
+                    await limiter.release(throttled, retry_after)
+                    return {**result, 'status': 'failed', 'error': str(e), 'bytes': received}
+                await limiter.release(throttled, retry_after)
+                if not throttled:
+                    delay = min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX)
+                    await asyncio.sleep(delay * (0.5 + random.random()))
+                continue
+            await limiter.release()
+
+            if await asyncio.to_thread(self._verify, part, entry):
+                part.replace(dest)
+                return {**result, 'status': 'downloaded', 'bytes': received}
+
+            # Corrupt or over-long partial: start over
+            part.unlink(missing_ok=True)
+
+        return {**result, 'status': 'failed', 'error': 'integrity check failed', 'bytes': received}
+
+    async def download_async(self, entries: List[Dict]) -> Dict:
+        """
+        Download all entries concurrently
+
+        Args:
+            entries: File entries (file_id, file_name, md5sum, file_size)
+
+        Returns:
+            Summary with downloaded/skipped/failed counts, bytes and per-file results
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        limiter = AdaptiveLimiter(self.max_concurrency)
+        results = []
+
+        async def run(entry):
+            outcome = await self._download_one(entry, limiter)
+            self.stats[outcome['status']] += 1
+            self.stats['bytes'] += outcome.get('bytes', 0)
+            results.append(outcome)
+            if self.progress is not None:
+                self.progress(outcome)
+
+        await asyncio.gather(*(run(entry) for entry in entries))
+        return {**self.stats, 'results': results}
+
+    def download(self, entries: List[Dict]) -> Dict:
+        """Blocking wrapper around download_async"""
+        return asyncio.run(self.download_async(entries))
+
+def download_files(entries: List[Dict], output_dir: Union[str, Path],
+                   base_url: str = GDC_DATA_ENDPOINT,
+                   max_concurrency: int = DEFAULT_CONCURRENCY,
+                   max_retries: int = DEFAULT_RETRIES,
+                   progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """
+    Download GDC files concurrently with resume and md5 checks
+
+    Args:
+        entries: File entries (file_id, file_name, md5sum, file_size)
+        output_dir: Destination directory
+        base_url: Data endpoint
+        max_concurrency: Maximum simultaneous transfers
+        max_retries: Attempts per file
+        progress: Optional per-file callback
+
+    Returns:
+        Summary dict (see GDCDownloader.download_async)
+    """
+    downloader = GDCDownloader(output_dir, base_url, max_concurrency, max_retries, progress)
+    return downloader.download(entries)
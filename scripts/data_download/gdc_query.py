@@ -2,23 +2,16 @@
 """Minimal GDC API query to fetch case/clinical metadata for cohorts and save as CSV.
 Docs: https://gdc.cancer.gov/developers/gdc-application-programming-interface-api
 """
-import argparse, requests, os, pandas as pd, sys, json
+import argparse, os, pandas as pd, sys
+from gdc_client import GDCClient
 
-API = "https://api.gdc.cancer.gov"
-
-def cases(project_code):
-    url = f"{API}/cases"
+def cases(project_code, client=None):
+    client = client or GDCClient()
     filters = {
         "op": "in",
         "content": {"field": "project.project_id", "value": [f"TCGA-{project_code}"]}
     }
-    params = {
-        "filters": json.dumps(filters),
-        "size": "10000"
-    }
-    r = requests.get(url, params=params)
-    r.raise_for_status()
-    hits = r.json().get("data", {}).get("hits", [])
+    hits = client.query("cases", filters)
     return pd.json_normalize(hits)
 
 def main():
@@ -27,10 +20,11 @@ def main():
     ap.add_argument("--out", default="outputs/tcga")
     args = ap.parse_args()
     os.makedirs(args.out, exist_ok=True)
+    client = GDCClient()
     frames = []
     for cohort in args.cohorts:
         try:
-            df = cases(cohort)
+            df = cases(cohort, client)
             df["cohort"] = cohort
             frames.append(df)
         except Exception as e:
@@ -13,13 +13,15 @@ Date: 2025-11-02
 
 import os
 import sys
-import json
-import requests
 import pandas as pd
 import subprocess
 from pathlib import Path
 from typing import List, Dict
-import time
+
+# Shared GDC metadata client (cached, paginated) and resumable downloader
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "data_download"))
+from gdc_client import GDC_API, GDCClient
+from gdc_downloader import download_files
 
 # =============================================================================
 # Configuration
@@ -40,18 +42,22 @@ PROJECTS = {
     'TCGA-SKCM': 'Skin Cutaneous Melanoma'
 }
 
-# GDC API endpoints
-GDC_API = "https://api.gdc.cancer.gov"
-FILES_ENDPOINT = f"{GDC_API}/files"
-CASES_ENDPOINT = f"{GDC_API}/cases"
+# GDC API endpoints (GDC_API honours GDC_API_URL, e.g. for a local mock)
+DATA_ENDPOINT = f"{GDC_API}/data"
+
+# Metadata queries are cached on disk; re-runs need no network calls
+GDC_CLIENT = GDCClient(GDC_API)
+
+# Concurrent direct-HTTP transfers (throttled down automatically on 429/5xx)
+DOWNLOAD_CONCURRENCY = int(os.environ.get('GDC_DOWNLOAD_CONCURRENCY', '8'))
 
 # =============================================================================
 # Step 1: Query GDC for Files
 # =============================================================================
 
-def query_gdc_files(project_id: str, data_category: str, data_type: str) -> List[str]:
+def query_gdc_file_entries(project_id: str, data_category: str, data_type: str) -> List[Dict]:
     """
-    Query GDC API for file UUIDs
+    Query GDC API for file records (UUID, name, md5, size)
 
     Args:
         project_id: TCGA project ID (e.g., 'TCGA-LUAD')
@@ -59,7 +65,7 @@ def query_gdc_files(project_id: str, data_category: str, data_type: str) -> List
         data_type: 'Gene Expression Quantification' or 'Clinical Supplement'
 
     Returns:
-        List of file UUIDs
+        List of file records (file_id, file_name, md5sum, file_size)
     """
     print(f"\n[QUERY] {project_id} - {data_category}")
 
@@ -82,25 +88,30 @@ def query_gdc_files(project_id: str, data_category: str, data_type: str) -> List
             }
         })
 
-    params = {
-        "filters": json.dumps(filters),
-        "fields": "file_id,file_name,cases.submitter_id,file_size",
-        "format": "JSON",
-        "size": "10000"  # Max results
-    }
+    hits = GDC_CLIENT.query(
+        "files", filters,
+        fields=["file_id", "file_name", "cases.submitter_id", "file_size", "md5sum"]
+    )
 
-    response = requests.get(FILES_ENDPOINT, params=params)
-    response.raise_for_status()
+    total_size_gb = sum(hit["file_size"] for hit in hits) / (1024**3)
 
-    data = response.json()
-    hits = data["data"]["hits"]
+    print(f"  Found {len(hits)} files ({total_size_gb:.2f} GB)")
 
-    file_ids = [hit["file_id"] for hit in hits]
-    total_size_gb = sum(hit["file_size"] for hit in hits) / (1024**3)
+    return hits
+
+def query_gdc_files(project_id: str, data_category: str, data_type: str) -> List[str]:
+    """
+    Query GDC API for file UUIDs
 
-    print(f"  Found {len(file_ids)} files ({total_size_gb:.2f} GB)")
+    Args:
+        project_id: TCGA project ID (e.g., 'TCGA-LUAD')
+        data_category: 'Transcriptome Profiling' or 'Clinical'
+        data_type: 'Gene Expression Quantification' or 'Clinical Supplement'
 
-    return file_ids
+    Returns:
+        List of file UUIDs
+    """
+    return [hit["file_id"] for hit in query_gdc_file_entries(project_id, data_category, data_type)]
 
 # =============================================================================
 # Step 2: Download Files Using GDC Client
@@ -168,39 +179,22 @@ def download_with_gdc_client(file_ids: List[str], output_dir: Path) -> bool:
 # Step 3: Alternative - Direct HTTP Download (No GDC Client Needed)
 # =============================================================================
 
-def download_file_direct(file_id: str, output_path: Path) -> bool:
-    """
-    Download single file via HTTP (fallback method)
-
-    Args:
-        file_id: File UUID
-        output_path: Output file path
-
-    Returns:
-        Success status
-    """
-    url = f"https://api.gdc.cancer.gov/data/{file_id}"
-
-    try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-
-        return True
-    except Exception as e:
-        print(f"  [ERROR] Failed to download {file_id}: {e}")
-        return False
+def report_download(result: Dict):
+    """Print one line per finished file"""
+    status = {'downloaded': '[OK]', 'skipped': '[SKIP]', 'failed': '[FAIL]'}[result['status']]
+    detail = f" ({result['error']})" if result['status'] == 'failed' else ''
+    print(f"  {status} {result['file']}{detail}")
 
-def download_all_direct(file_ids: List[str], output_dir: Path,
+def download_all_direct(files: List[Dict], output_dir: Path,
                        project_id: str) -> bool:
     """
     Download all files via direct HTTP
 
+    Files are fetched concurrently; interrupted transfers resume from the
+    partial file on the next run and every file is md5-checked.
+
     Args:
-        file_ids: List of file UUIDs
+        files: File records from query_gdc_file_entries
         output_dir: Output directory
         project_id: Project ID for subfolder
 
@@ -208,32 +202,17 @@ def download_all_direct(file_ids: List[str], output_dir: Path,
         Success status
     """
     project_dir = output_dir / project_id
-    project_dir.mkdir(parents=True, exist_ok=True)
-
-    print(f"\n[DOWNLOAD] Starting direct HTTP download of {len(file_ids)} files...")
-
-    success_count = 0
-    for i, file_id in enumerate(file_ids, 1):
-        print(f"  [{i}/{len(file_ids)}] Downloading {file_id}...", end='')
-
-        output_file = project_dir / f"{file_id}.tsv"
-
-        if output_file.exists():
-            print(" [SKIP] Already exists")
-            success_count += 1
-            continue
 
-        if download_file_direct(file_id, output_file):
-            print(" [OK]")
-            success_count += 1
-        else:
-            print(" [FAIL]")
+    print(f"\n[DOWNLOAD] Starting direct HTTP download of {len(files)} files...")
 
-        # Rate limiting
-        time.sleep(0.5)
+    entries = [{**hit, 'file_name': f"{hit['file_id']}.tsv"} for hit in files]
+    summary = download_files(entries, project_dir, base_url=DATA_ENDPOINT,
+                             max_concurrency=DOWNLOAD_CONCURRENCY, progress=report_download)
 
-    print(f"\n[COMPLETE] Downloaded {success_count}/{len(file_ids)} files")
-    return success_count == len(file_ids)
+    success_count = summary['downloaded'] + summary['skipped']
+    print(f"\n[COMPLETE] Downloaded {success_count}/{len(files)} files "
+          f"({summary['bytes'] / 1024**3:.2f} GB transferred)")
+    return summary['failed'] == 0
 
 # =============================================================================
 # Step 4: Download Clinical Data
@@ -261,41 +240,17 @@ def download_clinical_data(project_id: str, output_dir: Path) -> bool:
         ]
     }
 
-    params = {
-        "filters": json.dumps(filters),
-        "fields": "file_id,file_name",
-        "format": "JSON",
-        "size": "10000"
-    }
-
-    response = requests.get(FILES_ENDPOINT, params=params)
-    data = response.json()
-
-    clinical_files = data["data"]["hits"]
+    clinical_files = GDC_CLIENT.query(
+        "files", filters, fields=["file_id", "file_name", "file_size", "md5sum"]
+    )
     print(f"  Found {len(clinical_files)} clinical files")
 
-    # Download each file
+    # Download all files (existing, verified files are skipped)
     clinical_dir = output_dir / f"{project_id}_clinical"
-    clinical_dir.mkdir(parents=True, exist_ok=True)
-
-    for i, file_info in enumerate(clinical_files, 1):
-        file_id = file_info["file_id"]
-        file_name = file_info["file_name"]
-
-        print(f"  [{i}/{len(clinical_files)}] {file_name}...", end='')
+    summary = download_files(clinical_files, clinical_dir, base_url=DATA_ENDPOINT,
+                             max_concurrency=DOWNLOAD_CONCURRENCY, progress=report_download)
 
-        output_path = clinical_dir / file_name
-
-        if output_path.exists():
-            print(" [SKIP]")
-            continue
-
-        if download_file_direct(file_id, output_path):
-            print(" [OK]")
-        else:
-            print(" [FAIL]")
-
-    return True
+    return summary['failed'] == 0
 
 # =============================================================================
 # Step 5: Query Summary
@@ -364,7 +319,7 @@ def main():
     # Ask user for download method
     print("\n[STEP 2] Choose download method:")
     print("  1. GDC Client (faster, recommended)")
-    print("  2. Direct HTTP (slower, no install needed)")
+    print("  2. Direct HTTP (resumable, no install needed)")
     print("  3. Skip download (query only)")
 
     if auto_mode:
@@ -384,7 +339,7 @@ def main():
         print(f"\n--- {project_id} ---")
 
         # Query files
-        rna_files = query_gdc_files(
+        rna_files = query_gdc_file_entries(
             project_id,
             "Transcriptome Profiling",
             "Gene Expression Quantification"
@@ -396,7 +351,7 @@ def main():
 
         # Download
         if choice == '1':
-            success = download_with_gdc_client(rna_files, DATA_DIR / project_id)
+            success = download_with_gdc_client([f["file_id"] for f in rna_files], DATA_DIR / project_id)
         else:
             success = download_all_direct(rna_files, DATA_DIR, project_id)
 
@@ -4,19 +4,30 @@ Process TCGA RNA-seq Expression Data
 Combines individual HTSeq count files into expression matrix
 
 Input: Raw TCGA HTSeq files
-Output: Normalized expression matrix (samples x genes)
+Output: Normalized expression matrix (samples x genes), written as a
+        columnar store (expression_store.py) plus an optional CSV export
+        Per-sample QC metrics (normalized/<project>_sample_qc.csv)
 
 Author: Automated Pipeline
 Date: 2025-11-02
 """
 
 import os
+import gzip
+import hashlib
+import argparse
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
 import re
 
+from expression_store import (ExpressionStore, append_expression_store, is_store,
+                              store_path_for, write_expression_array, write_expression_store)
+from gene_index import DEFAULT_INDEX_PATH, GeneIndex, find_annotation_source, load_gene_index
+
 # =============================================================================
 # Configuration
 # =============================================================================
@@ -25,14 +36,35 @@ BASE_DIR = Path(__file__).parent.parent.parent
 DATA_DIR = BASE_DIR / "data" / "tcga_raw"
 OUTPUT_DIR = BASE_DIR / "outputs" / "tcga_full_cohort_real"
 
+# Per-project raw counts + ingest manifests, and cached normalized matrices
+RAW_DIR = OUTPUT_DIR / "raw_counts"
+NORM_DIR = OUTPUT_DIR / "normalized"
+
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+RAW_DIR.mkdir(parents=True, exist_ok=True)
+NORM_DIR.mkdir(parents=True, exist_ok=True)
+
+MANIFEST_COLUMNS = ['path', 'sample_id', 'size', 'mtime_ns', 'md5']
 
 PROJECTS = ['TCGA-LUAD', 'TCGA-LUSC', 'TCGA-SKCM']
 
+# Raw count storage: float64 keeps missing genes as NaN; float32 is exact up
+# to 2^24 counts; uint32 stores genes missing from a file as 0
+COUNT_DTYPES = ['float64', 'float32', 'uint32']
+
 # =============================================================================
 # Step 1: Read Individual HTSeq Files
 # =============================================================================
 
+def _sniff_header(file_path: Path) -> List[str]:
+    """Return the first non-comment line of a (possibly gzipped) count file, split on tabs"""
+    opener = gzip.open if file_path.suffix == '.gz' else open
+    with opener(file_path, 'rt') as f:
+        for line in f:
+            if not line.startswith('#'):
+                return line.rstrip('\n').split('\t')
+    return []
+
 def read_htseq_file(file_path: Path) -> pd.Series:
     """
     Read single HTSeq count file
@@ -45,305 +77,624 @@ def read_htseq_file(file_path: Path) -> pd.Series:
     ENSG00000000005.6     56
     ...
 
+    The header is sniffed first so the file is parsed exactly once, reading
+    only the gene ID and count columns.
+
     Args:
         file_path: Path to HTSeq file
 
     Returns:
         Series with gene IDs as index, counts as values
     """
-    # Read file and check format
-    df = pd.read_csv(file_path, sep='\t', comment='#')  # Skip comment lines
+    header = _sniff_header(file_path)
 
-    # Check if it's the new TCGA format (has columns)
-    if 'gene_id' in df.columns and 'unstranded' in df.columns:
+    if 'gene_id' in header and 'unstranded' in header:
         # New format: use gene_id and unstranded columns
-        df = df[['gene_id', 'unstranded']].copy()
-        df.columns = ['gene_id', 'count']
-        df = df.set_index('gene_id')
-    elif df.shape[1] == 2 and df.columns[0] != 'gene_id':
-        # Old format without header
-        df.columns = ['gene_id', 'count']
-        df = df.set_index('gene_id')
+        df = pd.read_csv(file_path, sep='\t', comment='#',
+                         usecols=['gene_id', 'unstranded'], index_col='gene_id')
     else:
-        # Try to handle as old format
-        df = pd.read_csv(file_path, sep='\t', header=None,
-                        names=['gene_id', 'count'], index_col=0)
+        # Old format without header
+        df = pd.read_csv(file_path, sep='\t', header=None, usecols=[0, 1],
+                         names=['gene_id', 'count'], index_col=0)
+    counts = df.iloc[:, 0].rename('count')
 
     # Remove summary statistics lines (N_unmapped, N_multimapping, N_noFeature, __)
-    df = df[~df.index.str.startswith('N_')]
-    df = df[~df.index.str.startswith('__')]
+    keep = ~(counts.index.str.startswith('N_') | counts.index.str.startswith('__'))
+    counts = counts[keep]
 
     # Extract Ensembl ID without version
-    df.index = df.index.str.split('.').str[0]
-
-    return df['count']
-
-def process_project_expression(project_id: str) -> pd.DataFrame:
-    """
-    Process all HTSeq files for a project
+    counts.index = counts.index.str.split('.').str[0]
 
-    Args:
-        project_id: TCGA project ID (e.g., 'TCGA-LUAD')
+    # PAR_Y copies collapse onto the same stable ID; keep the primary entry
+    return counts[~counts.index.duplicated(keep='first')]
 
-    Returns:
-        Expression DataFrame (genes x samples)
-    """
-    project_dir = DATA_DIR / project_id
-    print(f"\n[PROCESS] {project_id}")
+def find_count_files(project_dir: Path) -> List[Path]:
+    """All HTSeq/STAR count files under a project directory"""
+    return list(project_dir.glob("**/*htseq.counts.gz")) + \
+           list(project_dir.glob("**/*htseq.counts")) + \
+           list(project_dir.glob("**/*.tsv"))
 
-    if not project_dir.exists():
-        print(f"  [ERROR] Directory not found: {project_dir}")
-        return pd.DataFrame()
+# Gene index shared by ingestion workers (set once per process by the initializer)
+_WORKER_GENE_INDEX = None
 
-    # Find all HTSeq files
-    htseq_files = list(project_dir.glob("**/*htseq.counts.gz")) + \
-                  list(project_dir.glob("**/*htseq.counts")) + \
-                  list(project_dir.glob("**/*.tsv"))
+def _init_ingest_worker(gene_index: pd.Index):
+    global _WORKER_GENE_INDEX
+    _WORKER_GENE_INDEX = gene_index
 
-    if not htseq_files:
-        print(f"  [WARN] No HTSeq files found in {project_dir}")
-        return pd.DataFrame()
+def _read_aligned_counts(file_path: Path) -> np.ndarray:
+    """Read one count file and align it to the shared gene index"""
+    counts = read_htseq_file(file_path)
+    if not counts.index.equals(_WORKER_GENE_INDEX):
+        counts = counts.reindex(_WORKER_GENE_INDEX)
+    return counts.to_numpy(dtype=np.float64)
 
-    print(f"  Found {len(htseq_files)} files")
+def ingest_count_files(files: List[Path], n_workers: int = 1,
+                       gene_index: Optional[pd.Index] = None, dtype: str = 'float64'):
+    """
+    Parse count files into a preallocated samples x genes array
 
-    # Read all files
-    expression_dict = {}
+    The gene index is fixed up front (by default from the first readable
+    file). Files are parsed in a process pool; at most a few results per
+    worker are in flight, so peak memory is the output array plus a bounded
+    number of vectors.
 
-    for i, file_path in enumerate(htseq_files, 1):
-        if i % 50 == 0:
-            print(f"  Processing: {i}/{len(htseq_files)}")
+    Args:
+        files: Count files (sample ID = parent directory name)
+        n_workers: Worker processes (1 = parse in this process)
+        gene_index: Fixed gene index (e.g. from an existing raw count store)
+        dtype: Matrix dtype (one of COUNT_DTYPES)
 
+    Returns:
+        (parsed_files, gene_index, matrix) for successfully parsed files
+    """
+    if gene_index is None:
+        for file_path in files:
+            try:
+                gene_index = read_htseq_file(file_path).index
+                break
+            except Exception as e:
+                print(f"  [ERROR] Failed to read {file_path.name}: {e}")
+    if gene_index is None:
+        return [], pd.Index([]), np.empty((0, 0))
+
+    integer = np.issubdtype(np.dtype(dtype), np.integer)
+    matrix = np.full((len(files), len(gene_index)), 0 if integer else np.nan, dtype=dtype)
+    parsed = np.zeros(len(files), dtype=bool)
+
+    def store(row, result_fn):
         try:
-            # Extract sample ID from file path
-            # Usually in format: /path/to/TCGA-XX-XXXX-XXA/file.tsv
-            sample_id = file_path.parent.name
-
-            counts = read_htseq_file(file_path)
-            expression_dict[sample_id] = counts
-
+            counts = result_fn()
+            matrix[row] = np.nan_to_num(counts, nan=0.0) if integer else counts
+            parsed[row] = True
         except Exception as e:
-            print(f"  [ERROR] Failed to read {file_path.name}: {e}")
-            continue
-
-    # Combine into DataFrame
-    expr_df = pd.DataFrame(expression_dict)
-    print(f"  Created matrix: {expr_df.shape[0]} genes x {expr_df.shape[1]} samples")
-
-    return expr_df
-
-# =============================================================================
-# Step 2: Gene ID Conversion (Ensembl to Symbol)
-# =============================================================================
-
-def get_gene_symbol_mapping() -> Dict[str, str]:
+            print(f"  [ERROR] Failed to read {files[row].name}: {e}")
+        if (row + 1) % 50 == 0:
+            print(f"  Processing: {parsed.sum()}/{len(files)}")
+
+    if n_workers <= 1:
+        _init_ingest_worker(gene_index)
+        for row, file_path in enumerate(files):
+            store(row, lambda: _read_aligned_counts(file_path))
+    else:
+        window = 4 * n_workers
+        todo = iter(enumerate(files))
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_ingest_worker,
+                                 initargs=(gene_index,)) as executor:
+            pending = {executor.submit(_read_aligned_counts, path): row
+                       for row, path in islice(todo, window)}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    store(pending.pop(future), future.result)
+                for row, path in islice(todo, len(done)):
+                    pending[executor.submit(_read_aligned_counts, path)] = row
+
+    if not parsed.all():
+        matrix = matrix[parsed]
+    parsed_files = [f for f, ok in zip(files, parsed) if ok]
+
+    return parsed_files, gene_index, matrix
+
+def expressed_genes(matrix: np.ndarray, min_count: float, min_fraction: float) -> np.ndarray:
     """
-    Download Ensembl to Gene Symbol mapping
+    Mask of genes with count >= min_count in at least min_fraction of samples
+    (and in at least one sample)
 
-    Uses Ensembl BioMart or local annotation file
+    Args:
+        matrix: Samples x genes counts
+        min_count: Count threshold
+        min_fraction: Fraction of samples that must reach it
 
     Returns:
-        Dict mapping Ensembl ID to gene symbol
+        Boolean mask over genes
     """
-    print("\n[MAPPING] Getting Ensembl to Gene Symbol mapping...")
+    n_needed = max(1, int(np.ceil(min_fraction * matrix.shape[0])))
+    n_expressed = np.zeros(matrix.shape[1], dtype=np.int64)
+    # Row blocks keep the comparison temporary small
+    for start in range(0, matrix.shape[0], 256):
+        n_expressed += (matrix[start:start + 256] >= min_count).sum(axis=0)
+    return n_expressed >= n_needed
+
+def file_fingerprint(file_path: Path) -> Dict:
+    """Manifest entry for one count file: path, sample, size, mtime and MD5"""
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            md5.update(block)
+    stat = file_path.stat()
+    return {
+        'path': file_path.relative_to(DATA_DIR).as_posix(),
+        'sample_id': file_path.parent.name,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'md5': md5.hexdigest()
+    }
+
+def compute_fingerprints(files: List[Path], n_workers: int = 1) -> pd.DataFrame:
+    """Fingerprint files, hashing in parallel"""
+    if n_workers <= 1 or len(files) < 2:
+        entries = [file_fingerprint(f) for f in files]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            entries = list(executor.map(file_fingerprint, files, chunksize=16))
+    return pd.DataFrame(entries, columns=MANIFEST_COLUMNS)
 
-    # Try to download from GENCODE
-    try:
-        import requests
+def diff_manifest(manifest: pd.DataFrame, files: List[Path], n_workers: int = 1):
+    """
+    Compare count files on disk against the ingest manifest
 
-        url = "https://ftp.ebi.ac.uk/pub/databases/gencode/Gencode_human/release_44/gencode.v44.annotation.gtf.gz"
-        print(f"  Downloading from GENCODE...")
+    Size and mtime are checked first; files whose stat changed are re-hashed,
+    so touching a file without changing its content is not a change.
 
-        # This is large (~50MB), consider using cached version
-        mapping_file = DATA_DIR / "gencode_v44_mapping.txt"
+    Args:
+        manifest: Previously ingested files
+        files: Count files currently on disk
+        n_workers: Processes used for re-hashing
 
-        if mapping_file.exists():
-            print(f"  Using cached mapping: {mapping_file}")
-            mapping_df = pd.read_csv(mapping_file, sep='\t')
-        else:
-            print(f"  [WARN] Mapping file not found")
-            print(f"  Using gene IDs as-is")
-            return {}
+    Returns:
+        (new_files, n_stale, manifest) - stale counts changed or removed
+        files; the returned manifest has refreshed size/mtime values
+    """
+    known = manifest.set_index('path')
+    on_disk = {f.relative_to(DATA_DIR).as_posix(): f for f in files}
 
-        # Parse GTF to extract gene_id and gene_name
-        mapping = dict(zip(mapping_df['gene_id'], mapping_df['gene_name']))
-        print(f"  Loaded {len(mapping)} gene mappings")
+    n_stale = len(known.index.difference(list(on_disk)))
+    new_files, recheck = [], []
 
-        return mapping
+    for rel_path, file_path in on_disk.items():
+        if rel_path not in known.index:
+            new_files.append(file_path)
+            continue
+        stat = file_path.stat()
+        entry = known.loc[rel_path]
+        if stat.st_size != entry['size'] or stat.st_mtime_ns != entry['mtime_ns']:
+            recheck.append(file_path)
+
+    if recheck:
+        fresh = compute_fingerprints(recheck, n_workers).set_index('path')
+        n_stale += int((fresh['md5'] != known.loc[fresh.index, 'md5']).sum())
+        known.loc[fresh.index, ['size', 'mtime_ns']] = fresh[['size', 'mtime_ns']]
+
+    return new_files, n_stale, known.reset_index()
+
+def ingest_project_counts(project_id: str, n_workers: int = 1,
+                          incremental: bool = False, count_dtype: str = 'float64',
+                          layout: str = 'dense', min_count: float = 0,
+                          min_fraction: float = 0.0) -> Optional[bool]:
+    """
+    Bring a project's raw count store up to date with its count files
 
-    except Exception as e:
-        print(f"  [ERROR] Failed to get mapping: {e}")
-        return {}
+    Full mode parses every file and rewrites the store. Incremental mode
+    parses only files missing from the manifest and appends them; it falls
+    back to a full rebuild if an ingested file changed or disappeared, or
+    if the store's dtype/layout differ from the requested ones.
 
-def convert_gene_ids(expr_df: pd.DataFrame, mapping: Dict[str, str]) -> pd.DataFrame:
-    """
-    Convert Ensembl IDs to gene symbols
+    With min_count > 0, a full build keeps only genes reaching min_count in
+    at least min_fraction of samples; appends keep the store's gene set.
+    Thresholds within normalize_project's own filter (count >= 1 in
+    MIN_EXPRESSED_FRACTION of samples) leave the normalized matrix unchanged.
 
     Args:
-        expr_df: Expression DataFrame with Ensembl IDs
-        mapping: Ensembl to symbol mapping
+        project_id: TCGA project ID (e.g., 'TCGA-LUAD')
+        n_workers: Parallel parser processes
+        incremental: Append new files instead of rebuilding
+        count_dtype: Raw count dtype (one of COUNT_DTYPES)
+        layout: Raw store layout ('dense' or 'sparse')
+        min_count: Ingest-time gene filter threshold (0 = keep all genes)
+        min_fraction: Fraction of samples that must reach min_count
 
     Returns:
-        Expression DataFrame with gene symbols
+        True if the raw store changed, False if it was already current,
+        None if the project has no count data
     """
-    print("\n[CONVERT] Converting Ensembl IDs to gene symbols...")
-
-    if not mapping:
-        print("  [SKIP] No mapping available, keeping Ensembl IDs")
-        return expr_df
-
-    # Map IDs
-    expr_df.index = expr_df.index.map(lambda x: mapping.get(x, x))
+    project_dir = DATA_DIR / project_id
+    raw_store = RAW_DIR / f"{project_id}.store"
+    manifest_file = RAW_DIR / f"{project_id}_manifest.csv"
+    print(f"\n[PROCESS] {project_id}")
 
-    # Remove genes without symbols (still Ensembl IDs)
-    has_symbol = ~expr_df.index.str.startswith('ENSG')
-    expr_df = expr_df[has_symbol]
+    if not project_dir.exists():
+        print(f"  [ERROR] Directory not found: {project_dir}")
+        return None
 
-    # Handle duplicate symbols (keep first)
-    expr_df = expr_df[~expr_df.index.duplicated(keep='first')]
+    # Find all HTSeq files
+    htseq_files = find_count_files(project_dir)
 
-    print(f"  Final: {expr_df.shape[0]} genes with symbols")
+    if not htseq_files:
+        print(f"  [WARN] No HTSeq files found in {project_dir}")
+        return None
+
+    print(f"  Found {len(htseq_files)} files ({n_workers} workers)")
+
+    append_to = None
+    if incremental and is_store(raw_store) and manifest_file.exists():
+        manifest = pd.read_csv(manifest_file, dtype={'path': str, 'sample_id': str, 'md5': str})
+        new_files, n_stale, manifest = diff_manifest(manifest, htseq_files, n_workers)
+
+        stored = ExpressionStore(raw_store)
+        if n_stale:
+            print(f"  [INCREMENTAL] {n_stale} ingested files changed or removed; full rebuild")
+        elif (stored.meta['dtype'], stored.layout) != (count_dtype, layout):
+            print(f"  [INCREMENTAL] Store is {stored.meta['dtype']}/{stored.layout}, "
+                  f"requested {count_dtype}/{layout}; full rebuild")
+        elif not new_files:
+            manifest.to_csv(manifest_file, index=False)
+            print(f"  [INCREMENTAL] No new files; raw counts are current")
+            return False
+        else:
+            print(f"  [INCREMENTAL] {len(new_files)} new files")
+            htseq_files, append_to = new_files, stored
+
+    parsed_files, gene_index, matrix = ingest_count_files(
+        htseq_files, n_workers, gene_index=append_to.genes if append_to else None,
+        dtype=count_dtype)
+
+    if append_to is None and min_count > 0 and len(parsed_files):
+        keep = expressed_genes(matrix, min_count, min_fraction)
+        print(f"  [FILTER] Keeping {keep.sum()}/{len(keep)} genes "
+              f"(count >= {min_count:g} in >= {min_fraction:.0%} of samples)")
+        gene_index, matrix = gene_index[keep], matrix[:, keep]
+
+    # Sample ID is the parent directory: /path/to/TCGA-XX-XXXX-XXA/file.tsv
+    raw_df = pd.DataFrame(matrix, columns=gene_index, copy=False)
+    raw_df.insert(0, 'sample_id', [f.parent.name for f in parsed_files])
+    fingerprints = compute_fingerprints(parsed_files, n_workers)
+
+    if append_to is not None:
+        append_expression_store(raw_df, raw_store)
+        fingerprints = pd.concat([manifest, fingerprints], ignore_index=True)
+    else:
+        write_expression_store(raw_df, raw_store, layout=layout)
+    fingerprints.to_csv(manifest_file, index=False)
 
-    return expr_df
+    return True
 
 # =============================================================================
-# Step 3: Normalization
+# Step 2: Gene ID Conversion (Ensembl to Symbol)
 # =============================================================================
 
-def normalize_expression(expr_df: pd.DataFrame, method='tpm') -> pd.DataFrame:
+def get_gene_index(project_ids: List[str]) -> Optional[GeneIndex]:
     """
-    Normalize expression counts
+    Load the shared gene index (gene_index.py), building it on first use
+
+    The index is checked against the gene model of the first count file, so
+    a new GENCODE release in the downloads triggers one rebuild.
 
     Args:
-        expr_df: Raw count matrix
-        method: 'tpm' or 'fpkm' or 'log2tpm'
+        project_ids: Projects whose count files define the expected gene model
 
     Returns:
-        Normalized expression DataFrame
+        GeneIndex, or None if no annotated count file is available
     """
-    print(f"\n[NORMALIZE] Normalizing expression ({method})...")
-
-    # Filter low-expression genes
-    # Keep genes expressed (count >= 1) in at least 10% of samples
-    min_samples = int(expr_df.shape[1] * 0.1)
-    expressed = (expr_df >= 1).sum(axis=1) >= min_samples
-    expr_df = expr_df[expressed]
-    print(f"  Filtered to {expr_df.shape[0]} expressed genes")
+    print("\n[MAPPING] Loading Ensembl to gene symbol index...")
 
-    if method == 'tpm':
-        # TPM normalization (if gene lengths available, simplified here)
-        # TPM = (count / length) * 1e6 / sum(count / length)
+    source = None
+    for project_id in project_ids:
+        source = find_annotation_source(DATA_DIR / project_id)
+        if source is not None:
+            break
 
-        # Without gene lengths, use total count normalization
-        total_counts = expr_df.sum(axis=0)
-        expr_df = expr_df / total_counts * 1e6
+    gene_index = load_gene_index(source=source, allow_seed=False)
+    if gene_index is None:
+        print(f"  [WARN] No gene index or annotated count file found")
+        print(f"  Using gene IDs as-is")
+        return None
 
-    elif method == 'log2tpm':
-        # Log2(TPM + 1)
-        total_counts = expr_df.sum(axis=0)
-        expr_df = expr_df / total_counts * 1e6
-        expr_df = np.log2(expr_df + 1)
-
-    print(f"  Range: {expr_df.min().min():.2f} to {expr_df.max().max():.2f}")
-
-    return expr_df
+    print(f"  Loaded {gene_index} from {DEFAULT_INDEX_PATH}")
+    return gene_index
 
-def zscore_normalize(expr_df: pd.DataFrame) -> pd.DataFrame:
+def symbol_columns(gene_ids: pd.Index, gene_index: Optional[GeneIndex]):
     """
-    Z-score normalization (per gene)
+    Positions and symbols of the Ensembl IDs to keep after conversion
 
     Args:
-        expr_df: Expression DataFrame
+        gene_ids: Ensembl IDs (matrix axis)
+        gene_index: Shared gene index (None = keep Ensembl IDs)
 
     Returns:
-        Z-score normalized DataFrame
+        (positions, names) - unmapped IDs are removed and each symbol keeps
+        its canonical Ensembl ID (see GeneIndex)
     """
-    print("\n[Z-SCORE] Normalizing by gene...")
-
-    expr_z = expr_df.T  # Transpose for zscore (works on columns)
-    expr_z = (expr_z - expr_z.mean()) / expr_z.std()
-    expr_z = expr_z.T
+    print("\n[CONVERT] Converting Ensembl IDs to gene symbols...")
 
-    print(f"  Mean: {expr_z.mean().mean():.2f}, Std: {expr_z.std().mean():.2f}")
+    if gene_index is None:
+        print("  [SKIP] No mapping available, keeping Ensembl IDs")
+        return np.arange(len(gene_ids)), np.asarray(gene_ids, dtype=object)
 
-    return expr_z
+    positions, symbols = gene_index.collapse_to_symbols(gene_ids)
+    print(f"  Dropped {len(gene_ids) - len(positions)} unmapped or duplicate-symbol IDs")
+    print(f"  Final: {len(positions)} genes with symbols")
 
-# =============================================================================
-# Step 4: Quality Control
-# =============================================================================
+    return positions, symbols
 
-def quality_control(expr_df: pd.DataFrame, project_id: str) -> pd.DataFrame:
+def convert_gene_ids(expr_df: pd.DataFrame, gene_index: Optional[GeneIndex]) -> pd.DataFrame:
     """
-    Perform quality control
+    Convert Ensembl IDs to gene symbols
 
     Args:
-        expr_df: Expression DataFrame
-        project_id: Project ID
+        expr_df: Expression DataFrame with Ensembl IDs (genes x samples)
+        gene_index: Shared gene index
 
     Returns:
-        QC-passed DataFrame
+        Expression DataFrame with gene symbols
     """
-    print(f"\n[QC] Quality control for {project_id}...")
+    positions, symbols = symbol_columns(expr_df.index, gene_index)
+    if gene_index is None:
+        return expr_df
+    expr_df = expr_df.iloc[positions]
+    expr_df.index = pd.Index(symbols, name=expr_df.index.name)
+    return expr_df
 
-    initial_samples = expr_df.shape[1]
-    initial_genes = expr_df.shape[0]
+# =============================================================================
+# Step 3: Normalization and Quality Control
+# =============================================================================
 
-    # 1. Remove samples with too many zeros
-    zero_fraction = (expr_df == 0).sum(axis=0) / expr_df.shape[0]
-    good_samples = zero_fraction < 0.5
-    expr_df = expr_df.loc[:, good_samples]
-    print(f"  Samples: {initial_samples} -> {expr_df.shape[1]} "
-          f"(removed {initial_samples - expr_df.shape[1]} low-quality)")
+# Matrix elements per chunk of samples (~8 MB of float64 temporaries); the
+# matrix itself is one buffer
+NORMALIZE_CHUNK_ELEMENTS = 1 << 20
+
+MIN_EXPRESSED_FRACTION = 0.1    # Keep genes with count >= 1 in >= 10% of samples
+MAX_ZERO_FRACTION = 0.5         # Remove samples with >= 50% zero genes
+OUTLIER_MADS = 3.0              # Flag samples this many MADs from the median
+
+def mad_outliers(values: np.ndarray, n_mads: float = OUTLIER_MADS) -> np.ndarray:
+    """Flag values more than n_mads median absolute deviations from the median"""
+    median = np.nanmedian(values)
+    mad = 1.4826 * np.nanmedian(np.abs(values - median))
+    if not mad > 0:
+        return np.zeros(len(values), dtype=bool)
+    return np.abs(values - median) > n_mads * mad
+
+def _row_chunks(n_rows: int, chunk_size: int):
+    for start in range(0, n_rows, chunk_size):
+        yield start, min(start + chunk_size, n_rows)
+
+def normalize_project(project_id: str, gene_index: Optional[GeneIndex],
+                      method: str = 'log2tpm', dtype: str = 'float32',
+                      chunk_size: Optional[int] = None):
+    """
+    Normalize, QC and z-score a project's raw counts in one in-place buffer
 
-    # 2. Remove genes with zero variance
-    gene_var = expr_df.var(axis=1)
-    good_genes = gene_var > 0
-    expr_df = expr_df[good_genes]
-    print(f"  Genes: {initial_genes} -> {expr_df.shape[0]} "
-          f"(removed {initial_genes - expr_df.shape[0]} zero-variance)")
+    Raw counts are streamed from the raw store in chunks of samples:
+      1. Gene filter counts and per-sample library size / detected genes
+      2. Expressed genes copied into a samples x genes buffer of `dtype`,
+         converted in place to counts per million (and log2(x + 1)); the
+         per-sample zero fraction is taken in the same pass
+      3. Failing samples compacted out of the buffer; gene mean/variance
+         accumulated in float64; genes z-scored in place and zero-variance
+         genes compacted out
 
-    # 3. Check for outliers (optional)
-    # Use PCA or other methods
+    Peak memory is the buffer plus chunk-sized temporaries, instead of one
+    full copy per step.
 
-    return expr_df
+    Args:
+        project_id: TCGA project ID (e.g., 'TCGA-LUAD')
+        gene_index: Shared gene index (None = keep Ensembl IDs)
+        method: 'tpm' (total-count scaling) or 'log2tpm'
+        dtype: Buffer dtype ('float32' or 'float64')
+        chunk_size: Samples per chunk (default: NORMALIZE_CHUNK_ELEMENTS worth)
+
+    Returns:
+        (expr_df, qc_df) - z-scored samples x genes DataFrame (a view of the
+        buffer) and per-sample QC metrics for all samples
+    """
+    store = ExpressionStore(RAW_DIR / f"{project_id}.store")
+
+    # Re-ingested samples keep the latest copy
+    sample_ids = store.samples['sample_id']
+    sample_pos = np.flatnonzero(~sample_ids.duplicated(keep='last').to_numpy())
+    sample_ids = sample_ids.to_numpy(dtype=object)[sample_pos]
+    n_samples = len(sample_pos)
+
+    gene_pos, gene_names = symbol_columns(store.genes, gene_index)
+    if chunk_size is None:
+        chunk_size = max(1, NORMALIZE_CHUNK_ELEMENTS // max(len(gene_pos), 1))
+
+    print(f"\n[NORMALIZE] Normalizing expression ({method}, {dtype}, "
+          f"{n_samples} samples in chunks of {chunk_size})...")
+
+    # Pass 1: gene filter counts and raw per-sample metrics
+    n_expressed = np.zeros(len(gene_pos), dtype=np.int64)
+    library_size = np.empty(n_samples)
+    detected = np.empty(n_samples, dtype=np.int64)
+    row = 0
+    for _, block in store.iter_sample_chunks(chunk_size, gene_pos, sample_pos):
+        n_expressed += (block >= 1).sum(axis=0)
+        library_size[row:row + len(block)] = np.nansum(block, axis=1, dtype=np.float64)
+        detected[row:row + len(block)] = (block > 0).sum(axis=1)
+        row += len(block)
+
+    expressed = n_expressed >= int(n_samples * MIN_EXPRESSED_FRACTION)
+    kept_pos, gene_names = gene_pos[expressed], gene_names[expressed]
+    print(f"  Filtered to {len(kept_pos)} expressed genes")
+
+    # Pass 2: counts -> CPM (-> log2) in place
+    values = np.empty((n_samples, len(kept_pos)), dtype=dtype)
+    zero_fraction = np.empty(n_samples)
+    low, high = np.inf, -np.inf
+    row = 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for _, block in store.iter_sample_chunks(chunk_size, kept_pos, sample_pos):
+            chunk = values[row:row + len(block)]
+            chunk[...] = block
+            zero_fraction[row:row + len(block)] = (chunk == 0).sum(axis=1) / max(chunk.shape[1], 1)
+            chunk *= (1e6 / np.nansum(chunk, axis=1, dtype=np.float64))[:, None]
+            if method == 'log2tpm':
+                np.log1p(chunk, out=chunk)
+                chunk /= np.log(2)
+            if chunk.size:
+                low, high = min(low, np.nanmin(chunk)), max(high, np.nanmax(chunk))
+            row += len(block)
+    print(f"  Range: {low:.2f} to {high:.2f}")
+
+    print(f"\n[QC] Quality control for {project_id}...")
+
+    # 1. Remove samples with too many zeros (rows moved forward in place)
+    passed = zero_fraction < MAX_ZERO_FRACTION
+    kept_rows = np.flatnonzero(passed)
+    for dst, src in enumerate(kept_rows):
+        if dst != src:
+            values[dst] = values[src]
+    n_kept = len(kept_rows)
+    print(f"  Samples: {n_samples} -> {n_kept} (removed {n_samples - n_kept} low-quality)")
+
+    # 2. Gene mean, variance and range over kept samples (float64 accumulators)
+    n_genes = values.shape[1]
+    total = np.zeros(n_genes)
+    count = np.zeros(n_genes, dtype=np.int64)
+    gene_min = np.full(n_genes, np.inf)
+    gene_max = np.full(n_genes, -np.inf)
+    for start, stop in _row_chunks(n_kept, chunk_size):
+        chunk = values[start:stop]
+        total += np.nansum(chunk, axis=0, dtype=np.float64)
+        count += (~np.isnan(chunk)).sum(axis=0)
+        np.fmin(gene_min, chunk.min(axis=0, initial=np.inf, where=~np.isnan(chunk)), out=gene_min)
+        np.fmax(gene_max, chunk.max(axis=0, initial=-np.inf, where=~np.isnan(chunk)), out=gene_max)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        squares = np.zeros(n_genes)
+        for start, stop in _row_chunks(n_kept, chunk_size):
+            deviation = values[start:stop] - mean
+            deviation *= deviation
+            squares += np.nansum(deviation, axis=0)
+        variance = squares / (count - 1)
+
+    # Remove genes with zero variance (constant across samples, checked exactly
+    # rather than through a rounding-prone variance)
+    good_genes = np.flatnonzero((gene_max > gene_min) & (count > 1))
+    print(f"  Genes: {n_genes} -> {len(good_genes)} (removed {n_genes - len(good_genes)} zero-variance)")
+
+    # 3. Z-score kept genes, compacting them to the front of each row
+    print("\n[Z-SCORE] Normalizing by gene...")
+    center, scale = mean[good_genes], np.sqrt(variance[good_genes])
+    sample_mean = np.empty(n_kept)
+    sample_std = np.empty(n_kept)
+    for start, stop in _row_chunks(n_kept, chunk_size):
+        z = values[start:stop, good_genes] - center
+        z /= scale
+        values[start:stop, :len(good_genes)] = z
+        sample_mean[start:stop] = np.nanmean(z, axis=1)
+        sample_std[start:stop] = np.nanstd(z, axis=1, ddof=1)
+    print(f"  Mean: {np.nanmean(sample_mean):.2f}, Std: {np.nanmean(sample_std):.2f}")
+
+    expr_df = pd.DataFrame(values[:n_kept, :len(good_genes)],
+                           index=pd.Index(sample_ids[kept_rows], name='sample_id'),
+                           columns=pd.Index(gene_names[good_genes]), copy=False)
+
+    log_library = np.log10(np.where(library_size > 0, library_size, np.nan))
+    qc_df = pd.DataFrame({
+        'sample_id': sample_ids,
+        'library_size': library_size,
+        'detected_genes': detected,
+        'zero_fraction': zero_fraction,
+        'library_size_outlier': mad_outliers(log_library),
+        'detected_genes_outlier': mad_outliers(detected.astype(np.float64)),
+        'qc_pass': passed
+    })
+    n_flagged = int((qc_df['library_size_outlier'] | qc_df['detected_genes_outlier']).sum())
+    print(f"  Outlier flags: {n_flagged} samples beyond {OUTLIER_MADS:g} MADs "
+          f"(library size / detected genes; reported, not removed)")
+
+    return expr_df, qc_df
 
 # =============================================================================
 # Main Pipeline
 # =============================================================================
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Process TCGA expression data")
+    parser.add_argument('--no-csv', action='store_true',
+                        help="Only write the columnar store, skip the CSV export")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Processes used to parse count files (default: all cores)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only ingest count files missing from the manifest and "
+                             "re-normalize only projects that gained samples")
+    parser.add_argument('--count-dtype', choices=COUNT_DTYPES, default='float64',
+                        help="Raw count storage dtype (uint32 stores genes missing "
+                             "from a file as 0)")
+    parser.add_argument('--sparse', action='store_true',
+                        help="Store raw counts as sparse columns (low-depth data)")
+    parser.add_argument('--min-count', type=float, default=0,
+                        help="Drop genes at ingest unless count >= this in "
+                             "--min-sample-fraction of samples (0 = keep all)")
+    parser.add_argument('--min-sample-fraction', type=float, default=0.0,
+                        help="Sample fraction for --min-count (default: any one sample)")
+    parser.add_argument('--dtype', choices=['float64', 'float32'], default='float32',
+                        help="dtype of the normalization buffer and the normalized "
+                             "and combined matrices")
+    return parser.parse_args()
+
 def main():
     """
     Main execution pipeline
     """
+    args = parse_args()
+
     print("\n" + "="*80)
     print("TCGA EXPRESSION DATA PROCESSING PIPELINE")
     print("="*80)
 
     # Step 1: Get gene mapping
-    gene_mapping = get_gene_symbol_mapping()
+    gene_index = get_gene_index(PROJECTS)
 
     # Step 2: Process each project
     all_projects_data = {}
 
     for project_id in PROJECTS:
-        # Read raw counts
-        expr_df = process_project_expression(project_id)
-
-        if expr_df.empty:
+        # Ingest raw counts (only new files in incremental mode)
+        changed = ingest_project_counts(project_id, args.workers, args.incremental,
+                                        count_dtype=args.count_dtype,
+                                        layout='sparse' if args.sparse else 'dense',
+                                        min_count=args.min_count,
+                                        min_fraction=args.min_sample_fraction)
+
+        if changed is None:
             continue
 
-        # Convert IDs
-        expr_df = convert_gene_ids(expr_df, gene_mapping)
-
-        # Normalize
-        expr_df = normalize_expression(expr_df, method='log2tpm')
-
-        # QC
-        expr_df = quality_control(expr_df, project_id)
-
-        # Z-score
-        expr_df = zscore_normalize(expr_df)
-
-        all_projects_data[project_id] = expr_df
+        # Settings the normalized matrix depends on besides the raw counts
+        provenance = {
+            'method': 'log2tpm',
+            'dtype': args.dtype,
+            'gene_index': gene_index.checksum() if gene_index is not None else None,
+        }
+        norm_store = NORM_DIR / f"{project_id}.store"
+        if args.incremental and not changed and is_store(norm_store):
+            cached = ExpressionStore(norm_store)
+            if cached.meta.get('provenance') == provenance:
+                print(f"  [CACHED] Reusing normalized matrix: {norm_store}")
+                all_projects_data[project_id] = cached.read().set_index('sample_id').T
+                continue
+            print(f"  [STALE] dtype or gene index changed since {norm_store.name}; re-normalizing")
+
+        # Convert IDs, normalize, QC and z-score in one buffer (samples x genes)
+        expr_df, qc_df = normalize_project(project_id, gene_index, method=provenance['method'],
+                                           dtype=args.dtype)
+        qc_df.to_csv(NORM_DIR / f"{project_id}_sample_qc.csv", index=False)
+
+        write_expression_array(expr_df.to_numpy(), expr_df.columns,
+                               expr_df.index.to_frame(index=False), norm_store,
+                               provenance=provenance)
+        all_projects_data[project_id] = expr_df.T
 
     # Step 3: Combine all projects
     print("\n[COMBINE] Merging all projects...")
@@ -377,8 +728,12 @@ def main():
 
     # Step 4: Save
     output_file = OUTPUT_DIR / "expression_matrix_full_real.csv"
-    final_df.to_csv(output_file, index=False)
-    print(f"\n[SAVED] {output_file}")
+    store_dir = write_expression_store(final_df, store_path_for(output_file))
+    print(f"\n[SAVED] {store_dir}")
+
+    if not args.no_csv:
+        final_df.to_csv(output_file, index=False)
+        print(f"[SAVED] {output_file}")
 
     # Summary statistics
     print("\n" + "="*80)
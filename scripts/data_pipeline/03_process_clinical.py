@@ -16,7 +16,8 @@ import numpy as np
 from pathlib import Path
 from typing import Dict, List
 import json
-import xml.etree.ElementTree as ET
+from lxml import etree
+from concurrent.futures import ProcessPoolExecutor
 
 # =============================================================================
 # Configuration
@@ -30,14 +31,78 @@ OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 PROJECTS = ['TCGA-LUAD', 'TCGA-LUSC', 'TCGA-SKCM']
 
+# Worker processes for parsing (small projects are parsed in-process)
+PARSE_WORKERS = int(os.environ.get('CLINICAL_PARSE_WORKERS', os.cpu_count() or 1))
+MIN_FILES_FOR_POOL = 64
+
+# Output columns and their types (parsers return typed values, not strings)
+CLINICAL_COLUMNS = [
+    'submitter_id', 'sample_id', 'age_at_diagnosis', 'gender', 'race',
+    'tumor_stage', 'tumor_grade', 'histology', 'vital_status',
+    'days_to_death', 'days_to_last_followup', 'prior_treatment'
+]
+NUMERIC_COLUMNS = ['age_at_diagnosis', 'days_to_death', 'days_to_last_followup']
+
+# XML element (local name) -> column; the first element in document order wins
+XML_FIELDS = {
+    'bcr_patient_barcode': 'submitter_id',
+    'age_at_initial_pathologic_diagnosis': 'age_at_diagnosis',
+    'gender': 'gender',
+    'neoplasm_histologic_grade': 'tumor_grade',
+    'histological_type': 'histology',
+    'vital_status': 'vital_status',
+    'days_to_death': 'days_to_death',
+    'days_to_last_followup': 'days_to_last_followup',
+    'prior_diagnosis': 'prior_treatment'
+}
+# (parent, element) -> column, for fields only valid under a given parent
+XML_CHILD_FIELDS = {
+    ('race_list', 'race'): 'race',
+    ('stage_event', 'pathologic_stage'): 'tumor_stage'
+}
+# Elements the parser reports (any namespace); all others are skipped in C
+XML_TAGS = ['{*}' + name for name in XML_FIELDS] + ['{*}' + name for _, name in XML_CHILD_FIELDS]
+
 # =============================================================================
 # Step 1: Parse Clinical XML Files
 # =============================================================================
 
+def to_float(value) -> float:
+    """Numeric value or NaN"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def typed_record(data: Dict) -> Dict:
+    """
+    Convert raw field values to the output types
+
+    Numeric columns become floats (NaN if missing/invalid), the rest strings
+    (None if missing or empty).
+
+    Args:
+        data: Raw field values
+
+    Returns:
+        Typed record
+    """
+    record = {}
+    for key, value in data.items():
+        if key in NUMERIC_COLUMNS:
+            record[key] = to_float(value)
+        else:
+            record[key] = None if value is None or value == '' else str(value)
+    return record
+
 def parse_clinical_xml(xml_path: Path) -> Dict:
     """
     Parse TCGA clinical XML file
 
+    Single streaming pass: the parser only reports the elements in XML_TAGS,
+    each field is taken from the first one that closes, and parsing stops as
+    soon as all fields have been seen.
+
     Args:
         xml_path: Path to clinical XML file
 
@@ -45,36 +110,27 @@ def parse_clinical_xml(xml_path: Path) -> Dict:
         Dict with clinical variables
     """
     try:
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
-
-        # Extract key fields
         data = {}
-
-        # Patient ID
-        patient_id = root.findtext('.//{*}bcr_patient_barcode')
-        data['submitter_id'] = patient_id
+        n_fields = len(XML_FIELDS) + len(XML_CHILD_FIELDS)
+
+        for _, elem in etree.iterparse(str(xml_path), events=('end',), tag=XML_TAGS):
+            name = etree.QName(elem).localname
+            column = XML_FIELDS.get(name)
+            if column is None:
+                parent = elem.getparent()
+                if parent is not None:
+                    column = XML_CHILD_FIELDS.get((etree.QName(parent).localname, name))
+            if column is not None and column not in data:
+                data[column] = elem.text or ''
+                if len(data) == n_fields:
+                    break
+
+        if 'submitter_id' not in data:
+            data['submitter_id'] = None
+        patient_id = data['submitter_id']
         data['sample_id'] = patient_id[:15] if patient_id else None
 
-        # Demographics
-        data['age_at_diagnosis'] = root.findtext('.//{*}age_at_initial_pathologic_diagnosis')
-        data['gender'] = root.findtext('.//{*}gender')
-        data['race'] = root.findtext('.//{*}race_list/{*}race')
-
-        # Tumor characteristics
-        data['tumor_stage'] = root.findtext('.//{*}stage_event/{*}pathologic_stage')
-        data['tumor_grade'] = root.findtext('.//{*}neoplasm_histologic_grade')
-        data['histology'] = root.findtext('.//{*}histological_type')
-
-        # Overall Survival
-        data['vital_status'] = root.findtext('.//{*}vital_status')
-        data['days_to_death'] = root.findtext('.//{*}days_to_death')
-        data['days_to_last_followup'] = root.findtext('.//{*}days_to_last_followup')
-
-        # Treatment
-        data['prior_treatment'] = root.findtext('.//{*}prior_diagnosis')
-
-        return data
+        return typed_record(data)
 
     except Exception as e:
         print(f"  [ERROR] Failed to parse {xml_path.name}: {e}")
@@ -117,16 +173,45 @@ def parse_clinical_json(json_path: Path) -> Dict:
             data['tumor_grade'] = diag.get('tumor_grade')
             data['days_to_last_followup'] = diag.get('days_to_last_follow_up')
 
-        return data
+        return typed_record(data)
 
     except Exception as e:
         print(f"  [ERROR] Failed to parse {json_path.name}: {e}")
         return {}
 
+def parse_clinical_file(path: Path) -> Dict:
+    """Parse one clinical file (XML or JSON, by suffix)"""
+    if path.suffix == '.xml':
+        return parse_clinical_xml(path)
+    return parse_clinical_json(path)
+
 # =============================================================================
 # Step 2: Process Project Clinical Data
 # =============================================================================
 
+def parse_clinical_files(files: List[Path], n_workers: int = PARSE_WORKERS) -> List[Dict]:
+    """
+    Parse clinical files, in a process pool when there are many
+
+    Args:
+        files: Clinical XML/JSON files
+        n_workers: Worker processes
+
+    Returns:
+        Parsed records in file order (failed files give empty dicts)
+    """
+    if n_workers <= 1 or len(files) < MIN_FILES_FOR_POOL:
+        return [parse_clinical_file(f) for f in files]
+
+    chunksize = max(1, len(files) // (n_workers * 4))
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        return list(executor.map(parse_clinical_file, files, chunksize=chunksize))
+
+def clinical_frame(records: List[Dict]) -> pd.DataFrame:
+    """Typed DataFrame (all CLINICAL_COLUMNS) from parsed records"""
+    df = pd.DataFrame(records, columns=CLINICAL_COLUMNS)
+    return df.astype({col: 'float64' for col in NUMERIC_COLUMNS})
+
 def process_project_clinical(project_id: str) -> pd.DataFrame:
     """
     Process all clinical files for a project
@@ -151,24 +236,14 @@ def process_project_clinical(project_id: str) -> pd.DataFrame:
     print(f"  Found {len(xml_files)} XML files, {len(json_files)} JSON files")
 
     # Parse all files
-    all_data = []
-
-    for xml_file in xml_files:
-        data = parse_clinical_xml(xml_file)
-        if data:
-            all_data.append(data)
-
-    for json_file in json_files:
-        data = parse_clinical_json(json_file)
-        if data:
-            all_data.append(data)
+    all_data = [data for data in parse_clinical_files(xml_files + json_files) if data]
 
     if not all_data:
         print(f"  [WARN] No clinical data extracted")
         return pd.DataFrame()
 
     # Create DataFrame
-    df = pd.DataFrame(all_data)
+    df = clinical_frame(all_data)
     print(f"  Extracted {len(df)} patient records")
 
     return df
@@ -211,25 +286,15 @@ def clean_clinical_data(clinical_df: pd.DataFrame) -> pd.DataFrame:
         'alive': 0
     })
 
-    # Calculate OS time
-    clinical_df['days_to_death'] = pd.to_numeric(clinical_df['days_to_death'], errors='coerce')
-    clinical_df['days_to_last_followup'] = pd.to_numeric(clinical_df['days_to_last_followup'], errors='coerce')
-
-    clinical_df['OS_days'] = clinical_df.apply(
-        lambda row: row['days_to_death'] if pd.notna(row['days_to_death'])
-                    else row['days_to_last_followup'],
-        axis=1
-    )
+    # Calculate OS time (day columns are already numeric)
+    clinical_df['OS_days'] = clinical_df['days_to_death'].fillna(clinical_df['days_to_last_followup'])
 
     # Remove invalid OS
     valid_os = (clinical_df['OS_days'].notna()) & (clinical_df['OS_days'] > 0) & (clinical_df['OS_status'].notna())
     clinical_df = clinical_df[valid_os]
     print(f"  Valid OS data: {valid_os.sum()} patients")
 
-    # 3. Process Age
-    clinical_df['age_at_diagnosis'] = pd.to_numeric(clinical_df['age_at_diagnosis'], errors='coerce')
-
-    # 4. Process Stage
+    # 3. Process Stage
     # Standardize stage nomenclature
     def standardize_stage(stage):
         if pd.isna(stage):
@@ -250,7 +315,7 @@ def clean_clinical_data(clinical_df: pd.DataFrame) -> pd.DataFrame:
 
     clinical_df['tumor_stage_clean'] = clinical_df['tumor_stage'].apply(standardize_stage)
 
-    # 5. Process Gender
+    # 4. Process Gender
     clinical_df['gender'] = clinical_df['gender'].str.upper()
 
     # Summary
@@ -303,8 +368,7 @@ def combine_all_projects() -> pd.DataFrame:
 
     # Summary by cancer type
     print("\nSample size by cancer type:")
-    for cancer_type in final_df['cancer_type'].unique():
-        count = (final_df['cancer_type'] == cancer_type).sum()
+    for cancer_type, count in final_df['cancer_type'].value_counts(sort=False).items():
         print(f"  {cancer_type}: {count} patients")
 
     return final_df
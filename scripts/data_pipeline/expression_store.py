@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+"""
+Columnar Expression Store
+Memory-mapped, gene-addressable replacement for expression_matrix*.csv
+
+Layout (one directory per matrix, next to the CSV it replaces):
+    expression_matrix_full_real.store/
+        meta.json          format version, dtype, shard list, provenance
+        genes.txt          one gene ID per line (column order)
+        samples.csv        per-sample metadata (sample_id, cancer_type, ...)
+        shard_00000.npy    samples x genes block, Fortran (column-major) order
+        shard_00001.npy    ...
+
+Each shard stores genes contiguously, so pulling a handful of genes reads a
+handful of contiguous byte ranges per shard instead of re-parsing the whole
+matrix from text.
+
+Stores may use a narrow dtype (float32, or uint32 for raw counts) and, for
+low-depth count data, a sparse layout: each shard is then kept as
+compressed sparse columns (shard_00000.data.npy / .indices.npy /
+.indptr.npy; one run of non-zero entries per gene). Readers return the
+same dense samples x genes blocks for either layout.
+
+Usage:
+    from expression_store import load_expression
+    expr_df = load_expression(expr_file, genes=['CD274', 'CMTM6'])
+
+Author: Automated Pipeline
+Date: 2025-11-02
+"""
+
+import os
+import json
+import shutil
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+# =============================================================================
+# Configuration
+# =============================================================================
+
+STORE_FORMAT_VERSION = 1
+STORE_SUFFIX = ".store"
+
+META_FILE = "meta.json"
+GENES_FILE = "genes.txt"
+SAMPLES_FILE = "samples.csv"
+
+# Samples per shard; a shard is the unit of appending and of memory mapping
+DEFAULT_SHARD_SIZE = 2000
+
+# Non-expression columns carried alongside the matrix
+META_COLUMNS = ['sample_id', 'cancer_type']
+
+LAYOUTS = ('dense', 'sparse')
+SPARSE_PARTS = ('data', 'indices', 'indptr')
+
+# =============================================================================
+# Paths
+# =============================================================================
+
+def store_path_for(csv_path: Union[str, Path]) -> Path:
+    """
+    Location of the columnar store that shadows a CSV matrix
+
+    Args:
+        csv_path: Path to expression_matrix*.csv
+
+    Returns:
+        Path to the sibling .store directory
+    """
+    csv_path = Path(csv_path)
+    if csv_path.suffix == STORE_SUFFIX:
+        return csv_path
+    return csv_path.with_suffix(STORE_SUFFIX)
+
+def is_store(path: Union[str, Path]) -> bool:
+    """True if path is a directory written by write_expression_store"""
+    return (Path(path) / META_FILE).exists()
+
+# =============================================================================
+# Writing
+# =============================================================================
+
+def split_meta_columns(expr_df: pd.DataFrame) -> List[str]:
+    """
+    Identify metadata (non-expression) columns of a samples x genes frame
+
+    Args:
+        expr_df: Expression DataFrame in CSV layout
+
+    Returns:
+        List of metadata column names
+    """
+    extra = [c for c in expr_df.columns
+             if c not in META_COLUMNS and not pd.api.types.is_numeric_dtype(expr_df[c])]
+    return [c for c in META_COLUMNS if c in expr_df.columns] + extra
+
+def _write_shard(store_dir: Path, shard_idx: int, values: np.ndarray,
+                 layout: str = 'dense') -> Dict:
+    """Write one samples x genes block in column-major order (dense or CSC)"""
+    if layout == 'dense':
+        file_name = f"shard_{shard_idx:05d}.npy"
+        np.save(store_dir / file_name, np.asfortranarray(values))
+        return {'file': file_name, 'n_samples': int(values.shape[0])}
+
+    # Gene-major flattening; NaN counts as non-zero and is stored explicitly
+    n_samples, n_genes = values.shape
+    by_gene = np.ascontiguousarray(values.T)
+    nonzero = by_gene != 0
+    flat_pos = np.flatnonzero(nonzero)
+    indptr = np.zeros(n_genes + 1, dtype=np.int64)
+    np.cumsum(nonzero.sum(axis=1), out=indptr[1:])
+
+    file_name = f"shard_{shard_idx:05d}"
+    parts = {'data': by_gene.ravel()[flat_pos],
+             'indices': (flat_pos % max(n_samples, 1)).astype(np.int32),
+             'indptr': indptr}
+    for part in SPARSE_PARTS:
+        np.save(store_dir / f"{file_name}.{part}.npy", parts[part])
+    return {'file': file_name, 'n_samples': int(n_samples), 'nnz': int(len(flat_pos))}
+
+def write_expression_store(expr_df: pd.DataFrame, store_dir: Union[str, Path],
+                           shard_size: int = DEFAULT_SHARD_SIZE,
+                           dtype: Optional[str] = None, layout: str = 'dense') -> Path:
+    """
+    Write a samples x genes DataFrame as a columnar store
+
+    The store is built in a temporary directory and moved into place, so
+    readers never see a half-written store.
+
+    Args:
+        expr_df: Samples x (metadata + genes) DataFrame, as written to CSV
+        store_dir: Output directory (usually store_path_for(csv_file))
+        shard_size: Samples per shard
+        dtype: Storage dtype (default: keep the matrix dtype)
+        layout: 'dense', or 'sparse' for mostly-zero count matrices
+
+    Returns:
+        Path to the written store
+    """
+    meta_cols = split_meta_columns(expr_df)
+    gene_cols = [c for c in expr_df.columns if c not in meta_cols]
+    return write_expression_array(expr_df[gene_cols].to_numpy(dtype=dtype), gene_cols,
+                                  expr_df[meta_cols], store_dir, shard_size, layout)
+
+def write_expression_array(values: np.ndarray, genes: Sequence[str], samples_df: pd.DataFrame,
+                           store_dir: Union[str, Path], shard_size: int = DEFAULT_SHARD_SIZE,
+                           layout: str = 'dense', provenance: Optional[Dict] = None) -> Path:
+    """
+    Write a samples x genes array as a columnar store (no DataFrame copy)
+
+    Args:
+        values: Samples x genes matrix (any strides; written shard by shard)
+        genes: Gene IDs (column order)
+        samples_df: Per-sample metadata columns (sample_id, ...)
+        store_dir: Output directory
+        shard_size: Samples per shard
+        layout: 'dense' or 'sparse'
+        provenance: JSON-serializable settings the matrix was built with,
+            kept in meta.json so callers can tell whether a store is stale
+
+    Returns:
+        Path to the written store
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"layout must be one of {LAYOUTS}, got {layout!r}")
+    store_dir = Path(store_dir)
+    gene_cols = list(genes)
+    meta_cols = list(samples_df.columns)
+
+    if len(set(gene_cols)) != len(gene_cols):
+        raise ValueError("Duplicate gene columns; deduplicate before writing the store")
+
+    tmp_dir = store_dir.with_name(store_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    shards = []
+    for shard_idx, start in enumerate(range(0, max(len(values), 1), shard_size)):
+        shards.append(_write_shard(tmp_dir, shard_idx, values[start:start + shard_size], layout))
+
+    (tmp_dir / GENES_FILE).write_text("\n".join(map(str, gene_cols)) + "\n")
+    samples_df.to_csv(tmp_dir / SAMPLES_FILE, index=False)
+
+    meta = {
+        'format_version': STORE_FORMAT_VERSION,
+        'dtype': str(values.dtype),
+        'layout': layout,
+        'n_samples': int(values.shape[0]),
+        'n_genes': len(gene_cols),
+        'meta_columns': meta_cols,
+        'shards': shards,
+        'provenance': provenance or {}
+    }
+    with open(tmp_dir / META_FILE, 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    if store_dir.exists():
+        shutil.rmtree(store_dir)
+    tmp_dir.rename(store_dir)
+
+    print(f"  [STORE] {store_dir} ({meta['n_samples']} samples x "
+          f"{meta['n_genes']} genes, {len(shards)} shards, {meta['dtype']}, {layout})")
+
+    return store_dir
+
+def append_expression_store(expr_df: pd.DataFrame, store_dir: Union[str, Path],
+                            shard_size: int = DEFAULT_SHARD_SIZE) -> Path:
+    """
+    Append new samples to an existing store without rewriting old shards
+
+    New rows are aligned to the store's gene columns (genes the store does
+    not have are dropped, genes missing from expr_df become NaN). meta.json
+    is replaced last, so an interrupted append leaves the previous store
+    readable.
+
+    Args:
+        expr_df: Samples x (metadata + genes) DataFrame to append
+        store_dir: Existing store directory
+        shard_size: Samples per new shard
+
+    Returns:
+        Path to the store
+    """
+    store_dir = Path(store_dir)
+    store = ExpressionStore(store_dir)
+    meta = store.meta
+
+    dropped = expr_df.columns.difference(store.genes).difference(meta['meta_columns'])
+    if len(dropped):
+        print(f"  [WARN] Dropping {len(dropped)} genes not present in {store_dir.name}")
+
+    values = expr_df.reindex(columns=store.genes).to_numpy(dtype=meta['dtype'])
+    new_meta = expr_df.reindex(columns=meta['meta_columns'])
+
+    first_idx = len(meta['shards'])
+    for i, start in enumerate(range(0, len(values), shard_size)):
+        meta['shards'].append(_write_shard(store_dir, first_idx + i, values[start:start + shard_size],
+                                           meta.get('layout', 'dense')))
+    meta['n_samples'] += int(values.shape[0])
+
+    samples_df = pd.concat([store.samples, new_meta], ignore_index=True)
+    samples_df.to_csv(store_dir / (SAMPLES_FILE + ".tmp"), index=False)
+    with open(store_dir / (META_FILE + ".tmp"), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    os.replace(store_dir / (SAMPLES_FILE + ".tmp"), store_dir / SAMPLES_FILE)
+    os.replace(store_dir / (META_FILE + ".tmp"), store_dir / META_FILE)
+
+    print(f"  [STORE] Appended {len(values)} samples to {store_dir} "
+          f"({meta['n_samples']} total)")
+
+    return store_dir
+
+# =============================================================================
+# Reading
+# =============================================================================
+
+class ExpressionStore:
+    """
+    Read-only view of a columnar expression store
+
+    Shards are memory-mapped lazily; only the requested gene columns are
+    touched on disk.
+    """
+
+    def __init__(self, store_dir: Union[str, Path]):
+        self.store_dir = Path(store_dir)
+
+        with open(self.store_dir / META_FILE) as f:
+            self.meta = json.load(f)
+
+        if self.meta.get('format_version') != STORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported store format: {self.meta.get('format_version')}")
+
+        self.genes = pd.Index(
+            (self.store_dir / GENES_FILE).read_text().splitlines(), name='gene')
+        # samples.csv is replaced before meta.json on append; trust meta.json
+        self.samples = pd.read_csv(self.store_dir / SAMPLES_FILE,
+                                   dtype={c: str for c in self.meta['meta_columns']}
+                                   ).iloc[:self.meta['n_samples']]
+        self._gene_pos = pd.Series(np.arange(len(self.genes)), index=self.genes)
+
+        # Global row offset of each shard
+        sizes = [s['n_samples'] for s in self.meta['shards']]
+        self._shard_starts = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+
+    @property
+    def shape(self):
+        return (len(self.samples), len(self.genes))
+
+    @property
+    def layout(self) -> str:
+        return self.meta.get('layout', 'dense')
+
+    def __contains__(self, gene: str) -> bool:
+        return gene in self._gene_pos.index
+
+    def _shard(self, i: int) -> np.ndarray:
+        return np.load(self.store_dir / self.meta['shards'][i]['file'], mmap_mode='r')
+
+    def _shard_block(self, i: int, gene_pos: np.ndarray,
+                     row_range: Optional[Tuple[int, int]] = None) -> np.ndarray:
+        """Dense samples x genes block of one shard (optionally rows [lo, hi)), for either layout"""
+        shard = self.meta['shards'][i]
+        lo, hi = row_range if row_range is not None else (0, shard['n_samples'])
+
+        if self.layout == 'dense':
+            return self._shard(i)[lo:hi, gene_pos]
+
+        data, indices, indptr = (np.load(self.store_dir / f"{shard['file']}.{part}.npy", mmap_mode='r')
+                                 for part in SPARSE_PARTS)
+        starts = indptr[gene_pos]
+        lengths = indptr[gene_pos + 1] - starts
+        block = np.zeros((hi - lo, len(gene_pos)), dtype=self.meta['dtype'], order='F')
+        total = int(lengths.sum())
+        if total:
+            # Positions of every selected gene's run of entries, gathered in one go
+            run_offsets = starts - np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            entries = np.repeat(run_offsets, lengths) + np.arange(total)
+            columns = np.repeat(np.arange(len(gene_pos)), lengths)
+            rows = indices[entries]
+            if row_range is not None:
+                in_range = (rows >= lo) & (rows < hi)
+                entries, columns, rows = entries[in_range], columns[in_range], rows[in_range]
+            block[rows - lo, columns] = data[entries]
+        return block
+
+    def gene_positions(self, genes: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Column positions of requested genes (missing genes are dropped)"""
+        if genes is None:
+            return np.arange(len(self.genes))
+        return self._gene_pos.reindex(list(genes)).dropna().to_numpy(dtype=np.int64)
+
+    def sample_positions(self, samples: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Row positions of requested sample IDs, in store order"""
+        if samples is None:
+            return np.arange(len(self.samples))
+        if 'sample_id' not in self.samples.columns:
+            raise ValueError("Store has no sample_id column; select samples by position")
+        return np.flatnonzero(self.samples['sample_id'].isin(set(samples)).to_numpy())
+
+    def read_values(self, gene_pos: np.ndarray,
+                    sample_pos: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Read a samples x genes block by position
+
+        Args:
+            gene_pos: Column positions
+            sample_pos: Sorted row positions (None = all samples)
+
+        Returns:
+            2D array (len(sample_pos) x len(gene_pos))
+        """
+        blocks = []
+        for i in range(len(self.meta['shards'])):
+            start, stop = self._shard_starts[i], self._shard_starts[i + 1]
+            if sample_pos is None:
+                rows = None
+            else:
+                lo, hi = np.searchsorted(sample_pos, [start, stop])
+                if lo == hi:
+                    continue
+                rows = sample_pos[lo:hi] - start
+
+            block = self._shard_block(i, gene_pos)
+            blocks.append(block if rows is None else block[rows])
+
+        if not blocks:
+            return np.empty((0, len(gene_pos)), dtype=self.meta['dtype'])
+        return np.concatenate(blocks, axis=0)
+
+    def read(self, genes: Optional[Sequence[str]] = None,
+             samples: Optional[Sequence[str]] = None,
+             include_meta: bool = True) -> pd.DataFrame:
+        """
+        Read selected genes and samples as a DataFrame in CSV layout
+
+        Args:
+            genes: Gene IDs to read (None = all genes)
+            samples: Sample IDs to keep (None = all samples)
+            include_meta: Prepend metadata columns (sample_id, cancer_type)
+
+        Returns:
+            Samples x (metadata + genes) DataFrame
+        """
+        gene_pos = self.gene_positions(genes)
+        sample_pos = None if samples is None else self.sample_positions(samples)
+
+        values = self.read_values(gene_pos, sample_pos)
+        expr_df = pd.DataFrame(values, columns=self.genes[gene_pos])
+
+        if include_meta:
+            meta_df = self.samples if sample_pos is None else self.samples.iloc[sample_pos]
+            meta_df = meta_df.reset_index(drop=True)
+            expr_df = pd.concat([meta_df, expr_df], axis=1)
+
+        return expr_df
+
+    def iter_sample_chunks(self, chunk_size: int = 256, gene_pos: Optional[np.ndarray] = None,
+                           sample_pos: Optional[np.ndarray] = None
+                           ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Stream the matrix in blocks of samples (store order)
+
+        Only the rows of each block are read from the shard, so memory is
+        bounded by chunk_size x len(gene_pos).
+
+        Args:
+            chunk_size: Samples per block
+            gene_pos: Column positions (None = all genes)
+            sample_pos: Sorted row positions (None = all samples)
+
+        Yields:
+            (row positions, samples x genes array)
+        """
+        if gene_pos is None:
+            gene_pos = np.arange(len(self.genes))
+        if sample_pos is None:
+            sample_pos = np.arange(len(self.samples))
+        for i in range(len(self.meta['shards'])):
+            start, stop = self._shard_starts[i], self._shard_starts[i + 1]
+            first, last = np.searchsorted(sample_pos, [start, stop])
+            for c in range(first, last, chunk_size):
+                positions = sample_pos[c:min(c + chunk_size, last)]
+                rows = positions - start
+                lo, hi = int(rows[0]), int(rows[-1]) + 1
+                block = self._shard_block(i, gene_pos, (lo, hi))
+                yield positions, (block if hi - lo == len(rows) else block[rows - lo])
+
+    def iter_gene_chunks(self, chunk_size: int = 2000,
+                         samples: Optional[Sequence[str]] = None
+                         ) -> Iterator[pd.DataFrame]:
+        """
+        Stream the matrix in blocks of genes
+
+        Args:
+            chunk_size: Genes per block
+            samples: Sample IDs to keep (None = all samples)
+
+        Yields:
+            Samples x genes DataFrame (no metadata columns)
+        """
+        sample_pos = None if samples is None else self.sample_positions(samples)
+        for start in range(0, len(self.genes), chunk_size):
+            gene_pos = np.arange(start, min(start + chunk_size, len(self.genes)))
+            yield pd.DataFrame(self.read_values(gene_pos, sample_pos),
+                               columns=self.genes[gene_pos])
+
+# =============================================================================
+# Loader API
+# =============================================================================
+
+def load_expression(path: Union[str, Path],
+                    genes: Optional[Sequence[str]] = None,
+                    samples: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    Load an expression matrix, preferring the columnar store
+
+    Accepts either the store directory or the CSV path. If a store exists
+    next to the CSV it is used; otherwise the CSV is parsed, restricted to
+    the requested gene columns.
+
+    Args:
+        path: expression_matrix*.csv or its .store directory
+        genes: Gene columns to load (None = all); missing genes are skipped
+        samples: Sample IDs to keep (None = all)
+
+    Returns:
+        Samples x (metadata + genes) DataFrame, same layout as the CSV
+    """
+    path = Path(path)
+    store_dir = store_path_for(path)
+
+    if is_store(store_dir):
+        return ExpressionStore(store_dir).read(genes=genes, samples=samples)
+
+    if genes is None:
+        expr_df = pd.read_csv(path)
+    else:
+        wanted = set(genes) | set(META_COLUMNS)
+        expr_df = pd.read_csv(path, usecols=lambda c: c in wanted)
+        meta_cols = [c for c in META_COLUMNS if c in expr_df.columns]
+        gene_cols = [g for g in dict.fromkeys(genes) if g in expr_df.columns]
+        expr_df = expr_df[meta_cols + gene_cols]
+
+    if samples is not None and 'sample_id' in expr_df.columns:
+        expr_df = expr_df[expr_df['sample_id'].isin(set(samples))].reset_index(drop=True)
+
+    return expr_df
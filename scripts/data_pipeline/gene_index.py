@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Gene Annotation Index
+Local, versioned Ensembl <-> symbol index shared by all scripts
+
+Built once from the gene_id / gene_name / gene_type columns that every STAR
+count file already carries (the GENCODE model is read from the file's
+"# gene-model:" header), then stored as a compact array file:
+
+    outputs/reference/gene_index.npz
+        stable_id    sorted Ensembl stable IDs (version stripped)
+        version      Ensembl version of each ID (0 = unknown)
+        symbol       gene symbol of each ID
+        gene_type    uint8 codes into gene_types
+        meta         JSON: gene model, source file, gene count, checksum
+
+Lookups are hash-based and vectorized (pandas Index.get_indexer), so
+converting a whole matrix axis is one call. Ensembl -> symbol is
+many-to-one; symbols that name several Ensembl IDs are resolved by an
+explicit policy:
+    'canonical'  protein-coding gene first, then lowest stable ID (default)
+    'drop'       ambiguous symbols stay unmapped
+    'error'      raise ValueError listing the ambiguous symbols
+
+Usage:
+    from gene_index import load_gene_index
+    index = load_gene_index()
+    symbols = index.ensembl_to_symbol(expr_df.columns)
+    mapping = index.symbol_map(['CD274', 'SQSTM1'])
+
+Author: Automated Pipeline
+Date: 2025-11-02
+"""
+
+import os
+import gzip
+import json
+import hashlib
+import argparse
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Sequence, Tuple, Union
+
+# =============================================================================
+# Configuration
+# =============================================================================
+
+BASE_DIR = Path(__file__).parent.parent.parent
+COUNTS_DIR = BASE_DIR / "data" / "tcga_raw"
+DEFAULT_INDEX_PATH = Path(os.environ.get("GENE_INDEX_PATH",
+                                         BASE_DIR / "outputs" / "reference" / "gene_index.npz"))
+
+INDEX_FORMAT_VERSION = 1
+
+DUPLICATE_POLICIES = ('canonical', 'drop', 'error')
+
+# Used only when no index exists and no count file is available to build one
+SEED_GENES = {
+    'CD274': 'ENSG00000120217',   # PD-L1
+    'CMTM6': 'ENSG00000091317',
+    'STUB1': 'ENSG00000103266',   # CHIP
+    'HIP1R': 'ENSG00000130787',
+    'SQSTM1': 'ENSG00000161011',  # p62
+}
+
+# =============================================================================
+# Ensembl ID Helpers
+# =============================================================================
+
+def strip_version(ids: Iterable[str]) -> np.ndarray:
+    """Stable Ensembl IDs ('ENSG00000120217.14' -> 'ENSG00000120217')"""
+    return np.array([str(i).partition('.')[0] for i in ids], dtype=object)
+
+def id_versions(ids: Iterable[str]) -> np.ndarray:
+    """Version number of each Ensembl ID (0 if unversioned)"""
+    version = pd.Index(ids, dtype=object).str.extract(r'\.(\d+)', expand=False)
+    return version.fillna('0').astype(np.uint16).to_numpy()
+
+# =============================================================================
+# Index
+# =============================================================================
+
+class GeneIndex:
+    """
+    Array-backed Ensembl <-> symbol index
+
+    Args (constructor):
+        stable_ids: Unique Ensembl stable IDs
+        versions: Ensembl version per ID (0 = unknown)
+        symbols: Gene symbol per ID ('' = none)
+        gene_types: Gene biotype per ID
+        meta: Provenance (gene_model, source, ...)
+    """
+
+    def __init__(self, stable_ids: Sequence[str], versions: Sequence[int],
+                 symbols: Sequence[str], gene_types: Sequence[str], meta: Optional[Dict] = None):
+        order = np.argsort(np.asarray(stable_ids, dtype=str), kind='stable')
+        self.stable_ids = np.asarray(stable_ids, dtype=object)[order]
+        self.versions = np.asarray(versions, dtype=np.uint16)[order]
+        self.symbols = np.asarray(symbols, dtype=object)[order]
+        self.gene_types = np.asarray(gene_types, dtype=object)[order]
+        self.meta = dict(meta or {})
+        self.meta.setdefault('gene_model', 'unknown')
+        self.meta['n_genes'] = len(self.stable_ids)
+
+        self._ids = pd.Index(self.stable_ids)
+        if self._ids.has_duplicates:
+            raise ValueError("Gene index stable IDs must be unique")
+
+        # One canonical row per symbol: protein-coding first, then lowest stable ID
+        has_symbol = np.flatnonzero(self.symbols != '')
+        rank = np.lexsort((has_symbol, self.gene_types[has_symbol] != 'protein_coding'))
+        ranked = has_symbol[rank]
+        first = ~pd.Index(self.symbols[ranked]).duplicated()
+        self._canonical_rows = ranked[first]
+        self._symbols = pd.Index(self.symbols[self._canonical_rows])
+        counts = pd.Index(self.symbols[has_symbol]).value_counts()
+        self._symbol_counts = counts.reindex(self._symbols).to_numpy()
+
+    def __len__(self) -> int:
+        return len(self.stable_ids)
+
+    def __repr__(self) -> str:
+        return f"GeneIndex({self.meta['gene_model']}, {len(self)} genes)"
+
+    @property
+    def is_seed(self) -> bool:
+        """True for the built-in anchor-gene fallback (no annotation source)"""
+        return self.meta['gene_model'] == 'seed'
+
+    # -------------------------------------------------------------------------
+    # Lookups
+    # -------------------------------------------------------------------------
+
+    def ensembl_to_symbol(self, ids: Iterable[str], match_version: bool = False) -> np.ndarray:
+        """
+        Gene symbol for each Ensembl ID (versioned or not)
+
+        Args:
+            ids: Ensembl IDs
+            match_version: Versioned IDs whose version differs from the
+                index map to None
+
+        Returns:
+            Object array of symbols (None where unmapped)
+        """
+        ids = pd.Index(ids, dtype=object)
+        rows = self._ids.get_indexer(strip_version(ids))
+        found = rows >= 0
+        if match_version:
+            queried = id_versions(ids)
+            found &= (queried == 0) | (queried == self.versions[rows])
+        symbols = np.where(found, self.symbols[rows], None)
+        symbols[symbols == ''] = None
+        return symbols
+
+    def symbol_to_ensembl(self, symbols: Iterable[str], duplicates: str = 'canonical',
+                          versioned: bool = False) -> np.ndarray:
+        """
+        Ensembl stable ID for each gene symbol
+
+        Args:
+            symbols: Gene symbols
+            duplicates: Policy for symbols naming several genes
+                ('canonical', 'drop' or 'error')
+            versioned: Return 'ENSG....<version>' where the version is known
+
+        Returns:
+            Object array of Ensembl IDs (None where unmapped)
+        """
+        if duplicates not in DUPLICATE_POLICIES:
+            raise ValueError(f"duplicates must be one of {DUPLICATE_POLICIES}, got {duplicates!r}")
+        symbols = pd.Index(symbols, dtype=object)
+        pos = self._symbols.get_indexer(symbols)
+        found = pos >= 0
+        ambiguous = found & (self._symbol_counts[pos] > 1)
+
+        if ambiguous.any() and duplicates == 'error':
+            names = sorted(set(symbols[ambiguous]))
+            raise ValueError(f"Ambiguous gene symbols ({len(names)}): {', '.join(names[:20])}")
+        if duplicates == 'drop':
+            found &= ~ambiguous
+
+        rows = self._canonical_rows[pos]
+        ids = self.stable_ids[rows]
+        if versioned:
+            with_version = self.versions[rows] > 0
+            ids = np.where(with_version, ids + '.' + self.versions[rows].astype(str), ids)
+        return np.where(found, ids, None)
+
+    def symbol_map(self, symbols: Iterable[str], duplicates: str = 'canonical') -> Dict[str, str]:
+        """Symbol -> Ensembl stable ID for the symbols that map"""
+        symbols = list(symbols)
+        return {s: e for s, e in zip(symbols, self.symbol_to_ensembl(symbols, duplicates))
+                if e is not None}
+
+    def ensembl_map(self, ids: Iterable[str]) -> Dict[str, str]:
+        """Ensembl ID -> symbol for the IDs that map (keys as given)"""
+        ids = list(ids)
+        return {i: s for i, s in zip(ids, self.ensembl_to_symbol(ids)) if s is not None}
+
+    def collapse_to_symbols(self, ids: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Pick one Ensembl ID per symbol for relabelling a matrix axis
+
+        Unmapped IDs are dropped. Where several IDs share a symbol, the
+        canonical ID wins; if it is absent, the first in axis order does.
+
+        Args:
+            ids: Axis labels (Ensembl IDs)
+
+        Returns:
+            (positions, symbols) - kept positions in axis order and their symbols
+        """
+        ids = pd.Index(ids, dtype=object)
+        symbols = self.ensembl_to_symbol(ids)
+        mapped = np.flatnonzero(pd.notna(symbols))
+        canonical = self.symbol_to_ensembl(symbols[mapped]) == strip_version(ids[mapped])
+        order = mapped[np.lexsort((mapped, ~canonical))]
+        keep = np.sort(order[~pd.Index(symbols[order]).duplicated()])
+        return keep, symbols[keep]
+
+    def duplicate_symbols(self) -> pd.DataFrame:
+        """Every gene whose symbol names more than one Ensembl ID"""
+        ambiguous = self._symbols[self._symbol_counts > 1]
+        rows = np.flatnonzero(pd.Index(self.symbols).isin(ambiguous))
+        table = pd.DataFrame({
+            'symbol': self.symbols[rows],
+            'gene_id': self.stable_ids[rows],
+            'version': self.versions[rows],
+            'gene_type': self.gene_types[rows],
+        })
+        table['canonical'] = self.symbol_to_ensembl(table['symbol']) == table['gene_id']
+        return table.sort_values(['symbol', 'canonical', 'gene_id'],
+                                 ascending=[True, False, True], ignore_index=True)
+
+    # -------------------------------------------------------------------------
+    # Persistence
+    # -------------------------------------------------------------------------
+
+    def checksum(self) -> str:
+        """Content hash of the ID, version and symbol columns"""
+        digest = hashlib.sha1()
+        for column in (self.stable_ids, self.versions.astype(str), self.symbols):
+            digest.update('\n'.join(column).encode())
+        return digest.hexdigest()
+
+    def save(self, path: Union[str, Path] = DEFAULT_INDEX_PATH) -> Path:
+        """Write the index (atomically) as a compressed array file"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        type_codes, type_names = pd.factorize(self.gene_types)
+        meta = dict(self.meta, format_version=INDEX_FORMAT_VERSION, checksum=self.checksum())
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(
+                f,
+                stable_id=self.stable_ids.astype(str),
+                version=self.versions,
+                symbol=self.symbols.astype(str),
+                gene_type=type_codes.astype(np.uint8),
+                gene_types=np.asarray(type_names, dtype=str),
+                meta=np.array(json.dumps(meta))
+            )
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path: Union[str, Path] = DEFAULT_INDEX_PATH) -> 'GeneIndex':
+        """Read an index written by save()"""
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('format_version') != INDEX_FORMAT_VERSION:
+                raise ValueError(f"Unsupported gene index format: {meta.get('format_version')}")
+            return cls(data['stable_id'], data['version'], data['symbol'],
+                       data['gene_types'][data['gene_type']], meta)
+
+    @classmethod
+    def seed(cls) -> 'GeneIndex':
+        """Anchor genes only (offline fallback)"""
+        return cls(list(SEED_GENES.values()), [0] * len(SEED_GENES), list(SEED_GENES),
+                   ['protein_coding'] * len(SEED_GENES), {'gene_model': 'seed', 'source': None})
+
+# =============================================================================
+# Building
+# =============================================================================
+
+def _open_text(path: Path):
+    return gzip.open(path, 'rt') if path.suffix == '.gz' else open(path)
+
+def read_gene_model(path: Union[str, Path]) -> Optional[str]:
+    """GENCODE model named in a STAR count file header ('# gene-model: GENCODE v36')"""
+    with _open_text(Path(path)) as f:
+        for line in f:
+            if not line.startswith('#'):
+                return None
+            key, _, value = line.lstrip('#').partition(':')
+            if key.strip() == 'gene-model':
+                return value.strip()
+    return None
+
+def has_annotation(path: Union[str, Path]) -> bool:
+    """True if a count/annotation file carries gene_id and gene_name columns"""
+    with _open_text(Path(path)) as f:
+        for line in f:
+            if not line.startswith('#'):
+                header = line.rstrip('\n').split('\t')
+                return 'gene_id' in header and 'gene_name' in header
+    return False
+
+def find_annotation_source(search_dir: Union[str, Path] = COUNTS_DIR) -> Optional[Path]:
+    """First STAR count file under a directory that carries annotation columns"""
+    for pattern in ("**/*.tsv", "**/*.tsv.gz"):
+        for path in Path(search_dir).glob(pattern):
+            if has_annotation(path):
+                return path
+    return None
+
+def build_gene_index(source: Union[str, Path]) -> GeneIndex:
+    """
+    Build the index from one annotated table
+
+    Works on a STAR count file or any TSV with gene_id and gene_name
+    (optionally gene_type) columns. STAR summary rows (N_*) and PAR_Y
+    copies are dropped, so each stable ID appears once.
+
+    Args:
+        source: Count or annotation file
+
+    Returns:
+        GeneIndex
+    """
+    source = Path(source)
+    df = pd.read_csv(source, sep='\t', comment='#', dtype=str,
+                     usecols=lambda c: c in ('gene_id', 'gene_name', 'gene_type'))
+    df = df[~(df['gene_id'].str.startswith('N_') | df['gene_id'].str.startswith('__'))]
+    df = df[~df['gene_id'].str.endswith('_PAR_Y')]
+
+    stable_ids = strip_version(df['gene_id'])
+    first = ~pd.Index(stable_ids).duplicated()
+    gene_types = df['gene_type'] if 'gene_type' in df.columns else pd.Series('', index=df.index)
+
+    return GeneIndex(
+        stable_ids[first],
+        id_versions(df['gene_id'])[first],
+        df['gene_name'].fillna('').to_numpy(dtype=object)[first],
+        gene_types.fillna('').to_numpy(dtype=object)[first],
+        {'gene_model': read_gene_model(source) or source.name, 'source': source.name}
+    )
+
+# =============================================================================
+# Loading (built once, cached per process)
+# =============================================================================
+
+_LOADED: Dict[Path, GeneIndex] = {}
+
+def load_gene_index(path: Union[str, Path] = DEFAULT_INDEX_PATH,
+                    source: Optional[Union[str, Path]] = None,
+                    allow_seed: bool = True) -> Optional[GeneIndex]:
+    """
+    Shared gene index, built on first use
+
+    The saved index is used as-is unless `source` names a different gene
+    model, in which case it is rebuilt from `source`. Without a saved index
+    it is built from `source` or the first annotated count file under
+    data/tcga_raw.
+
+    Args:
+        path: Saved index location
+        source: Count file the index should match (e.g. the files being ingested)
+        allow_seed: Fall back to the anchor-gene seed if nothing can be built
+
+    Returns:
+        GeneIndex (None if nothing can be built and allow_seed is False)
+    """
+    path = Path(path)
+    index = _LOADED.get(path)
+    if index is None and path.exists():
+        index = GeneIndex.load(path)
+
+    if source is not None and index is not None and has_annotation(source):
+        model = read_gene_model(source) or Path(source).name
+        if model != index.meta['gene_model']:
+            print(f"  [GENE INDEX] Gene model changed ({index.meta['gene_model']} -> {model}); rebuilding")
+            index = None
+
+    if index is None:
+        if source is None or not has_annotation(source):
+            source = find_annotation_source()
+        if source is not None:
+            index = build_gene_index(source)
+            index.save(path)
+            n_dup = int((index._symbol_counts > 1).sum())
+            print(f"  [GENE INDEX] Built {index} from {Path(source).name} "
+                  f"({n_dup} symbols with several Ensembl IDs) -> {path}")
+        elif allow_seed:
+            print("  [GENE INDEX] No annotation source found; using anchor-gene seed")
+            index = GeneIndex.seed()
+        else:
+            return None
+
+    _LOADED[path] = index
+    return index
+
+# =============================================================================
+# Main
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the shared gene index")
+    parser.add_argument('--source', help="STAR count / annotation file to build from "
+                                         "(default: first annotated file under data/tcga_raw)")
+    parser.add_argument('--index', default=str(DEFAULT_INDEX_PATH), help="Index file")
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild even if the index exists")
+    parser.add_argument('--duplicates', help="Write the duplicate-symbol report to this CSV")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        source = args.source or find_annotation_source()
+        if source is None:
+            raise SystemExit("No annotated count file found; pass --source")
+        build_gene_index(source).save(args.index)
+    index = load_gene_index(args.index, source=args.source, allow_seed=False)
+    if index is None:
+        raise SystemExit("No gene index and no annotated count file found; pass --source")
+
+    duplicates = index.duplicate_symbols()
+    print(f"{index}: source={index.meta.get('source')}, "
+          f"{duplicates['symbol'].nunique()} duplicate symbols ({len(duplicates)} genes)")
+    if args.duplicates:
+        duplicates.to_csv(args.duplicates, index=False)
+        print(f"[SAVED] {args.duplicates}")
+
+if __name__ == "__main__":
+    main()
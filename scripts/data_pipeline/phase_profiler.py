@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Phase Resource Profiler
+Runs a pipeline phase subprocess while sampling its resource usage
+
+Per phase:
+- Wall time, CPU time (user + system) and CPU utilization (cores busy)
+- Peak RSS of the whole process tree (sampled) and of the largest process
+- Block I/O read/written (from the kernel's rusage on exit)
+- Logical bytes read/written and child-process count (sampled)
+
+Sampling reads /proc (Linux); final totals come from os.wait4, which also
+covers descendants that exited between samples. Elsewhere phases still run,
+only with wall time.
+
+write_timeline() turns the collected profiles into a JSON report and a
+self-contained HTML Gantt chart of the run.
+
+Author: Automated Pipeline
+Date: 2025-11-02
+"""
+
+import os
+import sys
+import json
+import html
+import time
+import signal
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+PROC_DIR = Path("/proc")
+SAMPLE_INTERVAL = 0.5
+CPU_BOUND_UTILIZATION = 0.8   # >= 0.8 busy cores on average: CPU-bound
+
+HAS_PROC = PROC_DIR.is_dir() and sys.platform.startswith('linux')
+HAS_WAIT4 = hasattr(os, 'wait4')
+
+# =============================================================================
+# /proc Sampling
+# =============================================================================
+
+def _read_proc_stat(pid: int) -> Optional[Tuple[int, float]]:
+    """(parent pid, CPU seconds) of a process, None if it is gone"""
+    try:
+        with open(PROC_DIR / str(pid) / "stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    ticks = os.sysconf('SC_CLK_TCK')
+    return int(fields[1]), (int(fields[11]) + int(fields[12])) / ticks
+
+def _read_proc_rss(pid: int) -> int:
+    try:
+        with open(PROC_DIR / str(pid) / "statm") as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, IndexError, ValueError):
+        return 0
+
+def _read_proc_io(pid: int) -> Tuple[int, int]:
+    """Logical bytes read/written (rchar, wchar)"""
+    values = {}
+    try:
+        with open(PROC_DIR / str(pid) / "io") as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                values[key] = int(value)
+    except (OSError, ValueError):
+        pass
+    return values.get('rchar', 0), values.get('wchar', 0)
+
+def process_tree(root_pid: int) -> Dict[int, float]:
+    """
+    CPU seconds of a process and all its live descendants
+
+    Args:
+        root_pid: Root process ID
+
+    Returns:
+        Dictionary pid -> CPU seconds
+    """
+    stats = {}
+    for entry in PROC_DIR.iterdir():
+        if entry.name.isdigit():
+            stat = _read_proc_stat(int(entry.name))
+            if stat is not None:
+                stats[int(entry.name)] = stat
+
+    tree, frontier = {}, [root_pid]
+    while frontier:
+        pid = frontier.pop()
+        if pid in stats and pid not in tree:
+            tree[pid] = stats[pid][1]
+            frontier.extend(child for child, (ppid, _) in stats.items() if ppid == pid)
+    return tree
+
+def sample_tree(root_pid: int) -> Optional[Dict]:
+    """
+    One resource sample of a process tree
+
+    Args:
+        root_pid: Root process ID
+
+    Returns:
+        Sample dict (None if the process is gone)
+    """
+    tree = process_tree(root_pid)
+    if not tree:
+        return None
+    io = [_read_proc_io(pid) for pid in tree]
+    return {
+        'cpu_s': sum(tree.values()),
+        'rss_bytes': sum(_read_proc_rss(pid) for pid in tree),
+        'read_chars': sum(r for r, _ in io),
+        'write_chars': sum(w for _, w in io),
+        'n_procs': len(tree)
+    }
+
+# =============================================================================
+# Profiled Execution
+# =============================================================================
+
+def _kill_tree(proc: subprocess.Popen):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (AttributeError, OSError):
+        proc.kill()
+
+def _sample_until_exit(proc: subprocess.Popen, cmd: List[str], profile: Dict,
+                       timeout: float, interval: float):
+    """Sample the process tree until it exits; returns (rusage, last sample, peak RSS, max procs)"""
+    peak_rss, max_procs, last = 0, 0, None
+    rusage = None
+    while True:
+        if HAS_WAIT4:
+            pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                rusage = usage
+        else:
+            proc.poll()
+        if proc.returncode is not None:
+            return rusage, last, peak_rss, max_procs
+
+        elapsed = time.time() - profile['start']
+        if elapsed > timeout:
+            _kill_tree(proc)
+            proc.wait()
+            raise subprocess.TimeoutExpired(cmd, timeout)
+
+        if HAS_PROC:
+            sample = sample_tree(proc.pid)
+            if sample is not None:
+                last = sample
+                peak_rss = max(peak_rss, sample['rss_bytes'])
+                max_procs = max(max_procs, sample['n_procs'])
+                profile['samples'].append([round(elapsed, 2), round(sample['cpu_s'], 2),
+                                           round(sample['rss_bytes'] / 1024**2, 1),
+                                           sample['n_procs']])
+        time.sleep(interval)
+
+def run_profiled(cmd: List[str], cwd: Path, env: Dict, timeout: float,
+                 interval: float = SAMPLE_INTERVAL) -> Tuple[int, str, str, Dict]:
+    """
+    Run a command like subprocess.run(capture_output=True), sampling resources
+
+    Args:
+        cmd: Command
+        cwd: Working directory
+        env: Environment
+        timeout: Seconds before the process tree is killed
+        interval: Seconds between samples
+
+    Returns:
+        (returncode, stdout, stderr, profile)
+
+    Raises:
+        subprocess.TimeoutExpired: If the command exceeds the timeout
+    """
+    profile = {'start': time.time(), 'samples': []}
+
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        popen_kwargs = {'start_new_session': True} if HAS_WAIT4 else {}
+        proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=out, stderr=err, **popen_kwargs)
+
+        try:
+            rusage, last, peak_rss, max_procs = _sample_until_exit(proc, cmd, profile,
+                                                                   timeout, interval)
+        except BaseException:
+            # Own session: children would survive an interrupt of the runner
+            if proc.returncode is None:
+                _kill_tree(proc)
+                proc.wait()
+            raise
+
+        out.seek(0)
+        err.seek(0)
+        stdout = out.read().decode('utf-8', errors='replace')
+        stderr = err.read().decode('utf-8', errors='replace')
+
+    profile['end'] = time.time()
+    wall = profile['end'] - profile['start']
+    profile['wall_s'] = wall
+
+    if rusage is not None:
+        cpu_s = rusage.ru_utime + rusage.ru_stime
+        # ru_maxrss is KB on Linux, bytes on macOS
+        max_rss = rusage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        profile.update({
+            'cpu_s': cpu_s,
+            'max_rss_mb': max_rss / 1024**2,
+            'io_read_mb': rusage.ru_inblock * 512 / 1024**2,
+            'io_write_mb': rusage.ru_oublock * 512 / 1024**2,
+        })
+    elif last is not None:
+        profile['cpu_s'] = last['cpu_s']
+
+    if last is not None:
+        profile.update({
+            'read_chars_mb': last['read_chars'] / 1024**2,
+            'write_chars_mb': last['write_chars'] / 1024**2,
+        })
+    profile['peak_rss_mb'] = max(peak_rss / 1024**2, profile.get('max_rss_mb', 0.0)) or None
+    profile['max_children'] = max(max_procs - 1, 0)
+
+    if profile.get('cpu_s') is not None and wall > 0:
+        profile['cpu_utilization'] = profile['cpu_s'] / wall
+        profile['bound'] = 'cpu' if profile['cpu_utilization'] >= CPU_BOUND_UTILIZATION else 'io/wait'
+
+    return proc.returncode, stdout, stderr, profile
+
+# =============================================================================
+# Timeline Report
+# =============================================================================
+
+STATUS_COLORS = {
+    'ok': '#2ca02c',
+    'cached': '#17becf',
+    'failed': '#d62728',
+    'timeout': '#ff7f0e',
+    'error': '#d62728',
+    'skipped': '#7f7f7f'
+}
+
+def _fmt(value, fmt: str = '{:.1f}') -> str:
+    return '-' if value is None else fmt.format(value)
+
+def write_timeline(profiles: List[Dict], json_path: Path, html_path: Path,
+                   title: str = "Pipeline Timeline") -> None:
+    """
+    Write a JSON report and an HTML Gantt chart of phase profiles
+
+    Args:
+        profiles: Per-phase profiles (phase, name, status, start, end + metrics)
+        json_path: JSON output path
+        html_path: HTML output path
+        title: Report title
+    """
+    profiles = sorted((p for p in profiles if p.get('start') is not None), key=lambda p: p['start'])
+    t0 = min((p['start'] for p in profiles), default=0.0)
+    t1 = max((p['end'] for p in profiles), default=t0)
+    span = max(t1 - t0, 1e-6)
+
+    with open(json_path, 'w') as f:
+        json.dump({'title': title, 'start': t0, 'end': t1, 'wall_s': t1 - t0,
+                   'phases': profiles}, f, indent=2)
+
+    row_h, label_w, chart_w = 26, 260, 900
+    bars = []
+    for i, p in enumerate(profiles):
+        x = label_w + (p['start'] - t0) / span * chart_w
+        w = max((p['end'] - p['start']) / span * chart_w, 2)
+        y = 30 + i * row_h
+        tip = (f"{p['phase']} {p.get('name', '')}: {p.get('wall_s', 0):.1f}s wall, "
+               f"CPU {_fmt(p.get('cpu_s'))}s, peak RSS {_fmt(p.get('peak_rss_mb'))} MB, "
+               f"bound: {p.get('bound', '-')}")
+        bars.append(
+            f'<text x="4" y="{y + 16}">{html.escape(p["phase"])} {html.escape(p.get("name", ""))[:30]}</text>'
+            f'<rect x="{x:.1f}" y="{y + 4}" width="{w:.1f}" height="{row_h - 8}" '
+            f'fill="{STATUS_COLORS.get(p.get("status"), "#1f77b4")}">'
+            f'<title>{html.escape(tip)}</title></rect>')
+
+    axis = ''.join(
+        f'<line x1="{label_w + k / 10 * chart_w:.1f}" y1="20" x2="{label_w + k / 10 * chart_w:.1f}" '
+        f'y2="{30 + len(profiles) * row_h}" stroke="#ddd"/>'
+        f'<text x="{label_w + k / 10 * chart_w:.1f}" y="14" font-size="10">{k / 10 * span / 60:.1f}m</text>'
+        for k in range(11))
+
+    rows = ''.join(
+        f"<tr><td>{html.escape(p['phase'])}</td><td>{html.escape(p.get('name', ''))}</td>"
+        f"<td>{html.escape(p.get('status', ''))}</td><td>{_fmt(p.get('wall_s'))}</td>"
+        f"<td>{_fmt(p.get('cpu_s'))}</td><td>{_fmt(p.get('cpu_utilization'), '{:.2f}')}</td>"
+        f"<td>{_fmt(p.get('peak_rss_mb'))}</td><td>{_fmt(p.get('io_read_mb'))}</td>"
+        f"<td>{_fmt(p.get('io_write_mb'))}</td><td>{p.get('max_children', '-')}</td>"
+        f"<td>{html.escape(p.get('bound', '-'))}</td></tr>"
+        for p in profiles)
+
+    height = 40 + len(profiles) * row_h
+    page = f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(title)}</title>
+<style>
+body {{ font-family: sans-serif; font-size: 13px; margin: 20px; }}
+svg text {{ font-size: 12px; }}
+table {{ border-collapse: collapse; margin-top: 20px; }}
+td, th {{ border: 1px solid #ccc; padding: 3px 8px; text-align: right; }}
+td:nth-child(2), td:nth-child(3) {{ text-align: left; }}
+</style></head><body>
+<h2>{html.escape(title)}</h2>
+<p>Total wall time: {(t1 - t0) / 60:.1f} min, {len(profiles)} phases</p>
+<svg width="{label_w + chart_w + 20}" height="{height}">{axis}{''.join(bars)}</svg>
+<table><tr><th>Phase</th><th>Name</th><th>Status</th><th>Wall (s)</th><th>CPU (s)</th>
+<th>Cores busy</th><th>Peak RSS (MB)</th><th>Read (MB)</th><th>Written (MB)</th>
+<th>Max children</th><th>Bound</th></tr>{rows}</table>
+</body></html>
+"""
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(page)
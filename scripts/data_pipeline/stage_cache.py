@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Content-addressed Stage Cache
+Skips pipeline stages whose inputs, script and parameters have not changed
+
+Cache key = SHA-256 over the stage name, its parameters and the content
+hashes of its script, the repo-local modules it imports (found by parsing
+imports and sys.path inserts, transitively) and its declared input
+files/directories. Declared outputs are stored as content-addressed blobs,
+so identical files produced by different runs or stages are kept once.
+
+On a hit the outputs are restored (only files whose content differs are
+copied back) and the stage is not executed. File hashes are memoized on
+(size, mtime_ns), so checking an unchanged multi-GB expression matrix costs
+a stat call, not a re-read.
+
+Layout:
+    <cache_dir>/objects/ab/abcdef...   Output file blobs
+    <cache_dir>/entries/<key>.json     Stage outputs (path -> blob hash)
+    <cache_dir>/hashes.json            Memoized file hashes
+
+The cache is bounded by disk size: least recently used entries are evicted
+until the blobs fit in max_bytes.
+
+Usage:
+    cache = StageCache()
+    key = cache.stage_key("2B", script, inputs=[expr_file], params={...})
+    if not cache.restore(key):
+        run_stage()
+        cache.store(key, "2B", outputs=[output_dir])
+
+Author: Automated Pipeline
+Date: 2025-11-02
+"""
+
+import os
+import ast
+import json
+import time
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+PathLike = Union[str, Path]
+
+BASE_DIR = Path(__file__).parent.parent.parent
+CACHE_DIR = BASE_DIR / "outputs" / ".stage_cache"
+
+CACHE_FORMAT_VERSION = 2
+DEFAULT_MAX_BYTES = int(float(os.environ.get('STAGE_CACHE_MAX_GB', '20')) * 1024**3)
+HASH_BLOCK_SIZE = 1 << 20
+
+# =============================================================================
+# File Hashing
+# =============================================================================
+
+def sha256_file(path: Path) -> str:
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def iter_files(path: Path) -> List[Path]:
+    """A file itself, or all files below a directory (sorted, hidden files skipped)"""
+    if path.is_file():
+        return [path]
+    if not path.is_dir():
+        return []
+    return sorted(p for p in path.rglob('*')
+                  if p.is_file() and not any(part.startswith('.') for part in p.relative_to(path).parts))
+
+# =============================================================================
+# Local Imports
+# =============================================================================
+
+def _eval_path(node: ast.AST, script: Path, names: Dict[str, Path]) -> Optional[Path]:
+    """
+    Statically evaluate a path expression such as
+    str(Path(__file__).resolve().parent.parent / "analysis") (None if unknown)
+    """
+    if isinstance(node, ast.Name):
+        return names.get(node.id)
+    if isinstance(node, ast.Call):
+        func = node.func
+        if isinstance(func, ast.Name) and func.id in ('str', 'Path') and len(node.args) == 1:
+            arg = node.args[0]
+            if isinstance(arg, ast.Name) and arg.id == '__file__':
+                return script
+            return _eval_path(arg, script, names)
+        if isinstance(func, ast.Attribute) and func.attr in ('resolve', 'absolute') and not node.args:
+            return _eval_path(func.value, script, names)
+        return None
+    if isinstance(node, ast.Attribute) and node.attr == 'parent':
+        base = _eval_path(node.value, script, names)
+        return None if base is None else base.parent
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Div):
+        base = _eval_path(node.left, script, names)
+        if base is not None and isinstance(node.right, ast.Constant) and isinstance(node.right.value, str):
+            return base / node.right.value
+    return None
+
+def _scan_module(script: Path) -> Tuple[List[str], List[Path]]:
+    """Top-level module names imported by a script and the directories it adds to sys.path"""
+    try:
+        tree = ast.parse(script.read_text(encoding='utf-8', errors='replace'))
+    except (OSError, SyntaxError, ValueError):
+        return [], []
+
+    modules, search_dirs, names = [], [], {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules.append(node.module.split('.')[0])
+        elif isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            value = _eval_path(node.value, script.resolve(), names)
+            if value is not None:
+                names[node.targets[0].id] = value
+        elif (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+              and node.func.attr in ('insert', 'append')
+              and isinstance(node.func.value, ast.Attribute) and node.func.value.attr == 'path'
+              and isinstance(node.func.value.value, ast.Name) and node.func.value.value.id == 'sys'):
+            value = _eval_path(node.args[-1], script.resolve(), names) if node.args else None
+            if value is not None:
+                search_dirs.append(value)
+    return modules, search_dirs
+
+def local_imports(script: PathLike, root: PathLike) -> List[Path]:
+    """
+    Repo-local modules a script imports, directly or through other local modules
+
+    Imports are resolved against the importing file's directory and every
+    directory added to sys.path by the scripts seen so far (sys.path is
+    process-wide); modules outside root (stdlib, site-packages) are ignored.
+
+    Args:
+        script: Python script
+        root: Repository root
+
+    Returns:
+        Sorted module files (the script itself excluded)
+    """
+    script, root = Path(script).resolve(), Path(root).resolve()
+    if script.suffix != '.py' or not script.is_file():
+        return []
+    search_dirs: List[Path] = []
+    seen, queue = {script}, [script]
+    while queue:
+        current = queue.pop()
+        modules, added = _scan_module(current)
+        search_dirs.extend(d for d in added if d not in search_dirs)
+        for module in modules:
+            for directory in [current.parent] + search_dirs:
+                candidate = (directory / f"{module}.py").resolve()
+                if not candidate.is_file():
+                    candidate = (directory / module / "__init__.py").resolve()
+                if candidate.is_file():
+                    if candidate not in seen and root in candidate.parents:
+                        seen.add(candidate)
+                        queue.append(candidate)
+                    break
+    return sorted(seen - {script})
+
+# =============================================================================
+# Cache
+# =============================================================================
+
+class StageCache:
+    """
+    Content-addressed cache of stage outputs
+
+    Thread-safe within one process, so stages executed side by side can
+    share an instance.
+    """
+
+    def __init__(self, cache_dir: PathLike = CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 root: PathLike = BASE_DIR):
+        """
+        Args:
+            cache_dir: Cache location
+            max_bytes: Disk budget for stored outputs
+            root: Directory that input/output paths are relative to
+        """
+        self.cache_dir = Path(cache_dir)
+        self.objects_dir = self.cache_dir / "objects"
+        self.entries_dir = self.cache_dir / "entries"
+        self.memo_file = self.cache_dir / "hashes.json"
+        self.max_bytes = max_bytes
+        self.root = Path(root)
+
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.entries_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._memo = self._read_json(self.memo_file) or {}
+
+    # -------------------------------------------------------------------------
+    # Helpers
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def _read_json(path: Path) -> Optional[Dict]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_json(path: Path, data: Dict):
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+
+    def _resolve(self, path: PathLike) -> Path:
+        path = Path(path)
+        return path if path.is_absolute() else self.root / path
+
+    def _relative(self, path: Path) -> str:
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest
+
+    def _entry_path(self, key: str) -> Path:
+        return self.entries_dir / f"{key}.json"
+
+    def file_hash(self, path: Path) -> str:
+        """Content hash of a file, memoized on (size, mtime_ns)"""
+        stat = path.stat()
+        memo_key = str(path.resolve())
+        with self._lock:
+            cached = self._memo.get(memo_key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        digest = sha256_file(path)
+        with self._lock:
+            self._memo[memo_key] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def save_memo(self):
+        """Persist memoized file hashes"""
+        with self._lock:
+            self._write_json(self.memo_file, self._memo)
+
+    def path_hashes(self, path: PathLike) -> Dict[str, str]:
+        """
+        Content hashes for a file or every file in a directory
+
+        Args:
+            path: File or directory (relative to root or absolute)
+
+        Returns:
+            Dictionary relative path -> SHA-256 (empty if the path is missing)
+        """
+        return {self._relative(f): self.file_hash(f) for f in iter_files(self._resolve(path))}
+
+    # -------------------------------------------------------------------------
+    # Keys
+    # -------------------------------------------------------------------------
+
+    def stage_key(self, name: str, script: Optional[PathLike] = None,
+                  inputs: Iterable[PathLike] = (), params: Optional[Dict] = None) -> str:
+        """
+        Cache key for one stage execution
+
+        Args:
+            name: Stage name or ID
+            script: Stage script (its content and that of the repo-local
+                modules it imports are part of the key)
+            inputs: Input files or directories (missing paths are recorded as such)
+            params: JSON-serializable parameters (arguments, flags, ...)
+
+        Returns:
+            Hex SHA-256 key
+        """
+        paths = ([script] if script is not None else []) + list(inputs)
+        if script is not None:
+            paths += local_imports(self._resolve(script), self.root)
+        manifest = {
+            'version': CACHE_FORMAT_VERSION,
+            'stage': name,
+            'params': params or {},
+            'inputs': {self._relative(self._resolve(p)): self.path_hashes(p) for p in paths}
+        }
+        self.save_memo()
+        payload = json.dumps(manifest, sort_keys=True, default=str).encode()
+        return hashlib.sha256(payload).hexdigest()
+
+    # -------------------------------------------------------------------------
+    # Lookup / Restore / Store
+    # -------------------------------------------------------------------------
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        """Entry for a key if all its blobs are present"""
+        entry = self._read_json(self._entry_path(key))
+        if entry is None:
+            return None
+        if not all(self._blob_path(d).exists() for d in entry['outputs'].values()):
+            return None
+        return entry
+
+    def restore(self, key: str) -> bool:
+        """
+        Restore a stage's outputs from the cache
+
+        Files that already match the cached content are left untouched.
+
+        Args:
+            key: Stage key
+
+        Returns:
+            True on a cache hit (outputs are in place), False on a miss
+        """
+        with self._lock:
+            entry = self.lookup(key)
+            if entry is None:
+                return False
+
+            for rel_path, digest in entry['outputs'].items():
+                dest = self._resolve(rel_path)
+                if dest.is_file() and self.file_hash(dest) == digest:
+                    continue
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                tmp = dest.with_name(f".{dest.name}.restore")
+                shutil.copyfile(self._blob_path(digest), tmp)
+                os.replace(tmp, dest)
+
+            entry['last_used'] = time.time()
+            self._write_json(self._entry_path(key), entry)
+            self.save_memo()
+        return True
+
+    def store(self, key: str, name: str, outputs: Iterable[PathLike]) -> Dict:
+        """
+        Store a stage's outputs under its key
+
+        Args:
+            key: Stage key (from stage_key, computed before the stage ran)
+            name: Stage name or ID
+            outputs: Output files or directories (missing paths are skipped)
+
+        Returns:
+            The stored entry
+        """
+        files = {}
+        with self._lock:
+            for output in outputs:
+                for path in iter_files(self._resolve(output)):
+                    digest = self.file_hash(path)
+                    blob = self._blob_path(digest)
+                    if not blob.exists():
+                        blob.parent.mkdir(parents=True, exist_ok=True)
+                        tmp = blob.with_name(f".{digest}.tmp")
+                        shutil.copyfile(path, tmp)
+                        os.replace(tmp, blob)
+                    files[self._relative(path)] = digest
+
+            entry = {
+                'stage': name,
+                'key': key,
+                'created': time.time(),
+                'last_used': time.time(),
+                'outputs': files
+            }
+            self._write_json(self._entry_path(key), entry)
+            self.save_memo()
+            self.evict()
+        return entry
+
+    # -------------------------------------------------------------------------
+    # Eviction
+    # -------------------------------------------------------------------------
+
+    def _entries(self) -> List[Dict]:
+        entries = []
+        for path in self.entries_dir.glob('*.json'):
+            entry = self._read_json(path)
+            if entry is not None:
+                entries.append(entry)
+        return entries
+
+    def _blob_sizes(self) -> Dict[str, int]:
+        return {p.name: p.stat().st_size for p in self.objects_dir.glob('*/*')
+                if not p.name.startswith('.')}
+
+    def size(self) -> int:
+        """Bytes used by stored blobs"""
+        return sum(self._blob_sizes().values())
+
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        """
+        Drop least recently used entries until blobs fit the disk budget
+
+        Blobs no longer referenced by any entry are deleted.
+
+        Args:
+            max_bytes: Budget (default: self.max_bytes)
+
+        Returns:
+            Number of evicted entries
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda e: e.get('last_used', 0))
+            blob_sizes = self._blob_sizes()
+
+            def referenced_size(kept):
+                digests = {d for e in kept for d in e['outputs'].values()}
+                return sum(blob_sizes.get(d, 0) for d in digests), digests
+
+            total, live = referenced_size(entries)
+            n_evicted = 0
+            while entries and total > max_bytes:
+                evicted = entries.pop(0)
+                self._entry_path(evicted['key']).unlink(missing_ok=True)
+                n_evicted += 1
+                total, live = referenced_size(entries)
+
+            for digest in set(blob_sizes) - live:
+                self._blob_path(digest).unlink(missing_ok=True)
+
+        return n_evicted
+
+    def clear(self):
+        """Remove all entries and blobs"""
+        with self._lock:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            self.objects_dir.mkdir(parents=True, exist_ok=True)
+            self.entries_dir.mkdir(parents=True, exist_ok=True)
+            self._memo = {}
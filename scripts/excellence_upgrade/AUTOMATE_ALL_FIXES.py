@@ -28,24 +28,43 @@ print("="*80)
 SCRIPTS_DIR = Path(__file__).parent
 PROJECT_ROOT = SCRIPTS_DIR.parent.parent
 
+# Content-addressed stage cache: unchanged stages are restored, not re-run
+sys.path.insert(0, str(SCRIPTS_DIR.parent / "data_pipeline"))
+from stage_cache import StageCache
+
+stage_cache = None if '--no-cache' in sys.argv else StageCache(root=PROJECT_ROOT)
+
 stages = [
     {
         'name': 'Stage 2 v2: Fixed Stratified Cox Analysis',
         'script': 'stage2_v2_stratified_cox.py',
         'description': 'Fixes cross-cancer Cox + adds Schoenfeld test + VIF check',
-        'critical': True
+        'critical': True,
+        'inputs': ['outputs/tcga_full_cohort/expression_matrix.csv',
+                   'outputs/tcga_full_cohort/expression_matrix.store',
+                   'data/tcga_clinical_merged.csv',
+                   'outputs/reference/gene_index.npz'],
+        'outputs': ['outputs/survival_analysis_v2_fixed']
     },
     {
         'name': 'Stage 3 v2: Fixed Partial Correlation',
         'script': 'stage3_v2_fixed_partial_correlation.py',
         'description': 'Fixes circular adjustment + adds true IFN- signature',
-        'critical': True
+        'critical': True,
+        'inputs': ['outputs/tcga_full_cohort/expression_matrix.csv'],
+        'outputs': ['outputs/partial_correlation_v2_fixed']
     },
     {
         'name': 'Stage 4: CPTAC Validation (rerun)',
         'script': 'stage4_cptac_validation.py',
         'description': 'Protein-level validation (no changes needed)',
-        'critical': False
+        'critical': False,
+        'inputs': ['data/cptac_proteomics.csv',
+                   'outputs/tcga_full_cohort_real/expression_matrix_full_real.csv',
+                   'outputs/tcga_full_cohort/expression_matrix.csv',
+                   'outputs/tcga_full_cohort/expression_matrix.store',
+                   'outputs/tcga_full_cohort/correlation_results.csv'],
+        'outputs': ['outputs/cptac_validation', 'data/cptac_proteomics_simulated.csv']
     }
 ]
 
@@ -85,12 +104,27 @@ for i, stage in enumerate(stages, 1):
             })
             continue
 
+    start_time = time.time()
+
+    # Skip unchanged stages
+    cache_key = None
+    if stage_cache is not None and stage.get('outputs'):
+        cache_key = stage_cache.stage_key(stage['script'], script_path, inputs=stage['inputs'])
+        if stage_cache.restore(cache_key):
+            runtime = time.time() - start_time
+            print(f"\n[CACHE] Inputs unchanged - outputs restored from cache ({runtime:.2f}s)")
+            results.append({
+                'stage': stage['name'],
+                'status': 'SUCCESS',
+                'reason': 'Cached',
+                'runtime': runtime
+            })
+            continue
+
     # Execute stage
     print(f"\n[RUN] Executing: python {script_path.name}")
     print("-" * 80)
 
-    start_time = time.time()
-
     try:
         # Run script
         result = subprocess.run(
@@ -113,6 +147,8 @@ for i, stage in enumerate(stages, 1):
         # Check success
         if result.returncode == 0:
             print(f"\n[OK] SUCCESS: {stage['name']} completed in {runtime:.1f}s")
+            if cache_key is not None:
+                stage_cache.store(cache_key, stage['script'], stage['outputs'])
             results.append({
                 'stage': stage['name'],
                 'status': 'SUCCESS',
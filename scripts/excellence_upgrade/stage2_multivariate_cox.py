@@ -3,6 +3,7 @@
 Stage 2: Real Multivariate Cox Survival Analysis
 解決「模擬數據」批評 - 使用真實 TCGA clinical outcomes
 """
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
@@ -13,6 +14,12 @@ from lifelines.statistics import multivariate_logrank_test
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "data_pipeline"))
+from expression_store import load_expression
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "survival_analysis"))
+from cox_validation import validate_cox
+
 print("="*70)
 print("STAGE 2: MULTIVARIATE COX SURVIVAL ANALYSIS")
 print("="*70)
@@ -25,7 +32,7 @@ expr_file = Path("outputs/tcga_full_cohort/expression_matrix.csv")
 if not expr_file.exists():
     raise FileNotFoundError(f"Expression matrix not found: {expr_file}")
 
-expr_df = pd.read_csv(expr_file)
+expr_df = load_expression(expr_file)
 print(f"  Loaded {len(expr_df)} samples")
 
 # ============================================================================
@@ -266,6 +273,18 @@ cox_results_file = output_dir / "multivariate_cox_results.csv"
 cph.summary.to_csv(cox_results_file)
 print(f"\n[SAVED] {cox_results_file}")
 
+# Internal validation: bootstrap optimism-corrected C-index, 5-fold AUC(t)/Brier(t)
+covariates = [c for c in cox_columns if c not in ('OS_months', 'OS_event')]
+validation = validate_cox(cox_data, 'OS_months', 'OS_event', covariates, penalizer=0.01,
+                          n_bootstrap=200, n_folds=5, times=[12, 36, 60])
+print(f"  C-index: apparent={validation['c_index']:.3f}, "
+      f"optimism={validation['optimism']:.3f}, corrected={validation['c_index_corrected']:.3f}")
+print(validation['cv_summary'].to_string(index=False))
+validation['bootstrap'].to_csv(output_dir / "validation_bootstrap.csv", index=False)
+validation['cv'].to_csv(output_dir / "validation_cv.csv", index=False)
+print(f"[SAVED] {output_dir / 'validation_bootstrap.csv'}")
+print(f"[SAVED] {output_dir / 'validation_cv.csv'}")
+
 # ============================================================================
 # 6. Visualizations
 # ============================================================================
@@ -391,6 +410,13 @@ summary = {
     'n_events': int(cox_data['OS_event'].sum()),
     'censoring_rate': float(1 - cox_data['OS_event'].mean()),
     'median_followup_months': float(cox_data['OS_months'].median()),
+    'validation': {
+        'c_index_apparent': validation['c_index'],
+        'c_index_optimism': validation['optimism'],
+        'c_index_corrected': validation['c_index_corrected'],
+        'n_bootstrap': validation['n_bootstrap'],
+        'cv': validation['cv_summary'].to_dict(orient='records')
+    },
     'gene_effects': {}
 }
 
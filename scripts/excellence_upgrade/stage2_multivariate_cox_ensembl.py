@@ -3,6 +3,7 @@
 Stage 2: Real Multivariate Cox Survival Analysis (Ensembl ID compatible)
 解決「模擬數據」批評 - 使用真實 TCGA clinical outcomes
 """
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
@@ -13,6 +14,9 @@ from lifelines.statistics import multivariate_logrank_test
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "data_pipeline"))
+from gene_index import load_gene_index
+
 print("="*70)
 print("STAGE 2: MULTIVARIATE COX SURVIVAL ANALYSIS")
 print("="*70)
@@ -20,13 +24,10 @@ print("="*70)
 # ============================================================================
 # Gene mapping: Ensembl ID -> Gene Symbol
 # ============================================================================
-GENE_MAP = {
-    'ENSG00000120217': 'CD274',   # PD-L1
-    'ENSG00000091317': 'CMTM6',
-    'ENSG00000103266': 'STUB1',   # CHIP
-    'ENSG00000107018': 'HIP1R',
-    'ENSG00000161011': 'SQSTM1',  # p62
-}
+# Resolved through the shared gene index (data_pipeline/gene_index.py)
+TARGET_GENES = ['CD274', 'CMTM6', 'STUB1', 'HIP1R', 'SQSTM1']
+GENE_MAP = {ensembl_id: symbol
+            for symbol, ensembl_id in load_gene_index().symbol_map(TARGET_GENES).items()}
 
 # ============================================================================
 # 1. Load expression data
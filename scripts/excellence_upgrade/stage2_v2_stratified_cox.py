@@ -4,16 +4,26 @@ Stage 2 v2: FIXED Stratified Cox Survival Analysis
 Cox - Cox
  Schoenfeld  + 
 """
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
 import matplotlib.pyplot as plt
 import seaborn as sns
 from lifelines import CoxPHFitter, KaplanMeierFitter
-from lifelines.statistics import multivariate_logrank_test, proportional_hazard_test
+from lifelines.statistics import multivariate_logrank_test
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "data_pipeline"))
+from expression_store import load_expression
+from gene_index import load_gene_index
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "survival_analysis"))
+from cox_engine import cox_screen
+from stratified_survival import run_stratified_cox
+from cox_validation import validate_cox
+from cox_diagnostics import GramCache, proportional_hazards_test
+
 print("="*70)
 print("STAGE 2 v2: STRATIFIED MULTIVARIATE COX ANALYSIS")
 print("="*70)
@@ -27,25 +37,22 @@ print("="*70)
 # ============================================================================
 # Gene mapping: Ensembl ID -> Gene Symbol
 # ============================================================================
-GENE_MAP = {
-    'ENSG00000120217': 'CD274',   # PD-L1
-    'ENSG00000091317': 'CMTM6',
-    'ENSG00000103266': 'STUB1',   # CHIP
-    'ENSG00000107018': 'HIP1R',
-    'ENSG00000161011': 'SQSTM1',  # p62
-}
+# Resolved through the shared gene index (data_pipeline/gene_index.py)
+TARGET_GENES = ['CD274', 'CMTM6', 'STUB1', 'HIP1R', 'SQSTM1']
+GENE_MAP = {ensembl_id: symbol
+            for symbol, ensembl_id in load_gene_index().symbol_map(TARGET_GENES).items()}
 
 # ============================================================================
 # 1. Load Data
 # ============================================================================
 print("\n[STEP 1] Loading data...")
 expr_file = Path("outputs/tcga_full_cohort/expression_matrix.csv")
-expr_df = pd.read_csv(expr_file)
+genes = TARGET_GENES
+expr_df = load_expression(expr_file, genes=genes + list(GENE_MAP))
 print(f"  Expression: {len(expr_df)} samples")
 
 # Check if columns are Ensembl IDs or gene symbols
-sample_col = expr_df.columns[0]
-if sample_col.startswith('ENSG'):
+if any(c.startswith('ENSG') for c in expr_df.columns):
     print("  ⚠️  Detected Ensembl IDs - converting to gene symbols")
     rename_dict = {}
     for ensembl_id, gene_symbol in GENE_MAP.items():
@@ -155,7 +162,6 @@ print(f"  Final: {len(merged_df)} samples")
 print(f"  Events: {merged_df['OS_event'].sum()} ({merged_df['OS_event'].mean()*100:.1f}%)")
 
 # Normalize gene expression
-genes = ['CD274', 'CMTM6', 'STUB1', 'HIP1R', 'SQSTM1']
 for gene in genes:
     merged_df[f'{gene}_z'] = (merged_df[gene] - merged_df[gene].mean()) / merged_df[gene].std()
 
@@ -189,19 +195,29 @@ print("STRATIFIED COX RESULTS (Primary Analysis)")
 print("="*70)
 print(cph_strat.summary.to_string())
 
+# Univariate stratified Cox for every gene, fitted in one batch
+univariate_df = cox_screen(cox_data[[f'{g}_z' for g in genes]], cox_data['OS_months'],
+                           cox_data['OS_event'], strata=cox_data['cancer_type'])
+univariate_df.index = genes
+
+print("\n" + "="*70)
+print("UNIVARIATE STRATIFIED COX RESULTS")
+print("="*70)
+print(univariate_df[['HR', 'HR_lower', 'HR_upper', 'p_wald', 'p_score', 'q_wald']].to_string())
+
 # ============================================================================
 # 4. Check Proportional Hazards Assumption
 # ============================================================================
 print("\n[STEP 4] Checking proportional hazards assumption...")
 
-# Schoenfeld residuals test
+# Schoenfeld residuals test (Grambsch-Therneau, within cancer-type strata)
+ph_test_results = None
 try:
-    from lifelines.statistics import proportional_hazard_test
-
-    ph_test_results = proportional_hazard_test(
-        cph_strat,
-        cox_data,
-        time_transform='rank'
+    ph_covariates = list(cph_strat.params_.index)
+    ph_test_results = proportional_hazards_test(
+        cox_data[ph_covariates], cox_data['OS_months'], cox_data['OS_event'],
+        cph_strat.params_, cph_strat.variance_matrix_.loc[ph_covariates, ph_covariates],
+        strata=cox_data['cancer_type'], time_transform='rank'
     )
 
     print("\n" + "="*70)
@@ -221,67 +237,47 @@ except Exception as e:
 # ============================================================================
 print("\n[STEP 5] Checking multicollinearity (VIF)...")
 
-from statsmodels.stats.outliers_influence import variance_inflation_factor
-
-vif_data = cox_data[[c for c in cox_columns if '_z' in c or c in ['age_years', 'gender_male', 'stage_advanced']]]
-vif_results = pd.DataFrame({
-    'Variable': vif_data.columns,
-    'VIF': [variance_inflation_factor(vif_data.values, i) for i in range(vif_data.shape[1])]
-})
+# All VIFs and condition indices from one Gram matrix (cached per covariate set)
+vif_columns = [c for c in cox_columns if '_z' in c or c in ['age_years', 'gender_male', 'stage_advanced']]
+collinearity = GramCache(cox_data, vif_columns).report(vif_columns)
+vif_results = collinearity['vif'][['Variable', 'VIF']]
 
 print("\n" + "="*70)
 print("VARIANCE INFLATION FACTORS (VIF)")
 print("="*70)
 print(vif_results.to_string(index=False))
+print(f"\n  Condition number: {collinearity['condition_number']:.2f}")
 print("\nInterpretation:")
 print("  - VIF < 5: Low multicollinearity")
 print("  - VIF 5-10: Moderate multicollinearity")
 print("  - VIF > 10: High multicollinearity (consider removing)")
+print("  - Condition number > 30: Strong dependency (see condition indices)")
 
 # ============================================================================
 # 6. Per-Cancer Cox Models
 # ============================================================================
 print("\n[STEP 6] Per-cancer Cox models...")
 
-per_cancer_results = []
-
-for cancer in cox_data['cancer_type'].unique():
-    print(f"\n  Analyzing {cancer}...")
-    cancer_data = cox_data[cox_data['cancer_type'] == cancer].copy()
-
-    if len(cancer_data) < 50 or cancer_data['OS_event'].sum() < 20:
-        print(f"     Insufficient events in {cancer} (n={len(cancer_data)}, events={cancer_data['OS_event'].sum()})")
-        continue
-
-    # Drop cancer_type column for this model
-    cancer_cox_data = cancer_data.drop('cancer_type', axis=1)
-
-    # Fit Cox
-    cph_cancer = CoxPHFitter(penalizer=0.01)
-    try:
-        cph_cancer.fit(cancer_cox_data, duration_col='OS_months', event_col='OS_event')
-
-        # Extract gene effects
-        for gene in genes:
-            gene_z = f'{gene}_z'
-            if gene_z in cph_cancer.summary.index:
-                per_cancer_results.append({
-                    'cancer_type': cancer,
-                    'gene': gene,
-                    'HR': cph_cancer.summary.loc[gene_z, 'exp(coef)'],
-                    'HR_lower': cph_cancer.summary.loc[gene_z, 'exp(coef) lower 95%'],
-                    'HR_upper': cph_cancer.summary.loc[gene_z, 'exp(coef) upper 95%'],
-                    'p': cph_cancer.summary.loc[gene_z, 'p'],
-                    'n_samples': len(cancer_cox_data),
-                    'n_events': int(cancer_cox_data['OS_event'].sum())
-                })
-
-        print(f"     {cancer}: n={len(cancer_cox_data)}, events={int(cancer_cox_data['OS_event'].sum())}")
+# Fitted in parallel, each starting from the pooled stratified coefficients
+per_cancer_covariates = [c for c in cox_columns if c not in ('OS_months', 'OS_event', 'cancer_type')]
+_, per_cancer_coefs, per_cancer_diagnostics = run_stratified_cox(
+    cox_data, 'OS_months', 'OS_event', 'cancer_type', per_cancer_covariates,
+    penalizer=0.01, initial_point=cph_strat.params_, min_samples=50, min_events=20
+)
 
-    except Exception as e:
-        print(f"     Cox failed for {cancer}: {e}")
+for row in per_cancer_diagnostics.itertuples(index=False):
+    if row.status == 'ok':
+        print(f"     {row.stratum}: n={row.n_samples}, events={row.n_events}, iterations={row.n_iter}")
+    elif row.status == 'skipped':
+        print(f"     Insufficient events in {row.stratum} (n={row.n_samples}, events={row.n_events})")
+    else:
+        print(f"     Cox failed for {row.stratum}: {row.message}")
 
-per_cancer_df = pd.DataFrame(per_cancer_results)
+is_gene = per_cancer_coefs['covariate'].isin([f'{gene}_z' for gene in genes])
+per_cancer_df = per_cancer_coefs[is_gene].rename(columns={'stratum': 'cancer_type'})
+per_cancer_df['gene'] = per_cancer_df['covariate'].str[:-len('_z')]
+per_cancer_df = per_cancer_df[['cancer_type', 'gene', 'HR', 'HR_lower', 'HR_upper', 'p',
+                               'n_samples', 'n_events']].reset_index(drop=True)
 
 print("\n" + "="*70)
 print("PER-CANCER COX RESULTS")
@@ -291,6 +287,15 @@ if len(per_cancer_df) > 0:
 else:
     print("  No per-cancer results available")
 
+# Internal validation of the stratified model (bootstrap optimism, 5-fold AUC/Brier)
+print("\n[STEP 6b] Internal validation of the stratified model...")
+validation = validate_cox(cox_data, 'OS_months', 'OS_event', per_cancer_covariates,
+                          strata_col='cancer_type', penalizer=0.01,
+                          n_bootstrap=200, n_folds=5, times=[12, 36, 60])
+print(f"  C-index: apparent={validation['c_index']:.3f}, "
+      f"optimism={validation['optimism']:.3f}, corrected={validation['c_index_corrected']:.3f}")
+print(validation['cv_summary'].to_string(index=False))
+
 # ============================================================================
 # 7. Visualizations
 # ============================================================================
@@ -434,20 +439,47 @@ print("\n[STEP 8] Saving results...")
 cph_strat.summary.to_csv(output_dir / "stratified_cox_results.csv")
 print(f"[SAVED] {output_dir / 'stratified_cox_results.csv'}")
 
+# Univariate stratified screen
+univariate_df.to_csv(output_dir / "univariate_stratified_cox.csv", index_label='gene')
+print(f"[SAVED] {output_dir / 'univariate_stratified_cox.csv'}")
+
 # Per-cancer results
 if len(per_cancer_df) > 0:
     per_cancer_df.to_csv(output_dir / "per_cancer_cox_results.csv", index=False)
     print(f"[SAVED] {output_dir / 'per_cancer_cox_results.csv'}")
 
+per_cancer_diagnostics.to_csv(output_dir / "per_cancer_cox_diagnostics.csv", index=False)
+print(f"[SAVED] {output_dir / 'per_cancer_cox_diagnostics.csv'}")
+
+# Validation results
+validation['bootstrap'].to_csv(output_dir / "validation_bootstrap.csv", index=False)
+validation['cv'].to_csv(output_dir / "validation_cv.csv", index=False)
+print(f"[SAVED] {output_dir / 'validation_bootstrap.csv'}")
+print(f"[SAVED] {output_dir / 'validation_cv.csv'}")
+
 # VIF results
 vif_results.to_csv(output_dir / "vif_analysis.csv", index=False)
 print(f"[SAVED] {output_dir / 'vif_analysis.csv'}")
+collinearity['condition_indices'].to_csv(output_dir / "condition_indices.csv", index=False)
+print(f"[SAVED] {output_dir / 'condition_indices.csv'}")
+
+# Proportional hazards test
+if ph_test_results is not None:
+    ph_test_results.to_csv(output_dir / "proportional_hazards_test.csv")
+    print(f"[SAVED] {output_dir / 'proportional_hazards_test.csv'}")
 
 # Summary
 summary = {
     'n_samples': len(cox_data),
     'n_events': int(cox_data['OS_event'].sum()),
     'cancer_types': cox_data['cancer_type'].value_counts().to_dict(),
+    'validation': {
+        'c_index_apparent': validation['c_index'],
+        'c_index_optimism': validation['optimism'],
+        'c_index_corrected': validation['c_index_corrected'],
+        'n_bootstrap': validation['n_bootstrap'],
+        'cv': validation['cv_summary'].to_dict(orient='records')
+    },
     'stratified_cox': {
         gene: {
             'HR': float(cph_strat.summary.loc[f'{gene}_z', 'exp(coef)']),
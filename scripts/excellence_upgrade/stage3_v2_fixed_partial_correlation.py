@@ -8,11 +8,15 @@ import numpy as np
 from pathlib import Path
 import matplotlib.pyplot as plt
 import seaborn as sns
-from scipy import stats
 from sklearn.linear_model import LinearRegression
+import sys
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "analysis"))
+from partial_correlation_engine import partial_correlation_matrix
+from partial_correlation_bootstrap import bootstrap_ci
+
 print("="*70)
 print("STAGE 3 v2: FIXED PARTIAL CORRELATION ANALYSIS")
 print("="*70)
@@ -229,32 +233,6 @@ print(confounder_corr.to_string())
 # ============================================================================
 print("\n[STEP 6] Preparing partial correlation analysis...")
 
-def partial_correlation(data, x, y, covars):
-    """Calculate partial correlation (regression residuals method)"""
-    from sklearn.linear_model import LinearRegression
-
-    X_covars = data[covars].values
-    X_x = data[[x]].values
-    X_y = data[[y]].values
-
-    # Regress x on covars
-    model_x = LinearRegression()
-    model_x.fit(X_covars, X_x)
-    residuals_x = X_x - model_x.predict(X_covars)
-
-    # Regress y on covars
-    model_y = LinearRegression()
-    model_y.fit(X_covars, X_y)
-    residuals_y = X_y - model_y.predict(X_covars)
-
-    # Pearson correlation of residuals
-    r_pearson, p_pearson = stats.pearsonr(residuals_x.ravel(), residuals_y.ravel())
-
-    # Spearman correlation of residuals (for robustness)
-    r_spearman, p_spearman = stats.spearmanr(residuals_x.ravel(), residuals_y.ravel())
-
-    return r_pearson, p_pearson, r_spearman, p_spearman
-
 # Merge expression + confounders
 analysis_df = expr_df.merge(confounders_df, on='sample_id')
 
@@ -311,17 +289,24 @@ covariate_sets = valid_covariate_sets
 
 # Run analyses
 print("\n[STEP 7] Running partial correlation analysis...")
+print("  (one residual projection per covariate set, all pairs at once)")
+
+# Full gene x gene matrices per covariate set; pairs are looked up afterwards
+set_matrices = {}
+for set_name, covars in covariate_sets.items():
+    covars_df = analysis_df[covars] if covars else None
+    r_pearson, p_pearson, _ = partial_correlation_matrix(analysis_df, covars_df, genes, method='pearson')
+    r_spearman, p_spearman, _ = partial_correlation_matrix(analysis_df, covars_df, genes, method='spearman')
+    set_matrices[set_name] = (r_pearson, p_pearson, r_spearman, p_spearman)
+
 results = []
 
 for gene1, gene2 in gene_pairs:
     row = {'gene1': gene1, 'gene2': gene2}
 
-    for set_name, covars in covariate_sets.items():
-        if covars:
-            r_p, p_p, r_s, p_s = partial_correlation(analysis_df, gene1, gene2, covars)
-        else:
-            r_p, p_p = stats.pearsonr(analysis_df[gene1], analysis_df[gene2])
-            r_s, p_s = stats.spearmanr(analysis_df[gene1], analysis_df[gene2])
+    for set_name, (r_pearson, p_pearson, r_spearman, p_spearman) in set_matrices.items():
+        r_p, p_p = r_pearson.at[gene1, gene2], p_pearson.at[gene1, gene2]
+        r_s, p_s = r_spearman.at[gene1, gene2], p_spearman.at[gene1, gene2]
 
         row[f'{set_name}_r_pearson'] = r_p
         row[f'{set_name}_p_pearson'] = p_p
@@ -355,27 +340,9 @@ for _, row in results_df.iterrows():
 print("\n[STEP 8] Calculating bootstrap confidence intervals...")
 
 def bootstrap_partial_corr(data, x, y, covars, n_bootstrap=1000):
-    """Bootstrap 95% CI for partial correlation"""
-    np.random.seed(42)
-
-    partial_corrs = []
-
-    for _ in range(n_bootstrap):
-        # Resample with replacement
-        indices = np.random.choice(len(data), size=len(data), replace=True)
-        boot_data = data.iloc[indices]
-
-        try:
-            r, _, _, _ = partial_correlation(boot_data, x, y, covars)
-            partial_corrs.append(r)
-        except:
-            continue
-
-    # 95% CI
-    ci_lower = np.percentile(partial_corrs, 2.5)
-    ci_upper = np.percentile(partial_corrs, 97.5)
-
-    return ci_lower, ci_upper
+    """Bootstrap 95% CI for partial correlation (vectorized replicate blocks)"""
+    confounders = data[covars] if covars else None
+    return bootstrap_ci(data[x], data[y], confounders, n_bootstrap=n_bootstrap, seed=42)
 
 print("  Calculating for CMTM6-STUB1 (key pair)...")
 full_covars = covariate_sets['Full']
@@ -1,27 +1,32 @@
 #!/usr/bin/env python3
 """
 Stage 3 v3: Parallel Partial Correlation with TIMER2.0 - 32-Core Optimized
-Uses joblib to leverage all 32 CPU cores for bootstrap parallelization
+Bootstrap replicates are computed in vectorized blocks spread over all cores
 
 Parallelization Strategy:
-- Level 1: Gene pairs analyzed in parallel (5 pairs)
-- Level 2: Bootstrap iterations parallelized (1000 per pair)
-- Total: Up to 32x speedup on 32-core system
+- Level 1: Gene pairs analyzed sequentially (5 pairs)
+- Level 2: Bootstrap blocks in parallel (1000 replicates per pair, 125 per block)
+- Each block: one count matrix + two matrix products, no per-replicate fits
 
 Author: Automated Pipeline
 Date: 2025-11-02
 """
 
+import sys
 import pandas as pd
 import numpy as np
 from scipy import stats
 from sklearn.linear_model import LinearRegression
 from pathlib import Path
 import json
-from joblib import Parallel, delayed
 import multiprocessing as mp
 import time
-import mygene
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "data_pipeline"))
+from expression_store import load_expression
+from gene_index import load_gene_index
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "analysis"))
+from partial_correlation_bootstrap import bootstrap_ci
 
 # =============================================================================
 # Configuration
@@ -38,6 +43,9 @@ OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 N_CORES = mp.cpu_count()
 print(f"System has {N_CORES} CPU cores available")
 
+# Bootstrap replicates computed per vectorized block (one block = one worker task)
+BOOTSTRAP_BLOCK_SIZE = 125
+
 # Gene pairs to analyze (using gene symbols)
 GENE_PAIRS = [
     ('CMTM6', 'STUB1'),
@@ -53,8 +61,8 @@ GENE_PAIRS = [
 
 def convert_symbols_to_ensembl(gene_symbols):
     """
-    Convert gene symbols to Ensembl IDs using MyGene.info API
-    with fallback to hardcoded mappings for known problematic genes
+    Convert gene symbols to Ensembl IDs using the shared local gene index
+    (gene_index.py; built from the STAR count annotation, no web queries)
 
     Args:
         gene_symbols: List of gene symbols
@@ -64,49 +72,18 @@ def convert_symbols_to_ensembl(gene_symbols):
     """
     print("\n[GENE MAPPING] Converting gene symbols to Ensembl IDs...")
 
-    # Hardcoded mappings for genes with known MyGene.info issues
-    FALLBACK_MAPPINGS = {
-        'SQSTM1': 'ENSG00000161011',  # p62, verified from NCBI/Ensembl
-        'CD274': 'ENSG00000120217',   # PD-L1
-    }
-
-    mg = mygene.MyGeneInfo()
+    gene_index = load_gene_index()
+    print(f"  Index: {gene_index}")
 
-    # Query MyGene.info
-    results = mg.querymany(
-        gene_symbols,
-        scopes='symbol',
-        fields='ensembl.gene',
-        species='human',
-        verbose=False
-    )
+    mapping = gene_index.symbol_map(gene_symbols)
+    duplicates = gene_index.duplicate_symbols()
+    ambiguous = set(duplicates['symbol']) & set(mapping)
 
-    # Process results
-    mapping = {}
-    not_found = []
-
-    for result in results:
-        query_symbol = result.get('query')
-
-        if result.get('notfound'):
-            # Try fallback mapping
-            if query_symbol in FALLBACK_MAPPINGS:
-                mapping[query_symbol] = FALLBACK_MAPPINGS[query_symbol]
-                print(f"  {query_symbol} -> {FALLBACK_MAPPINGS[query_symbol]} (fallback)")
-            else:
-                not_found.append(query_symbol)
-        elif 'ensembl' in result and 'gene' in result['ensembl']:
-            ensembl_id = result['ensembl']['gene']
-            mapping[query_symbol] = ensembl_id
-            print(f"  {query_symbol} -> {ensembl_id}")
-        else:
-            # Try fallback mapping if MyGene.info doesn't return ensembl field
-            if query_symbol in FALLBACK_MAPPINGS:
-                mapping[query_symbol] = FALLBACK_MAPPINGS[query_symbol]
-                print(f"  {query_symbol} -> {FALLBACK_MAPPINGS[query_symbol]} (fallback)")
-            else:
-                not_found.append(query_symbol)
+    for symbol, ensembl_id in mapping.items():
+        note = " (canonical of several IDs)" if symbol in ambiguous else ""
+        print(f"  {symbol} -> {ensembl_id}{note}")
 
+    not_found = [s for s in gene_symbols if s not in mapping]
     if not_found:
         print(f"\n  [WARNING] Could not map: {', '.join(not_found)}")
 
@@ -121,9 +98,33 @@ print("PARALLEL PARTIAL CORRELATION v3 - WITH TIMER2.0 IMMUNE CONFOUNDERS")
 print(f"Using {N_CORES} CPU cores for acceleration")
 print("="*80)
 
+# Map gene symbols to Ensembl IDs first: only these columns are loaded
+# Collect all unique gene symbols from gene pairs
+all_gene_symbols = set()
+for gene1, gene2 in GENE_PAIRS:
+    all_gene_symbols.add(gene1)
+    all_gene_symbols.add(gene2)
+
+# Convert symbols to Ensembl IDs
+symbol_to_ensembl = convert_symbols_to_ensembl(list(all_gene_symbols))
+
+# Create reverse mapping for results
+ensembl_to_symbol = {v: k for k, v in symbol_to_ensembl.items()}
+
+print(f"\n  Successfully mapped {len(symbol_to_ensembl)}/{len(all_gene_symbols)} genes")
+
 print("\n[LOAD] Loading expression data...")
 expr_file = DATA_DIR / "expression_matrix_full_real.csv"
-expr_df = pd.read_csv(expr_file)
+# Request both layouts: 02_process_expression writes symbol columns when a
+# gene index is available, Ensembl IDs otherwise
+expr_df = load_expression(expr_file, genes=sorted(all_gene_symbols) + list(symbol_to_ensembl.values()))
+
+# Ensembl ID columns are renamed to symbols, so pairs are looked up by symbol
+rename_dict = {c: ensembl_to_symbol[c] for c in expr_df.columns
+               if c in ensembl_to_symbol and ensembl_to_symbol[c] not in expr_df.columns}
+if rename_dict:
+    print(f"  Detected Ensembl IDs - converting {len(rename_dict)} columns to gene symbols")
+    expr_df = expr_df.rename(columns=rename_dict)
 
 # Set sample_id as index
 if 'sample_id' in expr_df.columns:
@@ -167,24 +168,6 @@ print(f"  Common samples: {len(common_samples)}")
 expr_df = expr_df.loc[common_samples]
 timer_df = timer_df.loc[common_samples]
 
-# =============================================================================
-# Step 2.5: Map Gene Symbols to Ensembl IDs
-# =============================================================================
-
-# Collect all unique gene symbols from gene pairs
-all_gene_symbols = set()
-for gene1, gene2 in GENE_PAIRS:
-    all_gene_symbols.add(gene1)
-    all_gene_symbols.add(gene2)
-
-# Convert symbols to Ensembl IDs
-symbol_to_ensembl = convert_symbols_to_ensembl(list(all_gene_symbols))
-
-# Create reverse mapping for results
-ensembl_to_symbol = {v: k for k, v in symbol_to_ensembl.items()}
-
-print(f"\n  Successfully mapped {len(symbol_to_ensembl)}/{len(all_gene_symbols)} genes")
-
 # =============================================================================
 # Step 3: Prepare Confounder Matrix
 # =============================================================================
@@ -277,37 +260,13 @@ def partial_correlation_regression(x, y, confounders):
 
     return r, p
 
-def single_bootstrap_iteration(x, y, confounders, seed):
-    """
-    Single bootstrap iteration (for parallel execution)
-
-    Args:
-        x: Variable 1
-        y: Variable 2
-        confounders: Confounder matrix
-        seed: Random seed for reproducibility
-
-    Returns:
-        Bootstrap partial correlation
-    """
-    np.random.seed(seed)
-    n = len(x)
-
-    # Resample with replacement
-    indices = np.random.choice(n, size=n, replace=True)
-    x_boot = x[indices]
-    y_boot = y[indices]
-    conf_boot = confounders.iloc[indices] if isinstance(confounders, pd.DataFrame) else confounders[indices]
-
-    # Calculate partial correlation
-    r_boot, _ = partial_correlation_regression(x_boot, y_boot, conf_boot)
-
-    return r_boot
-
-def bootstrap_ci_parallel(x, y, confounders, n_bootstrap=1000, alpha=0.05, n_jobs=-1):
+def bootstrap_ci_parallel(x, y, confounders, n_bootstrap=1000, alpha=0.05, n_jobs=-1, seed=42):
     """
     Parallel bootstrap confidence interval for partial correlation
 
+    Replicates are computed in vectorized blocks (see partial_correlation_bootstrap);
+    blocks, not single iterations, are spread over the worker processes.
+
     Args:
         x: Variable 1
         y: Variable 2
@@ -315,6 +274,7 @@ def bootstrap_ci_parallel(x, y, confounders, n_bootstrap=1000, alpha=0.05, n_job
         n_bootstrap: Number of bootstrap samples
         alpha: Significance level
         n_jobs: Number of parallel jobs (-1 = all cores)
+        seed: Random seed (results do not depend on n_jobs)
 
     Returns:
         Lower and upper CI bounds
@@ -322,28 +282,12 @@ def bootstrap_ci_parallel(x, y, confounders, n_bootstrap=1000, alpha=0.05, n_job
     print(f"      Running {n_bootstrap} bootstrap iterations on {N_CORES} cores...", end='', flush=True)
     start_time = time.time()
 
-    # Generate seeds for reproducibility
-    seeds = np.random.randint(0, 1000000, size=n_bootstrap)
-
-    # Parallel bootstrap
-    partial_r_boot = Parallel(n_jobs=n_jobs, backend='loky')(
-        delayed(single_bootstrap_iteration)(x, y, confounders, seed)
-        for seed in seeds
-    )
-
-    # Filter out NaN values
-    partial_r_boot = [r for r in partial_r_boot if not np.isnan(r)]
+    lower, upper = bootstrap_ci(x, y, confounders, n_bootstrap=n_bootstrap, alpha=alpha,
+                                seed=seed, block_size=BOOTSTRAP_BLOCK_SIZE, n_jobs=n_jobs)
 
     elapsed = time.time() - start_time
     print(f" done in {elapsed:.1f}s")
 
-    if len(partial_r_boot) == 0:
-        return np.nan, np.nan
-
-    # Calculate percentile CI
-    lower = np.percentile(partial_r_boot, alpha/2 * 100)
-    upper = np.percentile(partial_r_boot, (1 - alpha/2) * 100)
-
     return lower, upper
 
 def analyze_gene_pair(gene1, gene2, expr_df, confounders_df, available_confounders, symbol_to_ensembl):
@@ -353,38 +297,30 @@ def analyze_gene_pair(gene1, gene2, expr_df, confounders_df, available_confounde
     Args:
         gene1: First gene symbol
         gene2: Second gene symbol
-        expr_df: Expression DataFrame (with Ensembl IDs as columns)
+        expr_df: Expression DataFrame (with gene symbols as columns)
         confounders_df: Confounder DataFrame
         available_confounders: List of confounder names
-        symbol_to_ensembl: Dictionary mapping symbols to Ensembl IDs
+        symbol_to_ensembl: Dictionary mapping symbols to Ensembl IDs (for reporting)
 
     Returns:
         Dictionary with analysis results
     """
     print(f"\n--- {gene1} vs {gene2} ---")
 
-    # Map symbols to Ensembl IDs
-    gene1_ensembl = symbol_to_ensembl.get(gene1)
-    gene2_ensembl = symbol_to_ensembl.get(gene2)
-
-    if gene1_ensembl is None or gene2_ensembl is None:
-        print(f"  [SKIP] Could not map gene symbols to Ensembl IDs")
-        print(f"    {gene1}: {'✓' if gene1_ensembl else '✗'}")
-        print(f"    {gene2}: {'✓' if gene2_ensembl else '✗'}")
-        return None
+    gene1_ensembl = symbol_to_ensembl.get(gene1, 'unmapped')
+    gene2_ensembl = symbol_to_ensembl.get(gene2, 'unmapped')
 
-    # Check if genes exist in expression matrix
-    if gene1_ensembl not in expr_df.columns or gene2_ensembl not in expr_df.columns:
-        print(f"  [SKIP] Ensembl IDs not found in expression matrix")
-        print(f"    {gene1} ({gene1_ensembl}): {'✓' if gene1_ensembl in expr_df.columns else '✗'}")
-        print(f"    {gene2} ({gene2_ensembl}): {'✓' if gene2_ensembl in expr_df.columns else '✗'}")
+    # Check if genes exist in expression matrix (columns are symbols)
+    if gene1 not in expr_df.columns or gene2 not in expr_df.columns:
+        print(f"  [SKIP] Genes not found in expression matrix")
+        print(f"    {gene1} ({gene1_ensembl}): {'✓' if gene1 in expr_df.columns else '✗'}")
+        print(f"    {gene2} ({gene2_ensembl}): {'✓' if gene2 in expr_df.columns else '✗'}")
         return None
 
     print(f"  Analyzing: {gene1} ({gene1_ensembl}) vs {gene2} ({gene2_ensembl})")
 
-    # Extract gene expression using Ensembl IDs
-    x = expr_df[gene1_ensembl].values
-    y = expr_df[gene2_ensembl].values
+    x = expr_df[gene1].values
+    y = expr_df[gene2].values
 
     # Simple correlation (no confounders)
     mask_simple = ~(np.isnan(x) | np.isnan(y))
@@ -3,6 +3,7 @@
 Stage 4: CPTAC Protein-Level Validation
 解決「僅mRNA層」批評 - 使用 CPTAC-3 蛋白質組數據驗證
 """
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
@@ -12,6 +13,9 @@ from scipy import stats
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "data_pipeline"))
+from expression_store import load_expression
+
 print("="*70)
 print("STAGE 4: CPTAC PROTEIN-LEVEL VALIDATION")
 print("="*70)
@@ -67,7 +71,8 @@ def generate_cptac_simulation():
 
     # Load mRNA data as reference
     mrna_file = Path("outputs/tcga_full_cohort_real/expression_matrix_full_real.csv")
-    mrna_df = pd.read_csv(mrna_file)
+    genes = ['CD274', 'CMTM6', 'STUB1', 'SQSTM1', 'HIP1R']
+    mrna_df = load_expression(mrna_file, genes=genes)
 
     # Sample subset (CPTAC has ~220 samples)
     np.random.seed(42)
@@ -84,8 +89,6 @@ def generate_cptac_simulation():
         sampled_mrna = mrna_df.sample(n=total_samples, random_state=42)
 
     # Simulate protein levels with realistic mRNA-protein correlation
-    genes = ['CD274', 'CMTM6', 'STUB1', 'SQSTM1', 'HIP1R']
-
     protein_df = pd.DataFrame({
         'sample_id': sampled_mrna['sample_id'].values,
         'cancer_type': ['LUAD']*n_luad + ['LUSC']*n_lusc
@@ -215,7 +218,7 @@ for _, row in comparison_df.iterrows():
 print("\n[STEP 3] Analyzing mRNA-protein concordance...")
 
 # Load matched mRNA data (samples with both mRNA and protein)
-mrna_full = pd.read_csv("outputs/tcga_full_cohort/expression_matrix.csv")
+mrna_full = load_expression("outputs/tcga_full_cohort/expression_matrix.csv", genes=genes)
 
 # Match samples
 matched_samples = set(cptac_df['sample_id']) & set(mrna_full['sample_id'])
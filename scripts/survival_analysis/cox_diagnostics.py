@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Cox Model Diagnostics
+Collinearity from one Gram matrix and the Schoenfeld proportional-hazards test
+
+Collinearity: the cross-product (Gram) matrix of all candidate covariates
+is computed once. For any covariate subset, one eigendecomposition of the
+scaled sub-block gives
+- VIF_j = (R^-1)_jj, i.e. sum_k V_jk^2 / lambda_k (no per-covariate OLS refits)
+- condition indices sqrt(lambda_max / lambda_k) and the condition number
+- Belsley variance-decomposition proportions V_jk^2 / lambda_k / VIF_j
+Reports are memoized per covariate set.
+
+Proportional hazards: Grambsch & Therneau's test on scaled Schoenfeld
+residuals (Efron ties, per stratum), computed with the risk-set sums of
+cox_engine; the per-covariate statistics match lifelines'
+proportional_hazard_test (including its 'rank' transform, which numbers
+events 1..d even when their times are tied), plus a global test.
+
+Usage:
+    gram = GramCache(cox_data, covariates)
+    report = gram.report(covariates)          # report['vif'], report['condition_number']
+    ph = proportional_hazards_test(cox_data[covariates], cox_data['OS_months'],
+                                   cox_data['OS_event'], cph.params_, cph.variance_matrix_,
+                                   strata=cox_data['cancer_type'])
+
+Author: Automated Pipeline
+Date: 2025-11-02
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from typing import Dict, Optional, Sequence, Tuple
+
+from cox_engine import RiskSets
+from survival_stats import kaplan_meier
+
+# =============================================================================
+# Configuration
+# =============================================================================
+
+SINGULAR_TOLERANCE = 1e-10   # Eigenvalues below this x lambda_max count as zero
+TIME_TRANSFORMS = ('rank', 'identity', 'log', 'km')
+
+# =============================================================================
+# Collinearity
+# =============================================================================
+
+class GramCache:
+    """
+    Cross-products of a covariate table, computed once for all subsets
+
+    Args (constructor):
+        df: One row per sample
+        columns: Candidate covariates (default: all numeric columns); rows
+            with a missing value in any of them are dropped
+
+    Attributes:
+        columns: Covariate names
+        n_samples: Complete rows
+        mean: Column means
+        gram: Uncentered cross-products X'X
+        centered_gram: Centered cross-products (n - 1) x covariance
+    """
+
+    def __init__(self, df: pd.DataFrame, columns: Optional[Sequence[str]] = None):
+        if columns is None:
+            columns = df.select_dtypes(include=[np.number, bool]).columns
+        self.columns = list(columns)
+        x = df[self.columns].dropna().to_numpy(dtype=np.float64)
+        self.n_samples = len(x)
+        self.mean = x.mean(axis=0) if len(x) else np.full(len(self.columns), np.nan)
+        deviations = x - self.mean
+        self.centered_gram = deviations.T @ deviations
+        self.gram = self.centered_gram + self.n_samples * np.outer(self.mean, self.mean)
+        self._position = {c: i for i, c in enumerate(self.columns)}
+        self._reports: Dict[Tuple[Tuple[str, ...], bool], Dict] = {}
+
+    def report(self, covariates: Optional[Sequence[str]] = None, centered: bool = True) -> Dict:
+        """
+        Collinearity report of a covariate subset (memoized)
+
+        Args:
+            covariates: Subset of the cached columns (default: all)
+            centered: VIF against models with an intercept (the usual
+                definition, = statsmodels' variance_inflation_factor with its
+                default standardize=True); False regresses on the other
+                columns without one (standardize=False, no constant column)
+
+        Returns:
+            Dict with vif (DataFrame: Variable, VIF, tolerance), condition_number,
+            condition_indices (DataFrame: dimension, eigenvalue,
+            condition_index, then one variance-proportion column per
+            covariate) and n_samples
+        """
+        covariates = tuple(self.columns if covariates is None else covariates)
+        key = (covariates, centered)
+        if key not in self._reports:
+            self._reports[key] = self._build_report(list(covariates), centered)
+        return self._reports[key]
+
+    def _build_report(self, covariates: Sequence[str], centered: bool) -> Dict:
+        idx = np.array([self._position[c] for c in covariates], dtype=np.int64)
+        gram = (self.centered_gram if centered else self.gram)[np.ix_(idx, idx)]
+        diagonal = np.diag(gram)
+        usable = diagonal > 0                   # constant columns have no VIF
+
+        scale = np.sqrt(diagonal[usable])
+        corr = gram[np.ix_(usable, usable)] / np.outer(scale, scale)
+        eigenvalues, vectors = np.linalg.eigh(corr)
+        eigenvalues, vectors = eigenvalues[::-1], vectors[:, ::-1]
+        top = eigenvalues[0] if len(eigenvalues) else np.nan
+        singular = eigenvalues <= SINGULAR_TOLERANCE * top
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            phi = np.where(singular, np.inf, vectors ** 2 / np.where(singular, 1.0, eigenvalues))
+            # A covariate with no weight on a null direction is not part of the dependency
+            phi = np.where(singular & (vectors ** 2 < SINGULAR_TOLERANCE), 0.0, phi)
+            vif_usable = phi.sum(axis=1)
+            proportions = phi / vif_usable[:, None]
+            indices = np.sqrt(top / np.where(singular, 0.0, eigenvalues))
+
+        vif = np.full(len(covariates), np.nan)
+        vif[usable] = vif_usable
+        vif_df = pd.DataFrame({'Variable': list(covariates), 'VIF': vif})
+        with np.errstate(divide='ignore'):
+            vif_df['tolerance'] = 1.0 / vif_df['VIF']
+
+        condition = pd.DataFrame({
+            'dimension': np.arange(1, len(eigenvalues) + 1),
+            'eigenvalue': eigenvalues,
+            'condition_index': indices,
+        })
+        for j, name in enumerate(np.array(covariates, dtype=object)[usable]):
+            condition[name] = proportions[j]
+        return {
+            'vif': vif_df,
+            'condition_number': float(indices[-1]) if len(indices) else np.nan,
+            'condition_indices': condition,
+            'n_samples': self.n_samples,
+        }
+
+def variance_inflation(df: pd.DataFrame, covariates: Optional[Sequence[str]] = None,
+                       centered: bool = True) -> pd.DataFrame:
+    """VIF of every covariate (one-off; use GramCache for repeated subsets)"""
+    return GramCache(df, covariates).report(covariates, centered)['vif']
+
+# =============================================================================
+# Proportional Hazards
+# =============================================================================
+
+def schoenfeld_residuals(risk_sets: RiskSets, x: np.ndarray, coef: np.ndarray) -> np.ndarray:
+    """
+    Schoenfeld residuals with Efron ties
+
+    Args:
+        risk_sets: Risk sets of the fitted data
+        x: Samples x covariates, in the original sample order
+        coef: Fitted coefficients
+
+    Returns:
+        events x covariates residuals, rows in risk_sets.event_rows order
+    """
+    x = risk_sets.sorted_values(x)
+    p = x.shape[1]
+    eta = x @ coef
+    w = np.exp(eta - eta.max(initial=0.0))
+    risk, deaths = risk_sets.block_sums(np.hstack([w[:, None], w[:, None] * x]), overwrite=True)
+
+    # Efron: average the weighted means over the d tied-death risk sets
+    blocks = risk_sets.death_block
+    frac = (risk_sets.death_rank / risk_sets.n_deaths[blocks])[:, None]
+    s = risk[blocks] - frac * deaths[blocks]
+    means = risk_sets.death_sums(s[:, 1:p + 1] / s[:, :1]) / risk_sets.n_deaths[:, None]
+    return x[risk_sets.event_rows] - means[blocks]
+
+def event_order_rank(risk_sets: RiskSets) -> np.ndarray:
+    """
+    lifelines' rank time transform: events numbered 1..d in fitting order
+
+    lifelines sorts by stratum label, then time, then sample order, and
+    ranks with a cumulative event count, so tied event times get distinct
+    ranks (not averaged ones).
+
+    Args:
+        risk_sets: Risk sets of the fitted data
+
+    Returns:
+        Rank per event, in risk_sets.event_rows order
+    """
+    rows = risk_sets.event_rows
+    strata = risk_sets.codes[rows]
+    if risk_sets.labels is not None:
+        strata = np.argsort(np.argsort(np.asarray(risk_sets.labels), kind='stable'))[strata]
+    sequence = np.lexsort((risk_sets.order[rows], risk_sets.time[rows], strata))
+    rank = np.empty(len(rows), dtype=np.float64)
+    rank[sequence] = np.arange(1, len(rows) + 1)
+    return rank
+
+def _transform_times(risk_sets: RiskSets, time: np.ndarray, event: np.ndarray,
+                     time_transform: str) -> np.ndarray:
+    times = risk_sets.time[risk_sets.event_rows]
+    if time_transform == 'rank':
+        return event_order_rank(risk_sets)
+    if time_transform == 'identity':
+        return times
+    if time_transform == 'log':
+        return np.log(times)
+    km = kaplan_meier(time, event)
+    idx = np.searchsorted(km['time'].to_numpy(), times, side='right') - 1
+    return 1 - km['survival'].to_numpy()[idx]
+
+def proportional_hazards_test(covariates: pd.DataFrame, time: Sequence[float],
+                              event: Sequence[int], coef: Sequence[float],
+                              covariance: np.ndarray, strata: Optional[Sequence] = None,
+                              time_transform: str = 'rank') -> pd.DataFrame:
+    """
+    Grambsch-Therneau test of proportional hazards for a fitted Cox model
+
+    Args:
+        covariates: Samples x covariates the model was fitted on
+        time: Survival times
+        event: Event indicators
+        coef: Fitted coefficients (e.g. CoxPHFitter.params_ or fit_cox coef)
+        covariance: Coefficient covariance (e.g. CoxPHFitter.variance_matrix_)
+        strata: Stratum label per sample, if the model was stratified
+        time_transform: 'rank' (lifelines' default; see event_order_rank),
+            'identity', 'log' or 'km' (R's default)
+
+    Returns:
+        DataFrame indexed by covariate plus GLOBAL: test_statistic, df, p
+    """
+    if time_transform not in TIME_TRANSFORMS:
+        raise ValueError(f"Unknown time_transform: {time_transform} (expected one of {TIME_TRANSFORMS})")
+    names = list(covariates.columns)
+    x = covariates.to_numpy(dtype=np.float64)
+    time = np.asarray(time, dtype=np.float64)
+    event = np.asarray(event, dtype=np.float64)
+    coef = np.asarray(coef, dtype=np.float64)
+    covariance = np.asarray(covariance, dtype=np.float64)
+
+    risk_sets = RiskSets(time, event, strata)
+    residuals = schoenfeld_residuals(risk_sets, x, coef)
+    n_deaths = len(residuals)
+    g = _transform_times(risk_sets, time, event, time_transform)
+    g = g - g.mean()
+
+    # Per covariate on scaled residuals d * r V; globally U V U' d / sum(g^2)
+    score = g @ residuals
+    scaled = n_deaths * (score @ covariance)
+    statistic = scaled ** 2 / (n_deaths * np.diag(covariance) * (g @ g))
+    global_statistic = float(score @ covariance @ score) * n_deaths / (g @ g)
+
+    result = pd.DataFrame({
+        'test_statistic': np.append(statistic, global_statistic),
+        'df': np.append(np.ones(len(names), dtype=np.int64), len(names)),
+    }, index=pd.Index(names + ['GLOBAL'], name='covariate'))
+    result['p'] = stats.chi2.sf(result['test_statistic'], result['df'])
+    return result
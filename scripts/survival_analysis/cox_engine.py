@@ -0,0 +1,639 @@
+#!/usr/bin/env python3
+"""
+Batched Cox Regression Engine
+Univariate Cox models for thousands of genes from shared risk-set sums
+
+Samples are sorted once by (stratum, time descending), so every risk set is
+a prefix of its stratum and its sums are read off column-wise cumulative
+sums. For a block of genes all Newton-Raphson updates run together as array
+operations: one exp, three cumsums and a few gathers per iteration, for
+every gene in the block at once. Ties use Efron's method, as lifelines does;
+each tied death time is expanded to one row per death, so the Efron terms
+are vectorized too.
+
+Missing expression values exclude a sample for that gene only (its weight
+and events are masked), so genes with different missingness still share
+one sort. Strata (e.g. cancer_type) get separate baseline hazards.
+
+fit_cox fits one multivariate model on the same risk-set machinery, with
+lifelines-compatible L2 penalization, warm starts and convergence
+diagnostics returned as data instead of exceptions.
+
+Usage:
+    risk_sets = RiskSets(time, event, strata=cancer_type)
+    results = cox_screen(expr_df, risk_sets=risk_sets, standardize=True)
+    fit = fit_cox(cox_df[covariates], cox_df['OS_months'], cox_df['OS_event'], penalizer=0.01)
+
+Author: Automated Pipeline
+Date: 2025-11-02
+"""
+
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from scipy import stats
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "analysis"))
+from partial_correlation_engine import benjamini_hochberg
+
+# =============================================================================
+# Configuration
+# =============================================================================
+
+GENE_BLOCK = 512        # Genes fitted together (bounds the samples x block temporaries)
+GENE_CHUNK = 5000       # Genes read from an expression store at a time (command line)
+MAX_ITER = 50
+TOLERANCE = 1e-9        # Newton step size at convergence
+MAX_HALVINGS = 20
+
+# =============================================================================
+# Risk Sets
+# =============================================================================
+
+class RiskSets:
+    """
+    Sort order and tied-time structure shared by every model on one cohort
+
+    Args (constructor):
+        time: Survival / follow-up times
+        event: Event indicators (1 = event, 0 = censored)
+        strata: Stratum label per sample (None = one stratum)
+
+    Attributes:
+        order: Sample order (stratum, then time descending)
+        event: Event indicators in that order
+        codes: Stratum code of every sorted row (index into labels)
+        labels: Stratum labels (None without strata)
+        block_end: Last sorted row of every (stratum, time) block with an event
+        stratum_start: First sorted row of that block's stratum
+        event_rows: Sorted rows of the events (grouped by block)
+        death_block / death_rank: Efron expansion - for every event, its block
+            and its rank l = 0..d-1 among the block's tied events
+    """
+
+    def __init__(self, time: Sequence[float], event: Sequence[int],
+                 strata: Optional[Sequence] = None):
+        time = np.asarray(time, dtype=np.float64)
+        event = np.asarray(event, dtype=np.float64)
+        if strata is None:
+            codes, self.labels = np.zeros(len(time), dtype=np.int64), None
+        else:
+            codes, self.labels = pd.factorize(pd.Series(strata))
+        if (codes < 0).any() or np.isnan(time).any() or np.isnan(event).any():
+            raise ValueError("time, event and strata must not contain missing values")
+
+        self.order = np.lexsort((-time, codes))
+        self._build(time[self.order], event[self.order], codes[self.order])
+
+    def take(self, rows: np.ndarray) -> 'RiskSets':
+        """
+        Risk sets of a subsample without re-sorting
+
+        Args:
+            rows: Ascending sorted-row positions, repeats allowed (bootstrap
+                resamples, cross-validation training folds)
+
+        Returns:
+            RiskSets whose order still indexes the original samples
+        """
+        subset = RiskSets.__new__(RiskSets)
+        subset.order, subset.labels = self.order[rows], self.labels
+        subset._build(self.time[rows], self.event[rows], self.codes[rows])
+        return subset
+
+    def _build(self, time: np.ndarray, event: np.ndarray, codes: np.ndarray):
+        """Tied-time structure of rows already sorted by stratum, time descending"""
+        self.n_samples = len(time)
+        self.time, self.event, self.codes = time, event, codes
+
+        # Blocks of equal (stratum, time); the last row of a block closes its risk set
+        new_block = np.ones(len(time), dtype=bool)
+        new_block[1:] = (codes[1:] != codes[:-1]) | (self.time[1:] != self.time[:-1])
+        block_start = np.flatnonzero(new_block)
+        block_end = np.append(block_start[1:], len(time)) - 1
+        new_stratum = np.ones(len(time), dtype=bool)
+        new_stratum[1:] = codes[1:] != codes[:-1]
+        stratum_start = np.maximum.accumulate(np.where(new_stratum, np.arange(len(time)), 0))
+
+        deaths = np.add.reduceat(self.event, block_start) if len(time) else np.zeros(0)
+        has_death = deaths > 0
+        self.block_start = block_start[has_death]
+        self.block_end = block_end[has_death]
+        self.stratum_start = stratum_start[self.block_start]
+        self.n_deaths = deaths[has_death].astype(np.int64)
+        self.event_rows = np.flatnonzero(self.event)
+        self.death_start = np.cumsum(self.n_deaths) - self.n_deaths
+        self.death_block = np.repeat(np.arange(len(self.n_deaths)), self.n_deaths)
+        self.death_rank = np.arange(len(self.death_block)) - np.repeat(
+            np.cumsum(self.n_deaths) - self.n_deaths, self.n_deaths)
+
+    def sorted_values(self, values: np.ndarray) -> np.ndarray:
+        """Rows of a samples x k array in risk-set order"""
+        return np.asarray(values, dtype=np.float64)[self.order]
+
+    def death_sums(self, event_values: np.ndarray) -> np.ndarray:
+        """Per-block sums of event_rows x k values"""
+        if len(event_values) == 0:
+            return np.zeros((0,) + event_values.shape[1:])
+        return np.add.reduceat(event_values, self.death_start, axis=0)
+
+    def block_sums(self, values: np.ndarray, overwrite: bool = False
+                   ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Risk-set and tied-death sums of sorted samples x k values
+
+        Args:
+            values: Sorted samples x k values
+            overwrite: Reuse values as the cumulative-sum buffer
+
+        Returns:
+            (risk, deaths) - blocks x k sums over each event block's risk set
+            and over its events
+        """
+        deaths = self.death_sums(values[self.event_rows])
+        cum = np.cumsum(values, axis=0, out=values if overwrite else None)
+        risk = cum[self.block_end]
+        inner = self.stratum_start > 0
+        risk[inner] -= cum[self.stratum_start[inner] - 1]
+        return risk, deaths
+
+# =============================================================================
+# Batched Univariate Newton-Raphson
+# =============================================================================
+
+def _prepare_block(risk_sets: RiskSets, x: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Per-gene quantities that stay fixed during Newton-Raphson
+
+    Args:
+        risk_sets: Shared risk-set structure
+        x: Samples x genes covariates in original sample order (NaN = missing)
+
+    Returns:
+        Dict with sorted, centered x (0 where missing), observed mask, event
+        sums and the Efron fractions l / d of every (event, gene)
+    """
+    x = risk_sets.sorted_values(x).reshape(risk_sets.n_samples, -1)
+    observed = ~np.isnan(x)
+    n_obs = observed.sum(axis=0)
+    # Centering leaves the coefficient unchanged and keeps exp(x * beta) well scaled
+    center = np.where(observed, x, 0.0).sum(axis=0) / np.maximum(n_obs, 1)
+    x = np.where(observed, x - center, 0.0)
+    observed = observed.astype(np.float64)
+
+    # Observed deaths per tied block; the l-th death is used only if l < d
+    dead = observed[risk_sets.event_rows]
+    d = risk_sets.death_sums(dead)[risk_sets.death_block]
+    rank = risk_sets.death_rank[:, None]
+    valid = rank < d
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frac = np.where(valid, rank / d, 0.0)
+
+    return {
+        'x': x,
+        'observed': observed,
+        'n_obs': n_obs,
+        'n_dead': dead.sum(axis=0),
+        'dead_x': x[risk_sets.event_rows].sum(axis=0),
+        'frac': frac,
+        'valid': valid,
+    }
+
+def _take(block: Dict[str, np.ndarray], cols: np.ndarray) -> Dict[str, np.ndarray]:
+    """Prepared block restricted to some genes"""
+    return {k: v[..., cols] for k, v in block.items()}
+
+def _loglik_derivatives(risk_sets: RiskSets, block: Dict[str, np.ndarray],
+                        beta: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Efron partial log-likelihood, score and information for every column
+
+    Args:
+        risk_sets: Shared risk-set structure
+        block: Prepared genes (see _prepare_block)
+        beta: Coefficient per gene
+
+    Returns:
+        (loglik, score, information) arrays of length genes
+    """
+    x, observed = block['x'], block['observed']
+    eta = x * beta
+    # Shifting eta by a per-gene constant leaves the partial likelihood unchanged
+    shift = eta.max(axis=0, initial=0.0)
+    eta -= shift
+    w = np.exp(eta, out=eta)
+    w *= observed
+    wx = w * x
+    r2, d2 = risk_sets.block_sums(wx * x, overwrite=True)
+    r1, d1 = risk_sets.block_sums(wx, overwrite=True)
+    r0, d0 = risk_sets.block_sums(w, overwrite=True)
+
+    # Efron: the l-th of d tied deaths sees the risk set minus l/d of the deaths
+    blocks, frac, valid = risk_sets.death_block, block['frac'], block['valid']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s0 = r0[blocks] - frac * d0[blocks]
+        s1 = (r1[blocks] - frac * d1[blocks]) / s0
+        s2 = (r2[blocks] - frac * d2[blocks]) / s0
+        log_s0 = np.log(s0)
+
+    loglik = beta * block['dead_x'] - shift * block['n_dead'] - np.where(valid, log_s0, 0.0).sum(axis=0)
+    score = block['dead_x'] - np.where(valid, s1, 0.0).sum(axis=0)
+    information = np.where(valid, s2 - s1 * s1, 0.0).sum(axis=0)
+    return loglik, score, information
+
+def fit_univariate_block(risk_sets: RiskSets, x: np.ndarray, max_iter: int = MAX_ITER,
+                         tol: float = TOLERANCE) -> pd.DataFrame:
+    """
+    Newton-Raphson for one Cox model per column of x, all at once
+
+    Args:
+        risk_sets: Shared risk-set structure
+        x: Samples x genes covariates in original sample order (NaN = missing)
+        max_iter: Maximum Newton iterations
+        tol: Convergence tolerance
+
+    Returns:
+        DataFrame (one row per column) with n_samples, n_events, coef, se,
+        loglik, loglik_null, score_stat, converged, n_iter
+    """
+    block = _prepare_block(risk_sets, x)
+    n_genes = block['x'].shape[1]
+    beta = np.zeros(n_genes)
+    loglik, score, info = _loglik_derivatives(risk_sets, block, beta)
+    loglik_null = loglik.copy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score_stat = score ** 2 / info
+        step = score / info
+
+    n_iter = np.zeros(n_genes, dtype=np.int64)
+    halvings = np.zeros(n_genes, dtype=np.int64)
+    active = np.isfinite(step) & (info > 0)
+    converged = active & (np.abs(step) < tol)
+    active &= ~converged
+
+    for _ in range(max_iter):
+        cols = np.flatnonzero(active)
+        if len(cols) == 0:
+            break
+        trial = beta[cols] + step[cols]
+        subset = block if len(cols) == n_genes else _take(block, cols)
+        ll_new, score_new, info_new = _loglik_derivatives(risk_sets, subset, trial)
+        n_iter[cols] += 1
+
+        # Overshoot: halve the step and retry from the same point
+        worse = ~(ll_new >= loglik[cols] - tol * np.abs(loglik[cols]))
+        step[cols[worse]] /= 2
+        halvings[cols[worse]] += 1
+
+        ok = cols[~worse]
+        beta[ok] = trial[~worse]
+        loglik[ok], score[ok], info[ok] = ll_new[~worse], score_new[~worse], info_new[~worse]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            new_step = score[ok] / info[ok]
+        done = np.abs(new_step) < tol
+        step[ok] = new_step
+        converged[ok[done]] = True
+        active[ok[done]] = False
+        # Non-finite steps or runaway halving (e.g. monotone likelihood) stop the gene
+        active[ok[~np.isfinite(new_step)]] = False
+        active[cols[worse][halvings[cols[worse]] > MAX_HALVINGS]] = False
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        se = np.where(info > 0, 1.0 / np.sqrt(info), np.nan)
+    coef = np.where(np.isfinite(se), beta, np.nan)
+
+    return pd.DataFrame({
+        'n_samples': block['n_obs'].astype(np.int64),
+        'n_events': block['n_dead'].astype(np.int64),
+        'coef': coef,
+        'se': se,
+        'loglik': loglik,
+        'loglik_null': loglik_null,
+        'score_stat': score_stat,
+        'converged': converged,
+        'n_iter': n_iter,
+    })
+
+# =============================================================================
+# Multivariate Newton-Raphson
+# =============================================================================
+
+def cox_derivatives(risk_sets: RiskSets, x: np.ndarray, beta: np.ndarray
+                    ) -> Tuple[float, np.ndarray, np.ndarray]:
+    """
+    Efron partial log-likelihood, gradient and Hessian of one model
+
+    Args:
+        risk_sets: Shared risk-set structure
+        x: Sorted samples x covariates matrix (complete cases)
+        beta: Coefficients
+
+    Returns:
+        (loglik, gradient, hessian)
+    """
+    n, p = x.shape
+    eta = x @ beta
+    shift = eta.max(initial=0.0)
+    w = np.exp(eta - shift)
+    wx = w[:, None] * x
+    # One pass of block sums over [w, w x, w x x'] (1 + p + p^2 columns)
+    terms = np.hstack([w[:, None], wx, (wx[:, :, None] * x[:, None, :]).reshape(n, p * p)])
+    risk, deaths = risk_sets.block_sums(terms, overwrite=True)
+
+    # Efron: the l-th of d tied deaths sees the risk set minus l/d of the deaths
+    blocks = risk_sets.death_block
+    frac = (risk_sets.death_rank / risk_sets.n_deaths[blocks])[:, None]
+    s = risk[blocks] - frac * deaths[blocks]
+    s0 = s[:, 0]
+    s1 = s[:, 1:p + 1] / s0[:, None]
+    s2 = (s[:, p + 1:] / s0[:, None]).reshape(-1, p, p)
+
+    x_dead = x[risk_sets.event_rows]
+    loglik = (eta[risk_sets.event_rows] - shift).sum() - np.log(s0).sum()
+    gradient = x_dead.sum(axis=0) - s1.sum(axis=0)
+    hessian = -(s2.sum(axis=0) - s1.T @ s1)
+    return loglik, gradient, hessian
+
+# =============================================================================
+# Public API
+# =============================================================================
+
+def cox_screen(expr_df: pd.DataFrame, time: Optional[Sequence[float]] = None,
+               event: Optional[Sequence[int]] = None, strata: Optional[Sequence] = None,
+               risk_sets: Optional[RiskSets] = None, standardize: bool = False,
+               alpha: float = 0.05, gene_block: int = GENE_BLOCK,
+               max_iter: int = MAX_ITER) -> pd.DataFrame:
+    """
+    Univariate (optionally stratified) Cox model for every gene column
+
+    Args:
+        expr_df: Samples x genes expression (rows aligned with time/event)
+        time: Survival times (ignored if risk_sets is given)
+        event: Event indicators (ignored if risk_sets is given)
+        strata: Stratum label per sample, e.g. cancer_type
+        risk_sets: Prebuilt RiskSets (reuse across calls on one cohort)
+        standardize: z-score each gene first (HR per standard deviation)
+        alpha: CI level
+        gene_block: Genes fitted per batch
+        max_iter: Maximum Newton iterations
+
+    Returns:
+        DataFrame indexed by gene with n_samples, n_events, coef, se, HR,
+        HR_lower, HR_upper, z, p_wald, p_score, p_lrt, q_wald, q_score,
+        converged, n_iter
+    """
+    if risk_sets is None:
+        risk_sets = RiskSets(time, event, strata)
+    if len(expr_df) != risk_sets.n_samples:
+        raise ValueError(f"expr_df has {len(expr_df)} rows, risk sets have {risk_sets.n_samples}")
+
+    blocks = []
+    for lo in range(0, expr_df.shape[1], gene_block):
+        x = expr_df.iloc[:, lo:lo + gene_block].to_numpy(dtype=np.float64)
+        if standardize:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x = (x - np.nanmean(x, axis=0)) / np.nanstd(x, axis=0, ddof=1)
+        blocks.append(fit_univariate_block(risk_sets, x, max_iter))
+    results = pd.concat(blocks, ignore_index=True) if blocks else fit_univariate_block(
+        risk_sets, np.zeros((risk_sets.n_samples, 0)), max_iter)
+    results.index = pd.Index(expr_df.columns, name='gene')
+
+    crit = stats.norm.ppf(1 - alpha / 2)
+    coef, se = results['coef'], results['se']
+    results['HR'] = np.exp(coef)
+    results['HR_lower'] = np.exp(coef - crit * se)
+    results['HR_upper'] = np.exp(coef + crit * se)
+    results['z'] = coef / se
+    results['p_wald'] = 2 * stats.norm.sf(np.abs(results['z']))
+    results['p_score'] = stats.chi2.sf(results['score_stat'], 1)
+    results['p_lrt'] = np.where(results['score_stat'].notna(), stats.chi2.sf(
+        np.maximum(2 * (results['loglik'] - results['loglik_null']), 0), 1), np.nan)
+    results['q_wald'] = benjamini_hochberg(results['p_wald'].to_numpy())
+    results['q_score'] = benjamini_hochberg(results['p_score'].to_numpy())
+
+    columns = ['n_samples', 'n_events', 'coef', 'se', 'HR', 'HR_lower', 'HR_upper', 'z',
+               'p_wald', 'p_score', 'p_lrt', 'q_wald', 'q_score', 'converged', 'n_iter']
+    return results[columns]
+
+def fit_cox(covariates: pd.DataFrame, time: Sequence[float], event: Sequence[int],
+            strata: Optional[Sequence] = None, penalizer: float = 0.0,
+            initial_point: Optional[Sequence[float]] = None, alpha: float = 0.05,
+            max_iter: int = MAX_ITER, tol: float = TOLERANCE,
+            risk_sets: Optional[RiskSets] = None) -> Dict:
+    """
+    Multivariate (optionally stratified) Cox model with convergence diagnostics
+
+    Covariates are standardized for the fit and the L2 penalty is
+    0.5 * n * penalizer * sum(beta_std^2), as in lifelines' CoxPHFitter,
+    so penalized estimates match it. Rows with missing values are dropped.
+    Failures are reported in the result (converged=False and a message)
+    rather than raised.
+
+    Args:
+        covariates: Samples x covariates DataFrame
+        time: Survival times
+        event: Event indicators
+        strata: Stratum label per sample (separate baseline hazards)
+        penalizer: L2 penalizer (lifelines scale)
+        initial_point: Starting coefficients on the original scale, e.g.
+            a pooled fit (warm start); default zeros
+        alpha: CI level
+        max_iter: Maximum Newton iterations
+        tol: Convergence tolerance (step norm / relative log-likelihood change)
+        risk_sets: Prebuilt risk sets (e.g. RiskSets.take of a resample);
+            time, event and strata are then ignored and covariates must be
+            complete, with rows in the original sample order
+
+    Returns:
+        Dict with summary (DataFrame indexed by covariate: coef, se, HR,
+        HR_lower, HR_upper, z, p), covariance (coefficient covariance
+        DataFrame), loglik (unpenalized), loglik_null, n_samples, n_events,
+        n_iter, converged and message
+    """
+    names = list(covariates.columns)
+    x = covariates.to_numpy(dtype=np.float64)
+    if risk_sets is None:
+        time = np.asarray(time, dtype=np.float64)
+        event = np.asarray(event, dtype=np.float64)
+        complete = ~np.isnan(x).any(axis=1) & ~np.isnan(time) & ~np.isnan(event)
+        if strata is not None:
+            strata = pd.Series(np.asarray(strata, dtype=object))
+            complete &= strata.notna().to_numpy()
+            strata = strata[complete].to_numpy()
+        x, time, event = x[complete], time[complete], event[complete]
+        if event.sum() > 0:
+            risk_sets = RiskSets(time, event, strata)
+            x = risk_sets.sorted_values(x)
+    else:
+        x, event = risk_sets.sorted_values(x), risk_sets.event
+        if np.isnan(x).any():
+            raise ValueError("covariates must be complete when risk_sets is given")
+
+    result = {'summary': pd.DataFrame(index=pd.Index(names, name='covariate'),
+                                      columns=['coef', 'se', 'HR', 'HR_lower', 'HR_upper', 'z', 'p'],
+                                      dtype=np.float64),
+              'covariance': pd.DataFrame(np.nan, index=names, columns=names),
+              'loglik': np.nan, 'loglik_null': np.nan, 'n_samples': len(x),
+              'n_events': int(event.sum()), 'n_iter': 0, 'converged': False, 'message': ''}
+    if result['n_events'] == 0:
+        result['message'] = 'no events'
+        return result
+
+    center = x.mean(axis=0)
+    scale = x.std(axis=0, ddof=1) if len(x) > 1 else np.ones(len(names))
+    scale[~(scale > 0)] = 1.0
+    x = (x - center) / scale
+
+    n = len(x)
+    def objective(beta):
+        loglik, gradient, hessian = cox_derivatives(risk_sets, x, beta)
+        if penalizer > 0:
+            loglik -= 0.5 * n * penalizer * (beta @ beta)
+            gradient = gradient - n * penalizer * beta
+            hessian = hessian - n * penalizer * np.eye(len(beta))
+        return loglik, gradient, hessian
+
+    beta = np.zeros(len(names))
+    result['loglik_null'] = cox_derivatives(risk_sets, x, beta)[0]
+    if initial_point is not None:
+        beta = np.nan_to_num(np.asarray(initial_point, dtype=np.float64)) * scale
+
+    try:
+        loglik, gradient, hessian = objective(beta)
+        delta = np.linalg.solve(-hessian, gradient)
+        halvings = 0
+        while result['n_iter'] < max_iter:
+            if not np.all(np.isfinite(delta)):
+                raise FloatingPointError("non-finite Newton step")
+            if np.linalg.norm(delta) < tol:
+                result['converged'] = True
+                break
+            trial = beta + delta
+            ll_new, g_new, h_new = objective(trial)
+            result['n_iter'] += 1
+            # Overshoot: halve the step and retry from the same point
+            if not ll_new >= loglik - tol * abs(loglik):
+                delta /= 2
+                halvings += 1
+                if halvings > MAX_HALVINGS:
+                    raise FloatingPointError("step halving failed (monotone likelihood?)")
+                continue
+            gain = ll_new - loglik
+            beta, loglik, gradient, hessian = trial, ll_new, g_new, h_new
+            delta = np.linalg.solve(-hessian, gradient)
+            halvings = 0
+            if abs(gain) <= tol * abs(loglik):
+                result['converged'] = True
+                break
+        else:
+            result['message'] = f"no convergence after {max_iter} iterations"
+        variance = np.linalg.inv(-hessian)
+    except (np.linalg.LinAlgError, FloatingPointError) as e:
+        result['message'] = (f"singular information matrix (collinear covariates?): {e}"
+                             if isinstance(e, np.linalg.LinAlgError) else str(e))
+        result['converged'] = False
+        return result
+
+    coef = beta / scale
+    se = np.sqrt(np.diag(variance)) / scale
+    crit = stats.norm.ppf(1 - alpha / 2)
+    summary = result['summary']
+    summary['coef'], summary['se'] = coef, se
+    summary['HR'] = np.exp(coef)
+    summary['HR_lower'], summary['HR_upper'] = np.exp(coef - crit * se), np.exp(coef + crit * se)
+    summary['z'] = coef / se
+    summary['p'] = 2 * stats.norm.sf(np.abs(summary['z']))
+    result['covariance'] = pd.DataFrame(variance / np.outer(scale, scale), index=names, columns=names)
+    result['loglik'] = loglik + (0.5 * n * penalizer * (beta @ beta) if penalizer > 0 else 0.0)
+    return result
+
+def baseline_cumulative_hazard(risk_sets: RiskSets, linear_predictor: np.ndarray,
+                               times: Sequence[float]) -> np.ndarray:
+    """
+    Breslow baseline cumulative hazard of every stratum at given times
+
+    Args:
+        risk_sets: Risk sets the model was fitted on
+        linear_predictor: x @ coef per sample, in the original sample order
+        times: Evaluation times
+
+    Returns:
+        strata x times array; survival of a sample is
+        exp(-H0[stratum, t] * exp(linear_predictor))
+    """
+    eta = risk_sets.sorted_values(linear_predictor)
+    shift = eta.max(initial=0.0)
+    risk, _ = risk_sets.block_sums(np.exp(eta - shift)[:, None], overwrite=True)
+    increment = risk_sets.n_deaths / risk[:, 0] * np.exp(-shift)
+    block_time = risk_sets.time[risk_sets.block_start]
+    block_code = risk_sets.codes[risk_sets.block_start]
+    n_strata = 1 if risk_sets.labels is None else len(risk_sets.labels)
+
+    times = np.asarray(times, dtype=np.float64)
+    hazard = np.zeros((n_strata, len(times)))
+    for j, t in enumerate(times):
+        hazard[:, j] = np.bincount(block_code, weights=increment * (block_time <= t),
+                                   minlength=n_strata)
+    return hazard
+
+# =============================================================================
+# Command Line
+# =============================================================================
+
+def main():
+    ap = argparse.ArgumentParser(description="Genome-wide univariate Cox screen")
+    ap.add_argument("--expr", required=True, help="expression_matrix*.csv or its .store directory")
+    ap.add_argument("--survival", required=True, help="CSV with sample_id, time and event columns")
+    ap.add_argument("--time-col", default="OS_months")
+    ap.add_argument("--event-col", default="OS_event")
+    ap.add_argument("--strata", default=None, help="Stratum column, e.g. cancer_type")
+    ap.add_argument("--standardize", action="store_true", help="HR per standard deviation")
+    ap.add_argument("--out", default="outputs/survival_analysis/univariate_cox_screen.csv")
+    ap.add_argument("--chunk-size", type=int, default=GENE_CHUNK,
+                    help="Genes read from the expression store per chunk")
+    args = ap.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "data_pipeline"))
+    from expression_store import (ExpressionStore, is_store, load_expression,
+                                  split_meta_columns, store_path_for)
+
+    surv = pd.read_csv(args.survival).dropna(subset=[args.time_col, args.event_col])
+    surv = surv.drop_duplicates('sample_id').set_index('sample_id')
+
+    # Only survival samples are read; a store is screened one gene chunk at a time
+    store_dir = store_path_for(args.expr)
+    if is_store(store_dir):
+        store = ExpressionStore(store_dir)
+        sample_ids = store.samples['sample_id'].iloc[store.sample_positions(surv.index)]
+    else:
+        expr_df = load_expression(args.expr, samples=surv.index)
+        sample_ids = expr_df['sample_id']
+    surv = surv.loc[sample_ids]
+    keep = surv[args.strata].notna().to_numpy() if args.strata else np.ones(len(surv), dtype=bool)
+    surv = surv[keep]
+    print(f"[COX] {len(surv)} samples, {int(surv[args.event_col].sum())} events")
+
+    risk_sets = RiskSets(surv[args.time_col], surv[args.event_col],
+                         surv[args.strata] if args.strata else None)
+    if is_store(store_dir):
+        chunks = store.iter_gene_chunks(args.chunk_size, samples=surv.index)
+    else:
+        expr_df = expr_df[keep]
+        chunks = [expr_df[[c for c in expr_df.columns if c not in split_meta_columns(expr_df)]]]
+    results = pd.concat([cox_screen(chunk, risk_sets=risk_sets, standardize=args.standardize)
+                         for chunk in chunks])
+
+    # FDR across the whole genome, not per chunk
+    results['q_wald'] = benjamini_hochberg(results['p_wald'].to_numpy())
+    results['q_score'] = benjamini_hochberg(results['p_score'].to_numpy())
+
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    results.to_csv(args.out)
+    print(f"[COX] {len(results)} genes, {int((results['q_wald'] < 0.05).sum())} with FDR < 0.05")
+    print(f"[SAVED] {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Cox Model Internal Validation
+Bootstrap optimism-corrected C-index and cross-validated time-dependent AUC/Brier
+
+Bootstrap (Harrell): each replicate refits the model on a resample and
+scores it on the resample (apparent) and on the original data (test); the
+mean difference is the optimism subtracted from the full-data C-index.
+
+Cross-validation: the model is fitted on k-1 folds and the held-out fold
+is scored with Harrell's C, the cumulative/dynamic AUC(t) (Uno's IPCW
+estimator) and the IPCW Brier score BS(t), with censoring weights from the
+Kaplan-Meier estimate of the training fold's censoring distribution.
+
+The data are sorted into risk sets once per worker; resamples and training
+folds are RiskSets.take views of that order, and every refit starts from
+the full-data coefficients. Replicates and folds are spread over a process
+pool.
+
+Usage:
+    validation = validate_cox(cox_data, 'OS_months', 'OS_event', covariates,
+                              strata_col='cancer_type', penalizer=0.01,
+                              times=[12, 36, 60])
+
+Author: Automated Pipeline
+Date: 2025-11-02
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from cox_engine import RiskSets, baseline_cumulative_hazard, fit_cox
+from survival_stats import kaplan_meier
+
+# =============================================================================
+# Configuration
+# =============================================================================
+
+N_BOOTSTRAP = 200
+N_FOLDS = 5
+PENALIZER = 0.01
+
+# =============================================================================
+# Discrimination and Calibration Metrics
+# =============================================================================
+
+def _count_preceding_smaller(group: np.ndarray, rank: np.ndarray) -> np.ndarray:
+    """
+    For every element, the number of earlier elements of its group with a smaller rank
+
+    Bitwise divide and conquer: at level b, elements sharing rank >> (b + 1)
+    differ first at bit b, and each element with that bit set counts the
+    earlier elements of its bucket with the bit clear.
+    """
+    counts = np.zeros(len(rank), dtype=np.int64)
+    if len(rank) == 0:
+        return counts
+    top = int(rank.max())
+    for b in range(top.bit_length()):
+        key = group * ((top >> (b + 1)) + 1) + (rank >> (b + 1))
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+        clear = ((rank[order] >> b) & 1) == 0
+        seen = np.cumsum(clear) - clear
+        start = np.searchsorted(key, key, side='left')
+        counts[order] += np.where(clear, 0, seen - seen[start])
+    return counts
+
+def concordance_index(time: Sequence[float], event: Sequence[int], risk: Sequence[float],
+                      strata: Optional[Sequence] = None) -> float:
+    """
+    Harrell's C-index in O(n log^2 n)
+
+    A pair is comparable when the shorter time is an event (a censored time
+    tied with an event counts as longer); it is concordant when the earlier
+    event has the higher risk, and risk ties count one half. With strata
+    only pairs within a stratum are compared.
+
+    Args:
+        time: Follow-up times
+        event: Event indicators
+        risk: Predicted risk (e.g. the linear predictor; higher = worse)
+        strata: Stratum label per sample
+
+    Returns:
+        C-index (NaN if there are no comparable pairs)
+    """
+    time = np.asarray(time, dtype=np.float64)
+    event = np.asarray(event, dtype=np.float64) > 0
+    codes = (np.zeros(len(time), dtype=np.int64) if strata is None
+             else pd.factorize(pd.Series(strata))[0])
+    rank = np.unique(np.asarray(risk, dtype=np.float64), return_inverse=True)[1].astype(np.int64)
+
+    # Stratum, time descending, censored before events: for an event, the
+    # comparable partners precede it, apart from the events tied with it
+    order = np.lexsort((event, -time, codes))
+    time, event, codes, rank = time[order], event[order], codes[order], rank[order]
+    new_tie = np.ones(len(time), dtype=bool)
+    new_tie[1:] = (codes[1:] != codes[:-1]) | (time[1:] != time[:-1]) | (event[1:] != event[:-1])
+    tie = np.cumsum(new_tie) - 1
+
+    stratum_start = np.searchsorted(codes, codes, side='left')
+    tie_start = np.searchsorted(tie, tie, side='left')
+    comparable = (tie_start - stratum_start)[event]
+    flipped = rank.max(initial=0) - rank
+    smaller = (_count_preceding_smaller(codes, rank) - _count_preceding_smaller(tie, rank))[event]
+    larger = (_count_preceding_smaller(codes, flipped) - _count_preceding_smaller(tie, flipped))[event]
+
+    n_pairs = comparable.sum()
+    if n_pairs == 0:
+        return np.nan
+    # Concordant: the partner lived longer with a lower risk
+    return float((smaller.sum() + 0.5 * (comparable - smaller - larger).sum()) / n_pairs)
+
+def censoring_survival(time: np.ndarray, event: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Kaplan-Meier estimate of the censoring distribution as (times, G)"""
+    km = kaplan_meier(time, 1 - np.asarray(event, dtype=np.float64))
+    return km['time'].to_numpy(), km['survival'].to_numpy()
+
+def _step(grid: Tuple[np.ndarray, np.ndarray], t: np.ndarray, left: bool = False) -> np.ndarray:
+    """Right-continuous step function (or its left limit) at t"""
+    times, values = grid
+    idx = np.searchsorted(times, t, side='left' if left else 'right') - 1
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], 1.0)
+
+def cumulative_dynamic_auc(time: np.ndarray, event: np.ndarray, risk: np.ndarray,
+                           t: float, censoring: Tuple[np.ndarray, np.ndarray]) -> float:
+    """
+    Uno's IPCW estimate of AUC(t): events by t (cases) vs survivors past t (controls)
+
+    Args:
+        time, event: Test-set outcomes
+        risk: Predicted risk by time t (higher = worse)
+        t: Horizon
+        censoring: Censoring survival grid of the training set
+
+    Returns:
+        AUC(t) (NaN without cases or controls)
+    """
+    cases = (time <= t) & (event > 0)
+    controls = time > t
+    if not cases.any() or not controls.any():
+        return np.nan
+    with np.errstate(divide='ignore'):
+        weight = 1.0 / _step(censoring, time[cases])
+    if not np.all(np.isfinite(weight)):
+        return np.nan
+    control_risk = np.sort(risk[controls])
+    below = np.searchsorted(control_risk, risk[cases], side='left')
+    tied = np.searchsorted(control_risk, risk[cases], side='right') - below
+    return float((weight * (below + 0.5 * tied)).sum() / (weight.sum() * len(control_risk)))
+
+def brier_score(time: np.ndarray, event: np.ndarray, survival: np.ndarray, t: float,
+                censoring: Tuple[np.ndarray, np.ndarray]) -> float:
+    """
+    IPCW Brier score at t (Graf et al. 1999)
+
+    Args:
+        time, event: Test-set outcomes
+        survival: Predicted S(t) per test sample
+        t: Horizon
+        censoring: Censoring survival grid of the training set
+
+    Returns:
+        BS(t) (NaN when t is beyond the censoring support)
+    """
+    died = (time <= t) & (event > 0)
+    alive = time > t
+    g_t = _step(censoring, np.array([t]))[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        g_died = _step(censoring, time[died], left=True)
+        if g_t <= 0 or np.any(g_died <= 0):
+            return np.nan
+        loss = (survival[died] ** 2 / g_died).sum() + ((1 - survival[alive]) ** 2).sum() / g_t
+    return float(loss / len(time))
+
+# =============================================================================
+# Resampling Workers
+# =============================================================================
+
+def _linear_predictor(x: np.ndarray, fit: Dict) -> np.ndarray:
+    return x @ fit['summary']['coef'].to_numpy(dtype=np.float64)
+
+def _run_jobs(x: np.ndarray, names: List[str], time: np.ndarray, event: np.ndarray,
+              strata: Optional[np.ndarray], folds: np.ndarray, times: np.ndarray,
+              penalizer: float, start: np.ndarray, seed: int,
+              jobs: List[Tuple[str, int]]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Bootstrap replicates and CV folds on one shared risk-set sort
+    (module-level so it can run in a worker)
+
+    Returns:
+        (bootstrap rows, cross-validation rows)
+    """
+    covariates = pd.DataFrame(x, columns=names)
+    risk_sets = RiskSets(time, event, strata)
+    position = np.empty(len(time), dtype=np.int64)
+    position[risk_sets.order] = np.arange(len(time))
+    codes = risk_sets.codes[position]
+
+    boot_rows, cv_rows = [], []
+    for kind, index in jobs:
+        if kind == 'bootstrap':
+            rng = np.random.default_rng([seed, index])
+            rows = np.sort(rng.integers(0, len(time), len(time)))
+            fit = fit_cox(covariates, None, None, penalizer=penalizer, initial_point=start,
+                          risk_sets=risk_sets.take(rows))
+            row = {'replicate': index, 'converged': fit['converged'], 'n_iter': fit['n_iter'],
+                   'c_apparent': np.nan, 'c_test': np.nan}
+            if fit['converged']:
+                eta = _linear_predictor(x, fit)
+                sample = risk_sets.order[rows]
+                row['c_apparent'] = concordance_index(time[sample], event[sample], eta[sample],
+                                                      None if strata is None else strata[sample])
+                row['c_test'] = concordance_index(time, event, eta, strata)
+            boot_rows.append(row)
+            continue
+
+        test = folds == index
+        train_rows = np.sort(position[~test])
+        train = risk_sets.take(train_rows)
+        fit = fit_cox(covariates, None, None, penalizer=penalizer, initial_point=start,
+                      risk_sets=train)
+        base = {'fold': index, 'n_test': int(test.sum()), 'events_test': int(event[test].sum()),
+                'converged': fit['converged']}
+        if not fit['converged']:
+            cv_rows.extend({**base, 'time': t, 'c_index': np.nan, 'auc': np.nan, 'brier': np.nan}
+                           for t in times)
+            continue
+
+        eta = _linear_predictor(x, fit)
+        hazard = baseline_cumulative_hazard(train, eta, times)
+        train_samples = risk_sets.order[train_rows]
+        censoring = censoring_survival(time[train_samples], event[train_samples])
+        c_index = concordance_index(time[test], event[test], eta[test],
+                                    None if strata is None else strata[test])
+        for j, t in enumerate(times):
+            cumulative = hazard[codes[test], j] * np.exp(eta[test])
+            cv_rows.append({**base, 'time': t, 'c_index': c_index,
+                            'auc': cumulative_dynamic_auc(time[test], event[test], cumulative,
+                                                          t, censoring),
+                            'brier': brier_score(time[test], event[test], np.exp(-cumulative),
+                                                 t, censoring)})
+    return boot_rows, cv_rows
+
+# =============================================================================
+# Public API
+# =============================================================================
+
+def validate_cox(df: pd.DataFrame, duration_col: str, event_col: str, covariates: Sequence[str],
+                 strata_col: Optional[str] = None, penalizer: float = PENALIZER,
+                 n_bootstrap: int = N_BOOTSTRAP, n_folds: int = N_FOLDS,
+                 times: Optional[Sequence[float]] = None, seed: int = 42,
+                 n_workers: Optional[int] = None) -> Dict:
+    """
+    Internal validation of a (stratified) multivariate Cox model
+
+    Args:
+        df: One row per sample
+        duration_col: Survival time column
+        event_col: Event indicator column
+        covariates: Covariate columns
+        strata_col: Stratum column (separate baseline hazards), or None
+        penalizer: L2 penalizer (lifelines scale)
+        n_bootstrap: Bootstrap replicates for the optimism correction
+        n_folds: Cross-validation folds (event-balanced)
+        times: Horizons for AUC(t) and BS(t) (default: event-time quartiles)
+        seed: Random seed
+        n_workers: Worker processes (None = all cores, 1 = in-process)
+
+    Returns:
+        Dict with c_index (apparent), optimism, c_index_corrected,
+        n_bootstrap (converged replicates), bootstrap (one row per
+        replicate), cv (one row per fold and time) and cv_summary (mean and
+        SD over folds of c_index, auc and brier per time)
+    """
+    covariates = list(covariates)
+    columns = covariates + [duration_col, event_col] + ([strata_col] if strata_col else [])
+    df = df.dropna(subset=columns)
+    x = df[covariates].to_numpy(dtype=np.float64)
+    time = df[duration_col].to_numpy(dtype=np.float64)
+    event = df[event_col].to_numpy(dtype=np.float64)
+    strata = df[strata_col].to_numpy(dtype=object) if strata_col else None
+    if times is None:
+        times = np.quantile(time[event > 0], [0.25, 0.5, 0.75])
+    times = np.asarray(times, dtype=np.float64)
+
+    full = fit_cox(df[covariates], time, event, strata=strata, penalizer=penalizer)
+    if not full['converged']:
+        raise ValueError(f"Full-data Cox fit failed: {full['message']}")
+    start = full['summary']['coef'].to_numpy(dtype=np.float64)
+    apparent = concordance_index(time, event, x @ start, strata)
+
+    # Event-balanced folds: deal shuffled events and censored samples round-robin
+    rng = np.random.default_rng(seed)
+    folds = np.empty(len(time), dtype=np.int64)
+    for is_event in (True, False):
+        members = rng.permutation(np.flatnonzero((event > 0) == is_event))
+        folds[members] = np.arange(len(members)) % n_folds
+
+    jobs = [('fold', k) for k in range(n_folds)] + [('bootstrap', b) for b in range(n_bootstrap)]
+    n_workers = min(n_workers or os.cpu_count() or 1, max(len(jobs), 1))
+    shared = (x, covariates, time, event, strata, folds, times, penalizer, start, seed)
+    print(f"  [VALIDATE] {n_bootstrap} bootstrap replicates + {n_folds} folds "
+          f"on {n_workers} worker(s)")
+    if n_workers <= 1:
+        outcomes = [_run_jobs(*shared, jobs)]
+    else:
+        # Round-robin chunks: each worker sorts once and keeps its share of jobs
+        chunks = [jobs[i::n_workers] for i in range(n_workers)]
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            outcomes = list(executor.map(_run_jobs, *[[arg] * n_workers for arg in shared], chunks))
+
+    bootstrap = pd.DataFrame([row for boot_rows, _ in outcomes for row in boot_rows],
+                             columns=['replicate', 'converged', 'n_iter', 'c_apparent', 'c_test'])
+    bootstrap = bootstrap.sort_values('replicate').reset_index(drop=True)
+    bootstrap['optimism'] = bootstrap['c_apparent'] - bootstrap['c_test']
+    cv = pd.DataFrame([row for _, cv_rows in outcomes for row in cv_rows],
+                      columns=['fold', 'time', 'n_test', 'events_test', 'converged',
+                               'c_index', 'auc', 'brier'])
+    cv = cv.sort_values(['fold', 'time']).reset_index(drop=True)
+    cv_summary = cv.groupby('time')[['c_index', 'auc', 'brier']].agg(['mean', 'std'])
+    cv_summary.columns = [f'{metric}_{stat}' for metric, stat in cv_summary.columns]
+
+    optimism = float(bootstrap['optimism'].mean()) if bootstrap['optimism'].notna().any() else np.nan
+    return {
+        'c_index': apparent,
+        'optimism': optimism,
+        'c_index_corrected': apparent - optimism,
+        'n_bootstrap': int(bootstrap['optimism'].notna().sum()),
+        'bootstrap': bootstrap,
+        'cv': cv,
+        'cv_summary': cv_summary.reset_index(),
+    }
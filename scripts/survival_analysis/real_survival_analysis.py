@@ -5,11 +5,16 @@ Using actual TCGA clinical data
 """
 import pandas as pd
 import numpy as np
+import sys
 from pathlib import Path
 import matplotlib.pyplot as plt
 import seaborn as sns
 from lifelines import KaplanMeierFitter, CoxPHFitter
-from lifelines.statistics import multivariate_logrank_test
+from cox_engine import cox_screen
+from survival_stats import logrank_test, scan_genes
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "data_pipeline"))
+from expression_store import load_expression
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -19,7 +24,7 @@ def load_expression_data():
     if not expr_file.exists():
         raise FileNotFoundError("Expression matrix not found")
 
-    df = pd.read_csv(expr_file)
+    df = load_expression(expr_file)
     print(f"Loaded expression data: {df.shape[0]} samples")
     return df
 
@@ -106,12 +111,7 @@ def kaplan_meier_analysis(surv_df, output_dir):
     ax.grid(True, alpha=0.3)
 
     # Log-rank test
-    results = multivariate_logrank_test(
-        surv_df['time'],
-        surv_df['CD274_high'],
-        surv_df['event']
-    )
-    p_val = results.p_value
+    _, p_val = logrank_test(surv_df['time'], surv_df['event'], surv_df['CD274_high'])
     ax.text(0.05, 0.05, f'Log-rank P = {p_val:.4f}',
             transform=ax.transAxes, fontsize=10,
             bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
@@ -128,12 +128,7 @@ def kaplan_meier_analysis(surv_df, output_dir):
     ax.legend(loc='best')
     ax.grid(True, alpha=0.3)
 
-    results = multivariate_logrank_test(
-        surv_df['time'],
-        surv_df['SQSTM1_high'],
-        surv_df['event']
-    )
-    p_val = results.p_value
+    _, p_val = logrank_test(surv_df['time'], surv_df['event'], surv_df['SQSTM1_high'])
     ax.text(0.05, 0.05, f'Log-rank P = {p_val:.4f}',
             transform=ax.transAxes, fontsize=10,
             bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
@@ -163,35 +158,17 @@ def kaplan_meier_analysis(surv_df, output_dir):
     # 4. Hazard Ratios visualization (preview of Cox regression)
     ax = axes[1, 1]
 
-    # Quick Cox regression for each gene
+    # Univariate Cox for each gene (z-scored), fitted in one batch
     genes = ['CD274', 'SQSTM1', 'STUB1', 'CMTM6', 'HIP1R']
-    hrs = []
-    ci_lower = []
-    ci_upper = []
-
-    from lifelines import CoxPHFitter
-    for gene in genes:
-        # Normalize to z-score
-        z_score = (surv_df[gene] - surv_df[gene].mean()) / surv_df[gene].std()
-        temp_df = pd.DataFrame({
-            'time': surv_df['time'],
-            'event': surv_df['event'],
-            'gene_z': z_score
-        })
-
-        cph_temp = CoxPHFitter()
-        try:
-            cph_temp.fit(temp_df, duration_col='time', event_col='event')
-            hr = float(cph_temp.summary.loc['gene_z', 'exp(coef)'])
-            ci_l = float(cph_temp.summary.loc['gene_z', 'exp(coef) lower 95%'])
-            ci_u = float(cph_temp.summary.loc['gene_z', 'exp(coef) upper 95%'])
-            hrs.append(hr)
-            ci_lower.append(ci_l)
-            ci_upper.append(ci_u)
-        except:
-            hrs.append(1.0)
-            ci_lower.append(0.8)
-            ci_upper.append(1.2)
+    screen = cox_screen(surv_df[genes], surv_df['time'], surv_df['event'], standardize=True)
+    hrs = screen['HR'].tolist()
+    ci_lower = screen['HR_lower'].tolist()
+    ci_upper = screen['HR_upper'].tolist()
+    screen.to_csv(output_dir / "univariate_cox_screen.csv")
+
+    # Maximally selected log-rank cutpoint per gene (maxstat-adjusted P)
+    cutpoints = scan_genes(surv_df[genes], surv_df['time'], surv_df['event'])
+    cutpoints.drop(columns='group').to_csv(output_dir / "optimal_cutpoints.csv", index=False)
 
     # Forest plot style
     y_pos = np.arange(len(genes))
@@ -320,6 +297,8 @@ def main():
     print(f"\nOutputs saved to: {output_dir}")
     print("\nGenerated files:")
     print("  - kaplan_meier_curves.png")
+    print("  - univariate_cox_screen.csv")
+    print("  - optimal_cutpoints.csv")
     print("  - cox_regression_results.csv")
     print("  - cox_regression_forest_plot.png")
     print("  - survival_summary.json")
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Stratified Survival Runner
+Pooled stratified Cox model plus per-stratum fits across a process pool
+
+The pooled model (one baseline hazard per stratum, shared coefficients) is
+fitted first; every per-stratum model then starts from the pooled
+coefficients, which are usually close to its own optimum. Per-stratum fits
+are independent, so they run in a process pool, largest stratum first; with
+enough workers all strata finish in about the time of the slowest one.
+
+Nothing raises out of a stratum: skipped strata (too few samples/events),
+non-convergence, singular information matrices and worker crashes all come
+back as rows of a diagnostics table.
+
+Usage:
+    pooled, coefs, diagnostics = run_stratified_cox(cox_data, 'OS_months', 'OS_event',
+                                                    'cancer_type', covariates, penalizer=0.01)
+
+Author: Automated Pipeline
+Date: 2025-11-02
+"""
+
+import os
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from cox_engine import fit_cox
+
+# =============================================================================
+# Configuration
+# =============================================================================
+
+MIN_SAMPLES = 50
+MIN_EVENTS = 20
+PENALIZER = 0.01
+
+# =============================================================================
+# Per-Stratum Fits
+# =============================================================================
+
+def _fit_stratum(stratum, covariates: pd.DataFrame, time_values: np.ndarray,
+                 event_values: np.ndarray, penalizer: float,
+                 initial_point: Optional[np.ndarray]) -> Tuple[Dict, Optional[pd.DataFrame]]:
+    """
+    Fit one stratum (module-level so it can run in a worker)
+
+    Returns:
+        (diagnostics row, coefficient summary or None if the fit failed)
+    """
+    start = time.time()
+    fit = fit_cox(covariates, time_values, event_values, penalizer=penalizer,
+                  initial_point=initial_point)
+    status = 'ok' if fit['converged'] else 'failed'
+    diagnostics = {
+        'stratum': stratum,
+        'status': status,
+        'n_samples': fit['n_samples'],
+        'n_events': fit['n_events'],
+        'converged': fit['converged'],
+        'n_iter': fit['n_iter'],
+        'loglik': fit['loglik'],
+        'loglik_null': fit['loglik_null'],
+        'seconds': time.time() - start,
+        'message': fit['message'],
+    }
+    return diagnostics, (fit['summary'] if fit['converged'] else None)
+
+def _unfitted(stratum, status: str, n_samples: int, n_events: int, message: str) -> Dict:
+    """Diagnostics row of a stratum that produced no fit"""
+    return {'stratum': stratum, 'status': status, 'n_samples': n_samples, 'n_events': n_events,
+            'converged': False, 'n_iter': 0, 'loglik': np.nan, 'loglik_null': np.nan,
+            'seconds': 0.0, 'message': message}
+
+# =============================================================================
+# Public API
+# =============================================================================
+
+def run_stratified_cox(df: pd.DataFrame, duration_col: str, event_col: str, strata_col: str,
+                       covariates: Sequence[str], penalizer: float = PENALIZER,
+                       initial_point: Optional[pd.Series] = None,
+                       min_samples: int = MIN_SAMPLES, min_events: int = MIN_EVENTS,
+                       n_workers: Optional[int] = None
+                       ) -> Tuple[Dict, pd.DataFrame, pd.DataFrame]:
+    """
+    Pooled stratified Cox model and warm-started per-stratum models
+
+    Args:
+        df: One row per sample
+        duration_col: Survival time column
+        event_col: Event indicator column
+        strata_col: Stratum column (e.g. cancer_type)
+        covariates: Covariate columns
+        penalizer: L2 penalizer (lifelines scale)
+        initial_point: Pooled coefficients indexed by covariate (e.g. an
+            existing CoxPHFitter params_); fitted here if None
+        min_samples: Smaller strata are skipped
+        min_events: Strata with fewer events are skipped
+        n_workers: Worker processes (None = all cores, 1 = in-process)
+
+    Returns:
+        (pooled, coefficients, diagnostics) - the pooled fit_cox result (None
+        if initial_point was given), one row per stratum and covariate
+        (stratum, covariate, coef, se, HR, HR_lower, HR_upper, z, p,
+        n_samples, n_events), and one row per stratum (status, converged,
+        n_iter, loglik, seconds, message)
+    """
+    covariates = list(covariates)
+    df = df.dropna(subset=covariates + [duration_col, event_col, strata_col])
+
+    pooled = None
+    if initial_point is None:
+        pooled = fit_cox(df[covariates], df[duration_col], df[event_col],
+                         strata=df[strata_col].to_numpy(), penalizer=penalizer)
+        initial_point = pooled['summary']['coef'] if pooled['converged'] else None
+        if pooled['converged']:
+            print(f"  [POOLED] converged in {pooled['n_iter']} iterations")
+        else:
+            print(f"  [POOLED] {pooled['message']} - per-stratum fits start from zero")
+    start_point = None if initial_point is None else \
+        pd.Series(initial_point).reindex(covariates).fillna(0.0).to_numpy(dtype=np.float64)
+
+    diagnostics, tasks = [], []
+    for stratum, group in df.groupby(strata_col, sort=False):
+        n_events = int(group[event_col].sum())
+        if len(group) < min_samples or n_events < min_events:
+            diagnostics.append(_unfitted(stratum, 'skipped', len(group), n_events,
+                                         f"n={len(group)}, events={n_events} below minimum"))
+            continue
+        tasks.append((stratum, group[covariates], group[duration_col].to_numpy(dtype=np.float64),
+                      group[event_col].to_numpy(dtype=np.float64), penalizer, start_point))
+    # Largest first: the slowest fit starts immediately
+    tasks.sort(key=lambda task: -len(task[2]))
+
+    n_workers = min(n_workers or os.cpu_count() or 1, max(len(tasks), 1))
+    summaries = {}
+    if n_workers <= 1:
+        outcomes = [(task[0], _fit_stratum(*task)) for task in tasks]
+    else:
+        outcomes = []
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = {executor.submit(_fit_stratum, *task): task for task in tasks}
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    outcomes.append((task[0], future.result()))
+                except Exception as e:
+                    # A crashed worker fails its stratum, not the run
+                    row = _unfitted(task[0], 'failed', len(task[2]), int(task[3].sum()),
+                                    f"worker error: {e!r}")
+                    outcomes.append((task[0], (row, None)))
+
+    for stratum, (row, summary) in outcomes:
+        diagnostics.append(row)
+        if summary is not None:
+            summaries[stratum] = summary
+
+    diagnostics = pd.DataFrame(diagnostics, columns=list(_unfitted(None, '', 0, 0, '')))
+    order = {s: i for i, s in enumerate(df[strata_col].drop_duplicates())}
+    diagnostics = diagnostics.sort_values('stratum', key=lambda s: s.map(order)).reset_index(drop=True)
+
+    rows: List[pd.DataFrame] = []
+    for row in diagnostics.itertuples(index=False):
+        if row.stratum in summaries:
+            table = summaries[row.stratum].reset_index()
+            table.insert(0, 'stratum', row.stratum)
+            table['n_samples'], table['n_events'] = row.n_samples, row.n_events
+            rows.append(table)
+    columns = ['stratum', 'covariate', 'coef', 'se', 'HR', 'HR_lower', 'HR_upper', 'z', 'p',
+               'n_samples', 'n_events']
+    coefficients = pd.concat(rows, ignore_index=True) if rows else pd.DataFrame(columns=columns)
+    return pooled, coefficients[columns], diagnostics
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Survival Statistics Engine
+Kaplan-Meier curves, log-rank tests and optimal-cutpoint scans from counts
+
+Everything is computed from at-risk and event counts on the grid of
+distinct event times. For a cutpoint scan the samples are bucketed once by
+expression (between consecutive candidate cutpoints) and by follow-up; the
+high-group at-risk and event counts of every cutpoint then follow from
+cumulative sums over those buckets, and the log-rank statistic of all
+cutpoints is one array expression instead of one test per split.
+
+The maximally selected statistic is corrected for the search with the
+Lausen, Sauerbrei & Schumacher (1994) improved Bonferroni bound, as in R's
+maxstat (or the asymptotic Miller & Siegmund / Lausen & Schumacher 1992
+formula).
+
+Usage:
+    km = kaplan_meier(time, event)
+    chi2, p = logrank_test(time, event, expr >= np.median(expr))
+    best = cutpoint_scan(expr, time, event, min_fraction=0.1)
+
+Author: Automated Pipeline
+Date: 2025-11-02
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from typing import Dict, Optional, Sequence, Tuple
+
+# =============================================================================
+# Configuration
+# =============================================================================
+
+MIN_FRACTION = 0.1        # Smallest group allowed by a cutpoint (each side)
+CUTPOINT_BLOCK = 256      # Cutpoints evaluated together (bounds block x event-times arrays)
+PVALUE_METHODS = ('lausen94', 'miller_siegmund')
+
+# =============================================================================
+# Event-Time Grid
+# =============================================================================
+
+def _clean(time: Sequence[float], event: Sequence[int], *others) -> Tuple[np.ndarray, ...]:
+    """Float arrays restricted to rows without missing values"""
+    arrays = [np.asarray(time, dtype=np.float64), np.asarray(event, dtype=np.float64)]
+    arrays += [np.asarray(o, dtype=np.float64) for o in others]
+    keep = np.ones(len(arrays[0]), dtype=bool)
+    for a in arrays:
+        keep &= ~np.isnan(a)
+    return tuple(a[keep] for a in arrays)
+
+def event_grid(time: np.ndarray, event: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Distinct event times and each sample's position on them
+
+    Returns:
+        (event_times, at_risk_until, event_bin) - a sample is at risk at
+        event-time bins 0..at_risk_until-1; event_bin is its death bin
+        (meaningful for events only)
+    """
+    event_times = np.unique(time[event > 0])
+    at_risk_until = np.searchsorted(event_times, time, side='right')
+    event_bin = np.searchsorted(event_times, time, side='left')
+    return event_times, at_risk_until, event_bin
+
+def _risk_counts(at_risk_until: np.ndarray, event_bin: np.ndarray, event: np.ndarray,
+                 n_bins: int) -> Tuple[np.ndarray, np.ndarray]:
+    """At-risk and event counts on the event-time grid"""
+    starts = np.bincount(at_risk_until, minlength=n_bins + 1)
+    n_at_risk = starts[::-1].cumsum()[::-1][1:]
+    n_events = np.bincount(event_bin[event > 0], minlength=n_bins)[:n_bins]
+    return n_at_risk.astype(np.float64), n_events.astype(np.float64)
+
+# =============================================================================
+# Kaplan-Meier and Log-Rank
+# =============================================================================
+
+def kaplan_meier(time: Sequence[float], event: Sequence[int], alpha: float = 0.05) -> pd.DataFrame:
+    """
+    Kaplan-Meier estimate with Greenwood variance and log-log CI
+
+    Args:
+        time: Follow-up times
+        event: Event indicators
+        alpha: CI level
+
+    Returns:
+        DataFrame with one row per distinct event time: time, n_at_risk,
+        n_events, survival, ci_lower, ci_upper
+    """
+    time, event = _clean(time, event)
+    event_times, until, death_bin = event_grid(time, event)
+    n, d = _risk_counts(until, death_bin, event, len(event_times))
+    return _km_table(event_times, n, d, alpha)
+
+def _km_table(event_times: np.ndarray, n: np.ndarray, d: np.ndarray, alpha: float) -> pd.DataFrame:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        surv = np.cumprod(np.where(n > 0, 1 - d / n, 1.0))
+        greenwood = np.cumsum(np.where(n > d, d / (n * (n - d)), 0.0))
+        # log(-log S) interval (lifelines' default)
+        crit = stats.norm.ppf(1 - alpha / 2)
+        log_log = np.log(-np.log(surv))
+        half = crit * np.sqrt(greenwood) / np.abs(np.log(surv))
+    return pd.DataFrame({
+        'time': event_times,
+        'n_at_risk': n.astype(np.int64),
+        'n_events': d.astype(np.int64),
+        'survival': surv,
+        'ci_lower': np.exp(-np.exp(log_log + half)),
+        'ci_upper': np.exp(-np.exp(log_log - half)),
+    })
+
+def _logrank(n: np.ndarray, d: np.ndarray, n1: np.ndarray, d1: np.ndarray
+             ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Two-group log-rank score and variance (last axis = event-time bins)
+
+    Returns:
+        (U, V) - observed minus expected events of group 1, and its variance
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = n1 / n
+        expected = d * share
+        variance = np.where(n > 1, expected * (1 - share) * (n - d) / (n - 1), 0.0)
+    return (d1 - expected).sum(axis=-1), variance.sum(axis=-1)
+
+def logrank_test(time: Sequence[float], event: Sequence[int],
+                 group: Sequence[bool]) -> Tuple[float, float]:
+    """
+    Two-group log-rank test
+
+    Args:
+        time: Follow-up times
+        event: Event indicators
+        group: Group membership (truthy = group 1)
+
+    Returns:
+        (chi2 statistic, p-value) on 1 degree of freedom
+    """
+    time, event, group = _clean(time, event, np.asarray(group, dtype=np.float64))
+    event_times, until, death_bin = event_grid(time, event)
+    n, d = _risk_counts(until, death_bin, event, len(event_times))
+    in_group = group > 0
+    n1, d1 = _risk_counts(until[in_group], death_bin[in_group], event[in_group], len(event_times))
+    u, v = _logrank(n, d, n1, d1)
+    chi2 = float(u * u / v) if v > 0 else np.nan
+    return chi2, float(stats.chi2.sf(chi2, 1)) if v > 0 else np.nan
+
+# =============================================================================
+# Cutpoint Scan
+# =============================================================================
+
+def maxstat_pvalue(statistic: float, fractions: np.ndarray, method: str = 'lausen94') -> float:
+    """
+    P-value of a maximally selected standardized log-rank statistic
+
+    Args:
+        statistic: max |Z| over the scanned cutpoints
+        fractions: Fraction of samples at or below each scanned cutpoint
+        method: 'lausen94' (improved Bonferroni over the actual cutpoints)
+            or 'miller_siegmund' (asymptotic, uses the fraction range only)
+
+    Returns:
+        Adjusted p-value (clipped to [0, 1])
+    """
+    if method not in PVALUE_METHODS:
+        raise ValueError(f"Unknown method: {method} (expected one of {PVALUE_METHODS})")
+    if not np.isfinite(statistic) or len(fractions) == 0:
+        return np.nan
+    b = statistic
+    if method == 'miller_siegmund':
+        lo, hi = fractions.min(), fractions.max()
+        if lo >= hi:
+            return float(min(1.0, 2 * stats.norm.sf(b)))
+        density = stats.norm.pdf(b)
+        p = density * (b - 1 / b) * np.log(hi * (1 - lo) / ((1 - hi) * lo)) + 4 * density / b
+        return float(np.clip(p, 0.0, 1.0))
+
+    eps = np.sort(fractions)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.sqrt(1 - eps[:-1] * (1 - eps[1:]) / ((1 - eps[:-1]) * eps[1:]))
+    t = np.nan_to_num(t)
+    bound = np.exp(-b * b / 2) / np.pi * (t - (b * b / 4 - 1) * t ** 3 / 6)
+    return float(np.clip(2 * stats.norm.sf(b) + bound.sum(), 0.0, 1.0))
+
+def candidate_cutpoints(values: np.ndarray, min_fraction: float = MIN_FRACTION,
+                        max_cutpoints: Optional[int] = None) -> np.ndarray:
+    """
+    Distinct values that leave at least min_fraction of samples on each side
+
+    A sample is 'high' for cutpoint c when its value is > c. With
+    max_cutpoints, candidates are thinned to evenly spaced quantiles.
+    """
+    values = np.sort(values)
+    n = len(values)
+    candidates = np.unique(values)[:-1]
+    below = np.searchsorted(values, candidates, side='right')
+    keep = (below >= np.ceil(min_fraction * n)) & (n - below >= np.ceil(min_fraction * n))
+    candidates = candidates[keep]
+    if max_cutpoints is not None and len(candidates) > max_cutpoints:
+        picks = np.unique(np.round(np.linspace(0, len(candidates) - 1, max_cutpoints)).astype(np.int64))
+        candidates = candidates[picks]
+    return candidates
+
+def logrank_scan(values: Sequence[float], time: Sequence[float], event: Sequence[int],
+                 cutpoints: Optional[np.ndarray] = None, min_fraction: float = MIN_FRACTION,
+                 block: int = CUTPOINT_BLOCK) -> pd.DataFrame:
+    """
+    Log-rank statistic of the high vs low split at every candidate cutpoint
+
+    Args:
+        values: Expression (or any continuous marker) per sample
+        time: Follow-up times
+        event: Event indicators
+        cutpoints: Cutpoints to evaluate (default: candidate_cutpoints)
+        min_fraction: Minimum group fraction for the default candidates
+        block: Cutpoints evaluated per array block
+
+    Returns:
+        DataFrame with one row per cutpoint: cutpoint, n_high, fraction_low,
+        observed_high, expected_high, z, chi2, p
+    """
+    time, event, values = _clean(time, event, values)
+    if cutpoints is None:
+        cutpoints = candidate_cutpoints(values, min_fraction)
+    cutpoints = np.sort(np.asarray(cutpoints, dtype=np.float64))
+
+    event_times, until, death_bin = event_grid(time, event)
+    n_bins = len(event_times)
+    n, d = _risk_counts(until, death_bin, event, n_bins)
+
+    # Sample j is high for cutpoints 0..m_j-1 (those below its value)
+    m = np.searchsorted(cutpoints, values, side='left')
+    is_event = event > 0
+    n_cut = len(cutpoints)
+    u = np.empty(n_cut)
+    v = np.empty(n_cut)
+    n_high = np.empty(n_cut)
+    observed = np.empty(n_cut)
+
+    # Blocks run from the highest cutpoint down; 'carry' holds the counts of
+    # samples above the current block (high for every cutpoint in it)
+    carry_n = np.zeros(n_bins)
+    carry_d = np.zeros(n_bins)
+    carry_size = 0.0
+    for hi in range(n_cut, 0, -block):
+        lo = max(hi - block, 0)
+        # Samples with m in lo+1..hi join the high group between cutpoints lo..hi-1
+        rows = (m > lo) & (m <= hi)
+        offset = m[rows] - (lo + 1)
+        starts = np.bincount(offset * (n_bins + 1) + until[rows],
+                             minlength=(hi - lo) * (n_bins + 1)).reshape(hi - lo, n_bins + 1)
+        at_risk = starts[:, ::-1].cumsum(axis=1)[:, ::-1][:, 1:]
+        ev = rows & is_event
+        deaths = np.bincount((m[ev] - (lo + 1)) * n_bins + death_bin[ev],
+                             minlength=(hi - lo) * n_bins).reshape(hi - lo, n_bins)
+        sizes = starts.sum(axis=1)
+
+        # Cutpoint lo + i: high = carry + rows with offset >= i
+        n1 = carry_n + at_risk[::-1].cumsum(axis=0)[::-1]
+        d1 = carry_d + deaths[::-1].cumsum(axis=0)[::-1]
+        u[lo:hi], v[lo:hi] = _logrank(n, d, n1, d1)
+        n_high[lo:hi] = carry_size + sizes[::-1].cumsum()[::-1]
+        observed[lo:hi] = d1.sum(axis=1)
+
+        carry_n, carry_d, carry_size = n1[0], d1[0], n_high[lo]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(v > 0, u / np.sqrt(v), np.nan)
+    return pd.DataFrame({
+        'cutpoint': cutpoints,
+        'n_high': n_high.astype(np.int64),
+        'fraction_low': 1 - n_high / len(values) if len(values) else np.nan,
+        'observed_high': observed,
+        'expected_high': observed - u,
+        'z': z,
+        'chi2': z * z,
+        'p': stats.chi2.sf(z * z, 1),
+    })
+
+def cutpoint_scan(values: Sequence[float], time: Sequence[float], event: Sequence[int],
+                  min_fraction: float = MIN_FRACTION, max_cutpoints: Optional[int] = None,
+                  method: str = 'lausen94', alpha: float = 0.05) -> Dict:
+    """
+    Optimal (maximally selected log-rank) cutpoint with adjusted p-value
+
+    Args:
+        values: Expression per sample
+        time: Follow-up times
+        event: Event indicators
+        min_fraction: Minimum fraction of samples in each group
+        max_cutpoints: Thin candidates to this many quantiles (None = all)
+        method: maxstat p-value correction (see maxstat_pvalue)
+        alpha: CI level of the KM curves
+
+    Returns:
+        Dict with cutpoint, n_samples, n_high, n_low, z (positive = high
+        group has more events than expected), chi2, p (unadjusted), p_adjusted,
+        n_cutpoints, the full scan table, and KM tables for the low and high
+        groups at the best cutpoint (None values if no cutpoint qualifies)
+    """
+    t, e, x = _clean(time, event, values)
+    cutpoints = candidate_cutpoints(x, min_fraction, max_cutpoints)
+    scan = logrank_scan(x, t, e, cutpoints)
+    result = {'cutpoint': np.nan, 'n_samples': len(x), 'n_high': 0, 'n_low': 0, 'z': np.nan,
+              'chi2': np.nan, 'p': np.nan, 'p_adjusted': np.nan, 'n_cutpoints': len(scan),
+              'scan': scan, 'km_low': None, 'km_high': None}
+    if scan['chi2'].notna().sum() == 0:
+        return result
+
+    best = scan.loc[scan['chi2'].idxmax()]
+    result.update({
+        'cutpoint': float(best['cutpoint']),
+        'n_high': int(best['n_high']),
+        'n_low': len(x) - int(best['n_high']),
+        'z': float(best['z']),
+        'chi2': float(best['chi2']),
+        'p': float(best['p']),
+        'p_adjusted': maxstat_pvalue(abs(float(best['z'])), scan['fraction_low'].to_numpy(), method),
+    })
+    high = x > best['cutpoint']
+    result['km_low'] = kaplan_meier(t[~high], e[~high], alpha)
+    result['km_high'] = kaplan_meier(t[high], e[high], alpha)
+    return result
+
+def scan_genes(expr_df: pd.DataFrame, time: Sequence[float], event: Sequence[int],
+               groups: Optional[Sequence] = None, min_fraction: float = MIN_FRACTION,
+               max_cutpoints: Optional[int] = None, method: str = 'lausen94') -> pd.DataFrame:
+    """
+    Best cutpoint of every gene, optionally within every group (cancer type)
+
+    Args:
+        expr_df: Samples x genes expression (rows aligned with time/event)
+        time: Follow-up times
+        event: Event indicators
+        groups: Group label per sample (None = one group)
+        min_fraction: Minimum fraction of samples in each group
+        max_cutpoints: Thin candidates to this many quantiles (None = all)
+        method: maxstat p-value correction
+
+    Returns:
+        DataFrame with group, gene, cutpoint, n_samples, n_high, n_low, z,
+        chi2, p, p_adjusted, n_cutpoints
+    """
+    time = np.asarray(time, dtype=np.float64)
+    event = np.asarray(event, dtype=np.float64)
+    labels = pd.Series(np.zeros(len(expr_df), dtype=np.int64) if groups is None
+                       else np.asarray(groups, dtype=object))
+    keys = ['cutpoint', 'n_samples', 'n_high', 'n_low', 'z', 'chi2', 'p', 'p_adjusted', 'n_cutpoints']
+
+    rows = []
+    for label, positions in labels.groupby(labels, sort=False).indices.items():
+        for gene in expr_df.columns:
+            result = cutpoint_scan(expr_df[gene].to_numpy(dtype=np.float64)[positions],
+                                   time[positions], event[positions],
+                                   min_fraction, max_cutpoints, method)
+            rows.append({'group': None if groups is None else label, 'gene': gene,
+                         **{k: result[k] for k in keys}})
+    return pd.DataFrame(rows, columns=['group', 'gene'] + keys)
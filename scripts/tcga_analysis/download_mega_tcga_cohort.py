@@ -5,9 +5,9 @@ Download Mega TCGA Cohort (n=1000+)
 Automated download of large-scale TCGA expression data for Nature-level analysis
 
 Features:
-- Parallel downloads (10 concurrent threads)
+- Parallel downloads (10 concurrent transfers, throttled on 429/5xx)
 - Progress tracking
-- Auto-retry on failure
+- Auto-retry on failure, resume of interrupted files, md5 verification
 - Support for multiple cancer types
 
 Target cohorts:
@@ -20,13 +20,16 @@ Author: Enhancement Pipeline
 Date: 2025-11-02
 """
 
-import requests
+import sys
 import json
 import time
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "data_download"))
+from gdc_client import GDC_API, GDCClient
+from gdc_downloader import GDCDownloader
+
 class TCGAMegaDownloader:
     """High-performance TCGA data downloader"""
 
@@ -37,7 +40,8 @@ class TCGAMegaDownloader:
         self.max_workers = max_workers
         self.genes = ['SQSTM1', 'CD274', 'HIP1R', 'CMTM6', 'STUB1']
 
-        self.gdc_api = "https://api.gdc.cancer.gov"
+        self.gdc_api = GDC_API
+        self.client = GDCClient(self.gdc_api)
         self.stats = {
             "total": 0,
             "downloaded": 0,
@@ -58,23 +62,12 @@ class TCGAMegaDownloader:
             ]
         }
 
-        params = {
-            "filters": json.dumps(filters),
-            "fields": "file_id,file_name,file_size",
-            "format": "json",
-            "size": max_files
-        }
-
         try:
-            response = requests.post(
-                f"{self.gdc_api}/files",
-                json=params,
-                timeout=30
+            hits = self.client.query(
+                "files", filters,
+                fields=["file_id", "file_name", "file_size", "md5sum"],
+                max_results=max_files
             )
-            response.raise_for_status()
-
-            data = response.json()
-            hits = data['data']['hits']
 
             print(f"✅ Found {len(hits)} files for {project}")
             return hits
@@ -83,38 +76,6 @@ class TCGAMegaDownloader:
             print(f"❌ Query failed: {e}")
             return []
 
-    def download_file(self, file_info, retry=3):
-        """Download a single file with retry logic"""
-        file_id = file_info['file_id']
-        file_name = file_info['file_name']
-        output_path = self.output_dir / file_name
-
-        # Skip if already exists
-        if output_path.exists():
-            self.stats["skipped"] += 1
-            return {"status": "skipped", "file": file_name}
-
-        # Download with retry
-        for attempt in range(retry):
-            try:
-                response = requests.get(
-                    f"{self.gdc_api}/data/{file_id}",
-                    timeout=120
-                )
-                response.raise_for_status()
-
-                # Save file
-                output_path.write_bytes(response.content)
-
-                self.stats["downloaded"] += 1
-                return {"status": "success", "file": file_name}
-
-            except Exception as e:
-                if attempt == retry - 1:
-                    self.stats["failed"] += 1
-                    return {"status": "failed", "file": file_name, "error": str(e)}
-                time.sleep(2 ** attempt)  # Exponential backoff
-
     def download_cohort(self, project, max_files=500):
         """Download entire cohort with parallel downloads"""
         print(f"\n{'='*60}")
@@ -134,18 +95,21 @@ class TCGAMegaDownloader:
         print(f"📥 Downloading {len(files)} files ({self.max_workers} workers)...")
         start_time = time.time()
 
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = {executor.submit(self.download_file, f): f for f in files}
-
-            completed = 0
-            for future in as_completed(futures):
-                result = future.result()
-                completed += 1
-
-                if completed % 50 == 0 or completed == len(files):
-                    elapsed = time.time() - start_time
-                    rate = completed / elapsed if elapsed > 0 else 0
-                    print(f"  Progress: {completed}/{len(files)} ({rate:.1f} files/sec)")
+        completed = 0
+
+        def report(result):
+            nonlocal completed
+            completed += 1
+            if completed % 50 == 0 or completed == len(files):
+                elapsed = time.time() - start_time
+                rate = completed / elapsed if elapsed > 0 else 0
+                print(f"  Progress: {completed}/{len(files)} ({rate:.1f} files/sec)")
+
+        downloader = GDCDownloader(self.output_dir, base_url=f"{self.gdc_api}/data",
+                                   max_concurrency=self.max_workers, progress=report)
+        summary = downloader.download(files)
+        for key in ("downloaded", "failed", "skipped"):
+            self.stats[key] += summary[key]
 
         elapsed = time.time() - start_time
         print(f"\n✅ {project} download complete ({elapsed:.1f}s)")
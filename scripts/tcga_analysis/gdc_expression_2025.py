@@ -3,18 +3,19 @@
 Fetch TCGA expression data via GDC API (2025-compatible)
 Uses STAR-based FPKM from Data Release 41+
 """
+import sys
 import requests
-import json
 import pandas as pd
 import argparse
 import os
 from pathlib import Path
 
-GDC_API = "https://api.gdc.cancer.gov"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "data_download"))
+from gdc_client import GDC_API, GDCClient
 
 def query_gdc_files(project_ids, data_type="Gene Expression Quantification",
                     workflow="STAR - Counts"):
-    """Query GDC for STAR-based gene expression files"""
+    """Query GDC for STAR-based gene expression files (cached, all pages)"""
     filters = {
         "op": "and",
         "content": [
@@ -25,16 +26,9 @@ def query_gdc_files(project_ids, data_type="Gene Expression Quantification",
         ]
     }
 
-    params = {
-        "filters": json.dumps(filters),
-        "fields": "file_id,file_name,cases.project.project_id,cases.submitter_id,cases.samples.sample_type",
-        "format": "JSON",
-        "size": 10000
-    }
-
-    response = requests.post(f"{GDC_API}/files", json=params)
-    response.raise_for_status()
-    return response.json()
+    fields = ["file_id", "file_name", "cases.project.project_id", "cases.submitter_id",
+              "cases.samples.sample_type"]
+    return GDCClient(GDC_API).query("files", filters, fields=fields)
 
 def download_expression_file(file_id, output_dir):
     """Download a single file from GDC"""
@@ -85,9 +79,7 @@ def main():
     output_dir.mkdir(parents=True, exist_ok=True)
 
     print(f"[GDC] Querying files for projects: {args.projects}")
-    result = query_gdc_files(args.projects)
-
-    files = result['data']['hits']
+    files = query_gdc_files(args.projects)
     print(f"[GDC] Found {len(files)} files")
 
     # Filter for Primary Tumor samples only
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Partitioned columnar long tables (e.g. cohort/sample/gene/expr).
+
+Layout:
+    joined_long.parts/
+        meta.json                     partition column, column kinds, partitions
+        cohort=LUAD/expr.npy          numeric column
+        cohort=LUAD/sample.npy        string column as uint32 codes ...
+        cohort=LUAD/sample.json       ... plus its categories
+        cohort=LUSC/...
+
+One partition is read at a time; numeric columns are memory-mapped and
+string columns come back as pandas Categoricals.
+"""
+import json, shutil, numpy as np, pandas as pd
+from pathlib import Path
+
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+
+def read_meta(root):
+    with open(Path(root) / META_FILE) as f:
+        return json.load(f)
+
+def is_partitioned(path):
+    return (Path(path) / META_FILE).exists()
+
+def write_partitioned(df, root, partition_column):
+    """Write df as one columnar directory per distinct value of partition_column (replaces root)"""
+    root = Path(root)
+    shutil.rmtree(root, ignore_errors=True)
+    root.mkdir(parents=True)
+    columns = [c for c in df.columns if c != partition_column]
+    kinds = {c: ("numeric" if pd.api.types.is_numeric_dtype(df[c]) else "string") for c in columns}
+    partitions = []
+    for value, part in df.groupby(partition_column, sort=True, observed=True):
+        pdir = root / f"{partition_column}={value}"
+        pdir.mkdir()
+        for c in columns:
+            if kinds[c] == "numeric":
+                np.save(pdir / f"{c}.npy", part[c].to_numpy())
+            else:
+                codes, categories = pd.factorize(part[c].astype(str))
+                np.save(pdir / f"{c}.npy", codes.astype(np.uint32))
+                with open(pdir / f"{c}.json", "w") as f:
+                    json.dump(list(categories), f)
+        partitions.append({"value": str(value), "rows": len(part)})
+    with open(root / META_FILE, "w") as f:
+        json.dump({"version": FORMAT_VERSION, "partition_column": partition_column,
+                   "columns": kinds, "partitions": partitions}, f, indent=2)
+    return root
+
+def list_partitions(root):
+    return [p["value"] for p in read_meta(root)["partitions"]]
+
+def read_partition(root, value, columns=None):
+    """One partition as a DataFrame (partition column included)"""
+    meta = read_meta(root)
+    pdir = Path(root) / f"{meta['partition_column']}={value}"
+    data = {}
+    for c, kind in meta["columns"].items():
+        if columns is not None and c not in columns:
+            continue
+        values = np.load(pdir / f"{c}.npy", mmap_mode="r")
+        if kind == "string":
+            with open(pdir / f"{c}.json") as f:
+                categories = json.load(f)
+            values = pd.Categorical.from_codes(np.asarray(values, dtype=np.int64), categories)
+        data[c] = values
+    df = pd.DataFrame(data)
+    df.insert(0, meta["partition_column"], value)
+    return df
+
+def iter_partitions(root, columns=None):
+    for value in list_partitions(root):
+        yield value, read_partition(root, value, columns)
@@ -4,6 +4,7 @@ Full TCGA Cohort Analysis (n=500-1000)
 Download and analyze complete LUAD+LUSC cohorts for publication-quality results
 """
 
+import sys
 import pandas as pd
 import numpy as np
 from scipy import stats
@@ -13,6 +14,9 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "data_pipeline"))
+from expression_store import store_path_for, write_expression_store
+
 def analyze_existing_tcga_data():
     """Analyze all downloaded TCGA expression files"""
 
@@ -302,6 +306,10 @@ def main():
     expr_df.to_csv(output_dir / "expression_matrix.csv", index=False)
     print(f"[SAVED] Expression matrix: {output_dir / 'expression_matrix.csv'}")
 
+    # Columnar copy read by load_expression in the stage 2-4 scripts
+    store_dir = write_expression_store(expr_df, store_path_for(output_dir / "expression_matrix.csv"))
+    print(f"[SAVED] Expression store: {store_dir}")
+
     print("\n" + "="*60)
     print("[COMPLETE] Full TCGA cohort analysis finished!")
     print("="*60)
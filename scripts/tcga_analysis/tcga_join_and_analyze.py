@@ -1,10 +1,24 @@
 #!/usr/bin/env python3
 """
 Join Xena expression and GDC survival → KM plots & Cox PH.
+
+--expr is joined_long.csv or the cohort-partitioned joined_long.parts/
+store written by xena_tcga_expression.py; the store is read and joined one
+cohort at a time. Gene-gene correlation moments are accumulated per cohort
+and combined at the end into per-cohort correlations and heterogeneity.
+Each gene also gets the median-split log-rank P and its maximally selected
+log-rank cutpoint (maxstat-adjusted P) from one sweep over the cohort.
 """
-import argparse, os, pandas as pd, numpy as np
+import argparse, os, sys, pandas as pd, numpy as np
 import matplotlib.pyplot as plt
+from pathlib import Path
 from lifelines import KaplanMeierFitter, CoxPHFitter
+from long_table import is_partitioned, iter_partitions
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "analysis"))
+from stratified_correlation import GroupedMoments, correlation_tables
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "survival_analysis"))
+from survival_stats import cutpoint_scan, logrank_test
 
 def map_sample_to_patient(sample_id):
     parts = sample_id.split("-")
@@ -12,6 +26,25 @@ def map_sample_to_patient(sample_id):
         return "-".join(parts[:3])
     return sample_id
 
+def iter_cohorts(expr_path, clin):
+    """(cohort, expression joined with clinical) for each cohort"""
+    if is_partitioned(expr_path):
+        parts = iter_partitions(expr_path)
+    else:
+        parts = pd.read_csv(expr_path).groupby("cohort", sort=True)
+    for cohort, expr in parts:
+        expr = expr.copy()
+        expr["patient"] = expr["sample"].map(map_sample_to_patient).astype(str)
+        expr["gene"] = expr["gene"].astype(str)
+        yield cohort, expr.merge(clin[clin["cohort"] == cohort], on=["patient","cohort"], how="inner")
+
+def cohort_moments(cohort, merged, genes):
+    """Correlation moments of all gene pairs within one cohort"""
+    wide = pd.DataFrame({g: merged[merged["gene"].str.contains(g)].groupby("sample")["expr"].mean()
+                         for g in genes})
+    pairs = [(g1, g2) for i, g1 in enumerate(genes) for g2 in genes[i + 1:]]
+    return GroupedMoments.from_frame(wide, np.full(len(wide), cohort, dtype=object), pairs)
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--expr", required=True)
@@ -23,19 +56,15 @@ def main():
     os.makedirs(args.out, exist_ok=True)
     os.makedirs(args.figdir, exist_ok=True)
 
-    expr = pd.read_csv(args.expr)
-    expr["patient"] = expr["sample"].apply(map_sample_to_patient)
     clin = pd.read_csv(args.clinical)
 
-    merged = expr.merge(clin, left_on=["patient","cohort"], right_on=["patient","cohort"], how="inner")
-
-    summaries = []
-    for g in args.genes:
-        sub = merged[merged["gene"].str.contains(g)]
-        if sub.empty:
-            continue
-        for cohort, grp in sub.groupby("cohort"):
-            df = grp.copy()
+    summaries, moments = [], []
+    for cohort, merged in iter_cohorts(args.expr, clin):
+        moments.append(cohort_moments(cohort, merged, args.genes))
+        for g in args.genes:
+            df = merged[merged["gene"].str.contains(g)].copy()
+            if df.empty:
+                continue
             med = df["expr"].median()
             df["high"] = (df["expr"] >= med).astype(int)
 
@@ -58,15 +87,27 @@ def main():
             else:
                 hr, p = float("nan"), float("nan")
 
-            summaries.append({"gene":g,"cohort":cohort,"median":med,"KM_fig":km_path,"HR_expr":hr,"P_expr":p,"n":len(df)})
+            _, p_median = logrank_test(df["OS_time"], df["OS_event"], df["high"])
+            best = cutpoint_scan(df["expr"], df["OS_time"], df["OS_event"])
+
+            summaries.append({"gene":g,"cohort":cohort,"median":med,"KM_fig":km_path,"HR_expr":hr,"P_expr":p,"n":len(df),
+                              "P_logrank_median":p_median,"best_cutpoint":best["cutpoint"],
+                              "P_logrank_best":best["p"],"P_maxstat":best["p_adjusted"]})
 
+    summaries.sort(key=lambda s: args.genes.index(s["gene"]))
     outcsv = os.path.join(args.out,"summary_stats.csv")
     pd.DataFrame(summaries).to_csv(outcsv, index=False)
     with open(os.path.join(args.out,"summary.md"),"w") as f:
         f.write("# TCGA analysis summary\n\n")
         for s in summaries:
-            f.write(f"- {s['gene']} {s['cohort']}: HR={s['HR_expr']:.3g}, p={s['P_expr']:.3g}, n={s['n']}, fig={s['KM_fig']}\n")
+            f.write(f"- {s['gene']} {s['cohort']}: HR={s['HR_expr']:.3g}, p={s['P_expr']:.3g}, logrank p={s['P_logrank_median']:.3g}, best cut={s['best_cutpoint']:.3g} (maxstat p={s['P_maxstat']:.3g}), n={s['n']}, fig={s['KM_fig']}\n")
     print("Saved", outcsv)
 
+    if moments:
+        per_cohort, het = correlation_tables(GroupedMoments.concat(moments), group_name="cohort")
+        per_cohort.to_csv(os.path.join(args.out,"correlation_by_cohort.csv"), index=False)
+        het.to_csv(os.path.join(args.out,"correlation_heterogeneity.csv"), index=False)
+        print("Saved", os.path.join(args.out,"correlation_by_cohort.csv"))
+
 if __name__ == "__main__":
     main()
@@ -6,51 +6,146 @@ Refs:
 - Xena platform overview: https://xena.ucsc.edu/
 - Xena download docs: https://xena.ucsc.edu/download-data
 We default to TCGA Pan-Cancer HTSeq FPKM matrix when available.
+
+The matrix is streamed to disk (resumable) and subset row by row: the header
+picks the cohort columns once, and only matching gene rows are split, so
+memory is proportional to the output, not the pan-cancer matrix. With
+--index a gene -> byte offset index is kept next to the matrix, and repeat
+lookups seek straight to the requested rows (for .gz inputs the seek still
+decompresses up to the row, but skips all parsing and stops after the last
+one).
+
+The long-format table (cohort, sample, gene, expr) is built with array
+reshapes and written both as joined_long.csv and as a columnar store
+partitioned by cohort (joined_long.parts/, see long_table.py) that
+tcga_join_and_analyze.py reads one cohort at a time.
 """
-import argparse, os, io, gzip, requests, pandas as pd
+import argparse, os, sys, gzip, json, numpy as np, pandas as pd
+from pathlib import Path
+from long_table import write_partitioned
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "data_download"))
+from gdc_downloader import download_files
 
 DEFAULT_URL = "https://gdc-hub.s3.us-east-1.amazonaws.com/download/TCGA-PANCAN.htseq_fpkm.tsv.gz"
+DEFAULT_CACHE = "data/xena"
+
+def fetch(url, cache_dir=DEFAULT_CACHE):
+    """Stream the matrix to cache_dir (resumes partial downloads, reuses complete ones)"""
+    base, name = url.rsplit("/", 1)
+    summary = download_files([{"file_id": name, "file_name": name}], cache_dir,
+                             base_url=base, max_concurrency=1)
+    if summary["failed"]:
+        raise RuntimeError(f"Download failed: {summary['results'][0].get('error')}")
+    return Path(cache_dir) / name
+
+def open_matrix(path):
+    return gzip.open(path, "rb") if str(path).endswith(".gz") else open(path, "rb")
+
+def match(row_id, genes):
+    if "|" in row_id:
+        a,b = row_id.split("|",1)
+        return a in genes or b in genes
+    return row_id in genes
+
+def select_columns(header, cohorts):
+    """Indices (into the split header line) of the sample columns to keep"""
+    return [i for i, c in enumerate(header) if i > 0 and any(("TCGA-"+co) in c for co in cohorts)]
+
+def index_path(path):
+    return Path(str(path) + ".genes.json")
 
-def fetch(url):
-    r = requests.get(url, timeout=120)
-    r.raise_for_status()
-    return io.BytesIO(r.content)
-
-def subset_matrix(bio, cohorts, genes):
-    with gzip.open(bio, "rt", encoding="utf-8", newline="") as f:
-        df = pd.read_csv(f, sep="\t", index_col=0)
-    keep_cols = [c for c in df.columns if any(("TCGA-"+co) in c for co in cohorts)]
-    df = df[keep_cols]
-    if genes:
-        idx = df.index
-        def match(i):
-            if "|" in i:
-                a,b = i.split("|",1)
-                return a in genes or b in genes
-            return i in genes
-        sel = [i for i in idx if match(i)]
-        df = df.loc[sel]
-    return df
+def build_gene_index(path):
+    """One pass over the matrix recording the (uncompressed) byte offset of every row"""
+    st = os.stat(path)
+    offsets = {}
+    with open_matrix(path) as f:
+        offset = len(f.readline())
+        for line in f:
+            offsets[line[:line.find(b"\t")].decode()] = offset
+            offset += len(line)
+    index = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "offsets": offsets}
+    with open(index_path(path), "w") as f:
+        json.dump(index, f)
+    return index
+
+def load_gene_index(path, build=True):
+    """Gene offset index for a matrix (rebuilt if the matrix changed)"""
+    st = os.stat(path)
+    try:
+        with open(index_path(path)) as f:
+            index = json.load(f)
+        if index["size"] == st.st_size and index["mtime_ns"] == st.st_mtime_ns:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    return build_gene_index(path) if build else None
+
+def subset_matrix(path, cohorts, genes, index=None):
+    """
+    Cohort columns x gene rows of a Xena matrix, streamed from disk.
+
+    Without an index every line is scanned, but only the row ID is decoded
+    unless the row matches; with an index only the matching rows are read.
+    """
+    with open_matrix(path) as f:
+        header = f.readline().rstrip(b"\r\n").decode("utf-8").split("\t")
+        keep = select_columns(header, cohorts)
+        ids, rows = [], []
+
+        def take(line):
+            fields = line.rstrip(b"\r\n").decode("utf-8").split("\t")
+            ids.append(fields[0])
+            rows.append([fields[i] for i in keep])
+
+        if index is not None:
+            targets = [i for i in index["offsets"] if not genes or match(i, genes)]
+            for offset in sorted(index["offsets"][i] for i in targets):
+                f.seek(offset)
+                take(f.readline())
+        else:
+            wanted = (lambda i: True) if not genes else (lambda i: match(i, genes))
+            for line in f:
+                if wanted(line[:line.find(b"\t")].decode("utf-8")):
+                    take(line)
+
+    df = pd.DataFrame(rows, index=pd.Index(ids, name=header[0]), columns=[header[i] for i in keep])
+    return df.apply(pd.to_numeric, errors="coerce")
+
+def long_format(df, cohorts):
+    """Genes x samples -> (cohort, sample, gene, expr) rows, gene-major within each cohort"""
+    frames = []
+    for cohort in cohorts:
+        cols = [c for c in df.columns if ("TCGA-"+cohort) in c]
+        values = df[cols].to_numpy()
+        frames.append(pd.DataFrame({
+            "cohort": cohort,
+            "sample": np.tile(np.asarray(cols, dtype=object), len(df.index)),
+            "gene": np.repeat(df.index.to_numpy(dtype=object), len(cols)),
+            "expr": values.ravel()
+        }))
+    return pd.concat(frames, ignore_index=True)
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--url", default=DEFAULT_URL)
+    ap.add_argument("--matrix", help="Local matrix (.tsv or .tsv.gz); skips the download")
+    ap.add_argument("--cache-dir", default=DEFAULT_CACHE, help="Where the downloaded matrix is kept")
+    ap.add_argument("--index", action="store_true", help="Use/build a gene byte-offset index for repeat lookups")
     ap.add_argument("--cohorts", nargs="+", default=["LUAD","LUSC"])
     ap.add_argument("--genes", nargs="+", default=["SQSTM1","CD274","HIP1R","CMTM6","STUB1"])
     ap.add_argument("--out", default="outputs/xena")
     args = ap.parse_args()
     os.makedirs(args.out, exist_ok=True)
-    bio = fetch(args.url)
-    df = subset_matrix(bio, args.cohorts, set(args.genes))
-    long_rows = []
+    path = args.matrix or fetch(args.url, args.cache_dir)
+    index = load_gene_index(path) if args.index else None
+    df = subset_matrix(path, args.cohorts, set(args.genes), index)
     for cohort in args.cohorts:
         cols = [c for c in df.columns if ("TCGA-"+cohort) in c]
-        sub = df[cols]
-        sub.to_csv(os.path.join(args.out, f"expr_{cohort}.csv"))
-        for g in sub.index:
-            for s in cols:
-                long_rows.append({"cohort":cohort,"sample":s,"gene":g,"expr":sub.loc[g, s]})
-    pd.DataFrame(long_rows).to_csv(os.path.join(args.out, "joined_long.csv"), index=False)
+        df[cols].to_csv(os.path.join(args.out, f"expr_{cohort}.csv"))
+    long_df = long_format(df, args.cohorts)
+    long_df.to_csv(os.path.join(args.out, "joined_long.csv"), index=False)
+    write_partitioned(long_df, os.path.join(args.out, "joined_long.parts"), "cohort")
     print("Saved expression tables to", args.out)
 
 if __name__ == "__main__":